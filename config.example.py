@@ -38,6 +38,12 @@ CHOP_MODELS = [
 ]
 
 
+# Reduce embeddings to this many dimensions with a PCA projection fitted by
+# ``make reduce``.  Similar items, price regression, clustering and the vectors
+# embedded in pages all use the reduced vectors.  ``None`` keeps the full 3072.
+# ``scripts/embed_dim_benchmark.py`` helps choosing between 256, 512 and 1024.
+EMBED_DIM = None
+
 # Languages used when parsing lots.  ``chop.py`` will generate title and
 # description fields for each entry in this list.
 LANGS = ["en", "ru", "ka"]
@@ -48,6 +54,10 @@ KEEP_DAYS = 7
 # Preferred currency for price display.
 DISPLAY_CURRENCY = "USD"
 
+# Lots shown per category page.  Further pages are loaded by the browser when
+# the visitor asks for more or sorts the whole category.
+CATEGORY_PAGE_SIZE = 200
+
 # Default log verbosity. Use "DEBUG", "INFO" or "ERROR".
 LOG_LEVEL = "INFO"
 
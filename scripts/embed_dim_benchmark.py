@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Compare reduced embedding dimensions with the full vectors.
+
+For every candidate size a PCA projection is fitted like ``embed_reduce.py``
+does.  The script reports how many of the exact six nearest neighbours of a
+random sample of lots survive the reduction and the median absolute log error
+of the price regression on a held-out split, next to the same error with full
+vectors.  Use it to pick ``EMBED_DIM`` with data.
+"""
+from pathlib import Path
+import argparse
+import math
+import sys
+
+# Allow running from the repository root like the other helper scripts.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np
+
+from embed_reduce import FIT_SAMPLE, Projection
+from knn_utils import normalise, topk_cosine
+from log_utils import get_logger
+from oom_utils import prefer_oom_kill
+from price_train import _iter_lots
+from price_utils import predict_price, train_price_regression
+from similar_recall import K, _recall
+from similar_utils import _load_embeddings
+
+log = get_logger().bind(script=__file__)
+
+
+def _price_error(train: list[dict], test: list[dict], id_to_vec: dict) -> float | None:
+    """Return median ``|log(predicted / actual)|`` over ``test`` lots."""
+    model, cur_map, _ = train_price_regression(train, id_to_vec)
+    if model is None:
+        return None
+    errors = []
+    for lot in test:
+        pred = predict_price(model, cur_map, id_to_vec.get(lot["_id"]), lot["price:currency"])
+        if pred:
+            errors.append(abs(math.log(pred / float(lot["price"]))))
+    return float(np.median(errors)) if errors else None
+
+
+def _fmt(value: float | None) -> str:
+    return "     n/a" if value is None else f"{value:8.3f}"
+
+
+def main(argv: list[str] | None = None) -> None:
+    prefer_oom_kill()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--dims", type=int, nargs="+", default=[256, 512, 1024], help="Sizes to evaluate"
+    )
+    parser.add_argument("--queries", type=int, default=1000, help="Neighbour sample size")
+    parser.add_argument("--sample", type=int, default=FIT_SAMPLE, help="Rows used to fit")
+    parser.add_argument("--test-share", type=float, default=0.2, help="Held-out price lots")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    embeddings = _load_embeddings(project=False)
+    ids = sorted(embeddings)
+    if len(ids) <= K:
+        log.error("Not enough embeddings for a benchmark", count=len(ids))
+        return
+    full = np.stack([np.asarray(embeddings[i], dtype=np.float32) for i in ids])
+    rng = np.random.default_rng(args.seed)
+    rows = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    _, exact = topk_cosine(normalise(full[rows]), normalise(full), K, rows)
+
+    priced = []
+    for lot in _iter_lots():
+        try:
+            price = float(lot.get("price"))
+        except (TypeError, ValueError):
+            continue
+        if price > 0 and lot.get("price:currency") and lot["_id"] in embeddings:
+            priced.append(lot)
+    rng.shuffle(priced)
+    cut = int(len(priced) * args.test_share)
+    test, train = priced[:cut], priced[cut:]
+    full_map = dict(zip(ids, full))
+
+    print(f"vectors={len(ids)} dim={full.shape[1]} priced={len(priced)}")
+    print("   dim  explained  overlap@6  price_err")
+    full_error = _price_error(train, test, full_map)
+    print(f"{full.shape[1]:6d}  {1.0:9.3f}  {1.0:9.3f}  {_fmt(full_error)}")
+    for dim in args.dims:
+        if dim >= full.shape[1]:
+            continue
+        proj = Projection.fit(full, dim, args.sample, args.seed)
+        reduced = normalise(proj.apply(full))
+        _, approx = topk_cosine(reduced[rows], reduced, K, rows)
+        overlap = _recall(exact, approx)
+        error = _price_error(train, test, dict(zip(ids, proj.apply(full))))
+        print(f"{dim:6d}  {proj.explained:9.3f}  {overlap:9.3f}  {_fmt(error)}")
+        log.info("Dimension benchmark", dim=dim, overlap=overlap, price_error=error)
+
+
+if __name__ == "__main__":
+    main()
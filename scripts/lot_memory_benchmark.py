@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare memory of ``lot_io.LotInfo`` records with equivalent dicts.
+
+Builds synthetic lots shaped like the ones ``build_site.py`` renders and
+measures with ``tracemalloc`` what the pre-parsed fields cost when stored as
+``__slots__`` records and as plain dicts.  The lots themselves are shared by
+both variants and excluded.  It also times sorting every lot by timestamp
+the old way, parsing ``timestamp`` in the key function, against the
+pre-parsed ``LotInfo.dt``.
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+# Allow running from the repository root like the other helper scripts.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from lot_io import LotInfo, get_timestamp
+
+
+def _make_lots(count: int) -> list[dict]:
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    lots = []
+    for i in range(count):
+        value = 10.0 + i % 500
+        lots.append(
+            {
+                "_id": f"chat/2024/05/{i}-0",
+                "timestamp": (now - timedelta(minutes=i)).isoformat(),
+                "market:deal": "sell_item",
+                "item:type": f"type{i % 300}",
+                "contact:telegram": f"@user{i % 20000}",
+                "title_en": f"Item {i}",
+                "_display_price": f"{value:.2f} USD",
+                "_price_class": "",
+                "_display_value": value,
+                "_usd_value": value,
+            }
+        )
+    return lots
+
+
+def _as_dict(info: LotInfo) -> dict:
+    return {name: getattr(info, name) for name in LotInfo.__slots__}
+
+
+def _measure(build) -> tuple[object, int]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lots", type=int, default=100000, help="Synthetic lot count")
+    args = parser.parse_args(argv)
+
+    lots = _make_lots(args.lots)
+    infos, slots_bytes = _measure(lambda: [LotInfo(l, row) for row, l in enumerate(lots)])
+    _, dict_bytes = _measure(
+        lambda: [_as_dict(LotInfo(l, row)) for row, l in enumerate(lots)]
+    )
+
+    start = time.perf_counter()
+    sorted(lots, key=lambda x: get_timestamp(x) or datetime.min, reverse=True)
+    parse_sort = time.perf_counter() - start
+    start = time.perf_counter()
+    sorted(infos, key=lambda x: x.dt or datetime.min, reverse=True)
+    slot_sort = time.perf_counter() - start
+
+    mib = 1024 * 1024
+    print(f"lots={len(lots)}")
+    print(f"LotInfo records  {slots_bytes / mib:8.1f} MiB  {slots_bytes / len(lots):6.0f} B/lot")
+    print(f"dict records     {dict_bytes / mib:8.1f} MiB  {dict_bytes / len(lots):6.0f} B/lot")
+    print(f"sort parsing timestamps {parse_sort * 1000:8.1f} ms")
+    print(f"sort by LotInfo.dt      {slot_sort * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Compare recall@6 of the approximate index against the exact search.
+
+Loads the current embeddings, answers a random sample of queries with the
+exact ``knn_utils.topk_cosine`` kernel used by ``similar.py`` and with ``ann_index.IVFIndex`` for
+several ``nprobe`` values, then prints recall and per-query latency so the
+``--nprobe`` knob of ``similar.py`` can be picked with data.
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+# Allow running from the repository root like the other helper scripts.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np
+
+from ann_index import IVFIndex
+from knn_utils import normalise, topk_cosine
+from log_utils import get_logger
+from oom_utils import prefer_oom_kill
+from similar_utils import _load_embeddings
+
+log = get_logger().bind(script=__file__)
+
+K = 6
+
+
+def _recall(exact: np.ndarray, approx: np.ndarray) -> float:
+    """Return mean fraction of ``exact`` neighbours also found in ``approx``."""
+    hits = 0
+    for e, a in zip(exact, approx):
+        hits += len(set(e.tolist()) & set(a.tolist()))
+    return hits / (len(exact) * exact.shape[1]) if len(exact) else 0.0
+
+
+def main(argv: list[str] | None = None) -> None:
+    prefer_oom_kill()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=1000, help="Sample size")
+    parser.add_argument(
+        "--nprobe",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16, 32],
+        help="nprobe values to evaluate",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    embeddings = _load_embeddings()
+    ids = sorted(embeddings)
+    if len(ids) <= K:
+        log.error("Not enough embeddings for a benchmark", count=len(ids))
+        return
+    matrix = normalise(np.stack([np.asarray(embeddings[i]) for i in ids]))
+    rng = np.random.default_rng(args.seed)
+    rows = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+
+    start = time.perf_counter()
+    _, exact = topk_cosine(matrix[rows], matrix, K, rows)
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = IVFIndex.train(ids, matrix)
+    train_time = time.perf_counter() - start
+
+    print(f"vectors={len(ids)} dim={matrix.shape[1]} lists={len(index.centroids)}")
+    print(f"exact: {exact_time / len(rows) * 1000:.3f} ms/query")
+    print(f"ann train: {train_time:.2f} s")
+    print("nprobe  recall@6  ms/query")
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        _, approx = index.search(rows.tolist(), matrix, K, nprobe)
+        elapsed = time.perf_counter() - start
+        recall = _recall(exact, approx)
+        print(f"{nprobe:6d}  {recall:8.3f}  {elapsed / len(rows) * 1000:8.3f}")
+        log.info("ANN recall", nprobe=nprobe, recall=recall, seconds=elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Persistent inverted-file (IVF) index for approximate cosine search.
+
+Vectors are normalised and clustered with a small spherical k-means.  Each
+lot id is assigned to its closest centroid; a query scans only the ``nprobe``
+lists whose centroids are closest to it and ranks those candidates exactly.
+``nprobe`` is the recall/latency knob: probing every list is equivalent to the
+exact search while a handful of lists touches only a fraction of the corpus.
+
+The index stores centroids and list assignments only.  Vectors are supplied by
+the caller at query time so the embedding store stays the single copy.
+"""
+
+from __future__ import annotations
+
+import math
+from pathlib import Path
+
+import numpy as np
+
+from log_utils import get_logger
+from knn_utils import normalise
+
+log = get_logger().bind(module=__name__)
+
+# FAISS guidance: about ``4 * sqrt(n)`` lists with at least 39 training points
+# per centroid so k-means does not overfit.
+_MIN_POINTS_PER_LIST = 39
+# Retrain once the corpus doubles compared to the training set.
+_RETRAIN_FACTOR = 2.0
+
+
+def default_nlist(count: int) -> int:
+    """Return number of inverted lists for ``count`` vectors."""
+    if count <= 0:
+        return 1
+    return max(1, min(int(4 * math.sqrt(count)), count // _MIN_POINTS_PER_LIST))
+
+
+def _kmeans(data: np.ndarray, nlist: int, iters: int, seed: int) -> np.ndarray:
+    """Return ``nlist`` unit centroids for normalised ``data``."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists with random points to keep every list useful.
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+        centroids = normalise(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Centroids plus list assignments for a set of lot ids."""
+
+    def __init__(self, centroids: np.ndarray, ids: list[str], assign: np.ndarray, trained: int):
+        self.centroids = centroids
+        self.ids = list(ids)
+        self.assign = np.asarray(assign, dtype=np.int32)
+        self.trained = trained
+
+    @classmethod
+    def train(
+        cls,
+        ids: list[str],
+        matrix: np.ndarray,
+        nlist: int | None = None,
+        iters: int = 10,
+        seed: int = 0,
+        sample: int = 256,
+    ) -> "IVFIndex":
+        """Return a new index trained on normalised ``matrix``.
+
+        Training uses at most ``sample`` points per list which keeps it fast on
+        large corpora without hurting the centroids noticeably.
+        """
+        nlist = nlist or default_nlist(len(ids))
+        nlist = max(1, min(nlist, len(ids)))
+        rng = np.random.default_rng(seed)
+        if len(ids) > nlist * sample:
+            rows = rng.choice(len(ids), size=nlist * sample, replace=False)
+            train_data = matrix[rows]
+        else:
+            train_data = matrix
+        centroids = _kmeans(np.asarray(train_data), nlist, iters, seed)
+        assign = np.argmax(matrix @ centroids.T, axis=1)
+        log.info("Trained ANN index", count=len(ids), lists=nlist)
+        return cls(centroids, ids, assign, len(ids))
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex | None":
+        """Return index stored at ``path`` or ``None`` when missing or bad."""
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                index = cls(
+                    data["centroids"],
+                    [str(i) for i in data["ids"]],
+                    data["assign"],
+                    int(data["trained"]),
+                )
+        except Exception:
+            log.exception("Failed to load ANN index", path=str(path))
+            return None
+        if len(index.ids) != len(index.assign):
+            log.error("Bad ANN index", path=str(path))
+            return None
+        return index
+
+    def save(self, path: Path) -> None:
+        """Write the index to ``path`` in ``numpy`` ``.npz`` format."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fh:
+            np.savez(
+                fh,
+                centroids=self.centroids,
+                ids=np.asarray(self.ids, dtype=str),
+                assign=self.assign,
+                trained=np.int64(self.trained),
+            )
+        log.debug("Saved ANN index", path=str(path), count=len(self.ids))
+
+    def needs_retrain(self, count: int, dim: int) -> bool:
+        """Return ``True`` when the centroids no longer fit ``count`` vectors."""
+        if self.centroids.shape[1] != dim:
+            return True
+        if count > self.trained * _RETRAIN_FACTOR:
+            return True
+        return len(self.centroids) < default_nlist(count) / _RETRAIN_FACTOR
+
+    def update(self, ids: list[str], matrix: np.ndarray) -> int:
+        """Sync assignments with ``ids`` and return how many were added.
+
+        Ids missing from ``ids`` are dropped and only the new ones are assigned
+        to a list, so repeated runs touch just the fresh lots.  ``ids`` order
+        defines the row order used by :meth:`search`.
+        """
+        known = dict(zip(self.ids, self.assign.tolist()))
+        new_rows = [row for row, lid in enumerate(ids) if lid not in known]
+        assign = np.empty(len(ids), dtype=np.int32)
+        for row, lid in enumerate(ids):
+            assign[row] = known.get(lid, -1)
+        if new_rows:
+            sims = matrix[new_rows] @ self.centroids.T
+            assign[new_rows] = np.argmax(sims, axis=1)
+        self.ids = list(ids)
+        self.assign = assign
+        return len(new_rows)
+
+    def search(
+        self,
+        query_rows: list[int],
+        matrix: np.ndarray,
+        k: int,
+        nprobe: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return ``(dist, neigh)`` for ``query_rows`` of normalised ``matrix``.
+
+        The query row itself is excluded.  Rows with fewer than ``k`` candidates
+        are padded with ``-1`` neighbours and infinite distance.
+        """
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        order = np.argsort(self.assign, kind="stable")
+        bounds = np.searchsorted(
+            self.assign[order], np.arange(len(self.centroids) + 1)
+        )
+        lists = [order[bounds[i] : bounds[i + 1]] for i in range(len(self.centroids))]
+
+        queries = matrix[query_rows]
+        csim = queries @ self.centroids.T
+        if nprobe < len(self.centroids):
+            probe = np.argpartition(-csim, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probe = np.tile(np.arange(len(self.centroids)), (len(query_rows), 1))
+
+        dist = np.full((len(query_rows), k), np.inf, dtype=np.float32)
+        neigh = np.full((len(query_rows), k), -1, dtype=np.int64)
+        for qi, row in enumerate(query_rows):
+            cand = np.concatenate([lists[p] for p in probe[qi]])
+            cand = cand[cand != row]
+            if not len(cand):
+                continue
+            sims = matrix[cand] @ queries[qi]
+            take = min(k, len(cand))
+            top = np.argpartition(-sims, take - 1)[:take]
+            top = top[np.argsort(-sims[top], kind="stable")]
+            dist[qi, :take] = 1.0 - sims[top]
+            neigh[qi, :take] = cand[top]
+        return dist, neigh
@@ -0,0 +1,112 @@
+"""Input digests that let ``build_site.py`` skip unchanged pages.
+
+Every output file is recorded in a manifest together with a digest of the
+inputs it was rendered from: the lot itself, its neighbour lists, caption and
+raw post stamps, exchange rates, the templates and the compiled translations.
+On the next build a page whose digest matches and which still exists is left
+alone.  Outputs listed in the old manifest but not produced again belong to
+vanished lots or categories and are deleted.
+
+The manifest lives next to ``data/views`` rather than inside it so the deploy
+step never publishes it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+
+from log_utils import get_logger
+from notes_utils import load_json, write_json
+
+log = get_logger().bind(module=__name__)
+
+MANIFEST_NAME = "build_manifest.json"
+
+
+def digest(*parts) -> str:
+    """Return a stable SHA-256 hex digest of JSON-serialisable ``parts``.
+
+    Values JSON cannot represent, like ``Path`` or ``datetime``, are hashed
+    via ``str``.
+    """
+    text = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_stamp(path: Path) -> list[int] | None:
+    """Return ``[mtime_ns, size]`` of ``path`` or ``None`` when missing."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def tree_digest(root: Path) -> str:
+    """Return digest over names and contents of every file under ``root``."""
+    h = hashlib.sha256()
+    if root.exists():
+        for path in sorted(p for p in root.rglob("*") if p.is_file()):
+            h.update(path.relative_to(root).as_posix().encode("utf-8"))
+            h.update(b"\0")
+            h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def manifest_path(views_dir: Path) -> Path:
+    """Return manifest location for the output tree ``views_dir``."""
+    return views_dir.parent / MANIFEST_NAME
+
+
+class BuildManifest:
+    """Map of output paths under ``root`` to the digest of their inputs."""
+
+    def __init__(self, root: Path, full: bool = False):
+        self.root = root
+        self.path = manifest_path(root)
+        old = None if full else load_json(self.path) if self.path.exists() else None
+        self.old: dict[str, str] = old if isinstance(old, dict) else {}
+        self.new: dict[str, str] = {}
+        self.rendered = 0
+        self.skipped = 0
+
+    def fresh(self, out: Path, inputs: str) -> bool:
+        """Record ``out`` and return ``True`` when it is up to date.
+
+        ``inputs`` is the digest of everything the page depends on.  When this
+        returns ``False`` the caller must render and write ``out``.
+        """
+        rel = out.relative_to(self.root).as_posix()
+        self.new[rel] = inputs
+        if self.old.get(rel) == inputs and out.exists():
+            self.skipped += 1
+            return True
+        self.rendered += 1
+        return False
+
+    def remove_stale(self) -> int:
+        """Delete outputs from the previous build that were not produced now."""
+        removed = 0
+        for rel in sorted(set(self.old) - set(self.new)):
+            path = self.root / rel
+            if path.exists():
+                path.unlink()
+                removed += 1
+            parent = path.parent
+            while parent != self.root and parent.exists() and not any(parent.iterdir()):
+                parent.rmdir()
+                parent = parent.parent
+        return removed
+
+    def save(self) -> None:
+        """Remove stale outputs, then write the manifest for the next build."""
+        removed = self.remove_stale()
+        write_json(self.path, self.new)
+        log.info(
+            "Build manifest updated",
+            rendered=self.rendered,
+            skipped=self.skipped,
+            removed=removed,
+        )
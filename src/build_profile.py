@@ -0,0 +1,112 @@
+"""Per-phase timings for ``build_site.py --profile``.
+
+:class:`BuildProfile` records wall time, CPU time, peak RSS and item counts
+for every phase of a build.  It also accumulates render time per template,
+which workers report back with their results.  The report is written as
+JSON to ``data/build_profile.json`` so slow builds can be compared before
+tuning anything.  Timing is cheap, so the build always records phases and
+only writes the report when asked.
+"""
+
+from __future__ import annotations
+
+import resource
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from log_utils import get_logger
+from notes_utils import write_json
+
+log = get_logger().bind(module=__name__)
+
+PROFILE_NAME = "build_profile.json"
+RENDER_PROF_NAME = "build_render.prof"
+
+
+def _peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Return the peak resident set size of ``who`` in MiB."""
+    # Linux reports ``ru_maxrss`` in KiB.
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class BuildProfile:
+    """Collect phase and template timings of one build."""
+
+    def __init__(self) -> None:
+        self.phases: list[dict] = []
+        self.templates: dict[str, dict] = {}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._children = _children_cpu()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[dict]:
+        """Time the enclosed block as phase ``name``.
+
+        Item counts stored in the yielded dict are added to the record.
+        """
+        counts: dict = {}
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        children = _children_cpu()
+        try:
+            yield counts
+        finally:
+            record = {
+                "phase": name,
+                "wall_s": round(time.perf_counter() - wall, 4),
+                "cpu_s": round(time.process_time() - cpu, 4),
+                "workers_cpu_s": round(_children_cpu() - children, 4),
+                "peak_rss_mb": _peak_rss_mb(),
+                **counts,
+            }
+            self.phases.append(record)
+            log.debug("Build phase", **record)
+
+    def add_template(self, template: str, pages: int, wall: float, cpu: float) -> None:
+        """Add ``pages`` rendered from ``template`` in ``wall``/``cpu`` seconds."""
+        stat = self.templates.setdefault(
+            template, {"pages": 0, "wall_s": 0.0, "cpu_s": 0.0}
+        )
+        stat["pages"] += pages
+        stat["wall_s"] += wall
+        stat["cpu_s"] += cpu
+
+    def report(self) -> dict:
+        """Return the collected timings as a JSON-serialisable dict."""
+        return {
+            "wall_s": round(time.perf_counter() - self._wall, 4),
+            "cpu_s": round(time.process_time() - self._cpu, 4),
+            "workers_cpu_s": round(_children_cpu() - self._children, 4),
+            "peak_rss_mb": _peak_rss_mb(),
+            "workers_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "phases": self.phases,
+            "templates": {
+                name: {
+                    "pages": stat["pages"],
+                    "wall_s": round(stat["wall_s"], 4),
+                    "cpu_s": round(stat["cpu_s"], 4),
+                }
+                for name, stat in sorted(self.templates.items())
+            },
+        }
+
+    def write(self, path: Path) -> dict:
+        """Write :meth:`report` to ``path`` and log a short summary."""
+        report = self.report()
+        write_json(path, report)
+        slowest = max(self.phases, key=lambda p: p["wall_s"], default=None)
+        log.info(
+            "Build profile written",
+            path=str(path),
+            wall_s=report["wall_s"],
+            slowest=slowest["phase"] if slowest else None,
+        )
+        return report
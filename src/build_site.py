@@ -8,38 +8,56 @@ lots based on cosine similarity.  ``data/ontology/fields.json`` is consulted to
 display table columns in a stable order.
 """
 
+import argparse
+import cProfile
+import multiprocessing
 import os
 import re
 import hashlib
+import math
 from pathlib import Path
 import shutil
 import subprocess
+import time
 from datetime import datetime, timedelta, timezone
-
-from jinja2 import Environment, FileSystemLoader
-import gettext
-from notes_utils import load_json
-from lot_io import (
-    read_lots,
-    get_seller,
-    get_timestamp,
-    iter_lot_files,
+from typing import Iterator
+
+from jinja2 import (
+    BaseLoader,
+    BytecodeCache,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
 )
+import numpy as np
+import gettext
+from notes_utils import load_json, write_json
+from lot_io import LotInfo, LotRecord, LotStore, get_timestamp
+from neighbour_table import NeighbourTable
+from embed_reduce import projection_digest
 from similar_utils import (
     SIMILAR_DIR,
     _load_embeddings,
-    _format_vector,
-    _load_similar,
-    _load_more_user,
+    _encode_vector,
+    _encode_vectors,
+    _close_neighbour_caches,
+    _open_neighbour_caches,
     _sync_embeddings,
 )
+from similar_db import NeighbourView
+from media_sync import sync_media
+from site_publish import precompress, update_content_manifest
+from search_index import SearchIndex
 
 from config_utils import load_config
 from log_utils import get_logger, install_excepthook
 from oom_utils import prefer_oom_kill
-from moderation import should_skip_message, should_skip_lot
-from post_io import read_post, raw_post_path, RAW_DIR
-from caption_io import read_caption
+from post_io import raw_post_path, RAW_DIR
+from caption_io import read_captions, caption_stamp, clear_caption_cache
+import build_cache
+from build_cache import BuildManifest
+from build_profile import PROFILE_NAME, RENDER_PROF_NAME, BuildProfile
 from price_utils import (
     apply_price_model,
     fetch_official_rates,
@@ -62,6 +80,14 @@ MEDIA_DIR = Path("data/media")
 MODEL_FILE = Path("data/price_model.json")
 CLUSTER_FILE = Path("data/item_clusters.json")
 
+# Lots listed on one category page unless ``CATEGORY_PAGE_SIZE`` is configured.
+CATEGORY_PAGE_SIZE = 200
+
+# Lot pages handed to the renderer at once by ``--stream`` builds.
+STREAM_BATCH = 256
+# Cached card and row fragments kept per process by ``--stream`` builds.
+STREAM_FRAGMENTS = 16 * STREAM_BATCH
+
 # Limit file name length so OS path limits are not exceeded.
 _MAX_NAME = 120
 
@@ -76,19 +102,161 @@ def _slug_component(text: str) -> str:
     return f"{safe[: _MAX_NAME - 9]}-{digest}"
 
 
+def _lot_page_base(lot_id: str) -> Path:
+    """Return lot page path relative to ``VIEWS_DIR`` without language suffix."""
+    p = Path(lot_id)
+    return p.parent / _slug_component(p.name)
+
+
 def _lot_page_path(lot_id: str, lang: str) -> Path:
     """Return HTML path for ``lot_id`` and ``lang``."""
-    p = Path(lot_id)
-    name = _slug_component(p.name)
-    return VIEWS_DIR / p.parent / f"{name}_{lang}.html"
+    base = _lot_page_base(lot_id)
+    return VIEWS_DIR / base.parent / f"{base.name}_{lang}.html"
 
 
-def _cat_page_path(deal: str, lang: str) -> Path:
-    """Return category HTML path."""
+def _cat_page_path(deal: str, lang: str, page: int = 1) -> Path:
+    """Return category HTML path.
+
+    The first page keeps the historic location.  Further pages go to a
+    directory named after the category so they cannot clash with another
+    category's file.
+    """
     name = _slug_component(deal)
+    if page > 1:
+        return VIEWS_DIR / "deal" / name / f"{page}_{lang}.html"
     return VIEWS_DIR / "deal" / f"{name}_{lang}.html"
 
 
+def _cat_index_path(deal: str, lang: str) -> Path:
+    """Return JSON page index of a paginated category."""
+    name = _slug_component(deal)
+    return VIEWS_DIR / "deal" / f"{name}_{lang}.json"
+
+
+class _FragmentCache(dict):
+    """Rendered fragments keyed by ``(kind, lang, lot id)``.
+
+    With ``limit`` set the oldest entries are dropped once it is reached, so
+    streaming builds keep a bounded number of fragments per process.
+    """
+
+    limit: int | None = None
+
+    def remember(self, key: tuple[str, str, str], html: str) -> str:
+        """Store and return ``html`` under ``key``."""
+        if self.limit is not None:
+            while len(self) >= self.limit:
+                del self[next(iter(self))]
+        self[key] = html
+        return html
+
+
+# Card fragments are rendered once per build and process, and shared by every
+# page that lists the lot.
+_FRAGMENTS = _FragmentCache()
+# Stands for the site root in cached fragments.  NUL never occurs in lot text.
+_ROOT_MARK = "\0"
+
+
+def _root_prefix(page_dir: Path) -> str:
+    """Return the relative path from ``page_dir`` to ``VIEWS_DIR`` with a slash."""
+    rel = os.path.relpath(VIEWS_DIR, page_dir)
+    return "" if rel == "." else f"{rel}/"
+
+
+def _place(fragment: str, root: str) -> str:
+    """Return ``fragment`` with links resolved for a page at ``root``."""
+    return fragment.replace(_ROOT_MARK, root)
+
+
+def _card_fragment(
+    lot_id: str, other: dict, lang: str, langs: list[str], env: Environment
+) -> str:
+    """Return the carousel card of ``lot_id`` as shown on lot pages."""
+    key = ("card", lang, lot_id)
+    html = _FRAGMENTS.get(key)
+    if html is None:
+        title = (
+            other.get(f"title_{lang}")
+            or other.get("title_en")
+            or next(
+                (other.get(f"title_{l}") for l in langs if other.get(f"title_{l}")),
+                lot_id,
+            )
+        )
+        files = other.get("files") or []
+        link = _lot_page_path(lot_id, lang).relative_to(VIEWS_DIR).as_posix()
+        html = _FRAGMENTS.remember(
+            key,
+            env.get_template("cards.html").module.carousel(
+                _ROOT_MARK, link, files[0] if files else "", title
+            ),
+        )
+    return html
+
+
+def _row_fragment(info: LotInfo, lang: str, langs: list[str], env: Environment) -> str:
+    """Return the table cells of ``info`` as shown on category pages."""
+    key = ("row", lang, info.id)
+    html = _FRAGMENTS.get(key)
+    if html is None:
+        lot = info.lot
+        title = lot.get(f"title_{lang}") or next(
+            (lot.get(f"title_{l}") for l in langs if lot.get(f"title_{l}")),
+            info.id,
+        )
+        row = {
+            "link": _lot_page_path(info.id, lang).relative_to(VIEWS_DIR).as_posix(),
+            "title": title,
+            "dt": info.dt,
+            "price": info.price,
+            "price_class": info.price_class,
+            "price_usd": info.price_usd,
+            "seller": info.seller,
+        }
+        html = _FRAGMENTS.remember(
+            key, env.get_template("cards.html").module.row_cells(_ROOT_MARK, row)
+        )
+    return html
+
+
+def _write_vector_shard(
+    path: Path, vectors: list, manifest: BuildManifest | None
+) -> tuple[dict | None, list[int | None]]:
+    """Store ``vectors`` of one table in a binary shard next to the pages.
+
+    Returns the shard description for :func:`_shard_args` and the shard row
+    of every input vector, or ``None`` for missing ones.  Nothing is written
+    when no vector is present.
+    """
+    rows: list[int | None] = []
+    present = []
+    for vec in vectors:
+        if vec is None:
+            rows.append(None)
+        else:
+            rows.append(len(present))
+            present.append(vec)
+    if not present:
+        return None, rows
+    data = _encode_vectors(present)
+    version = hashlib.sha256(data).hexdigest()
+    if manifest is None or not manifest.fresh(path, version):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return {"path": path, "version": version[:12], "dim": len(present[0])}, rows
+
+
+def _shard_args(shard: dict | None, page_dir: Path) -> dict:
+    """Return template settings pointing a page in ``page_dir`` at ``shard``.
+
+    The URL carries a content hash so browsers refetch changed shards.
+    """
+    if shard is None:
+        return {"vectors": None, "vector_dim": 0}
+    url = f"{os.path.relpath(shard['path'], page_dir)}?v={shard['version']}"
+    return {"vectors": url, "vector_dim": shard["dim"]}
+
 
 def _load_ontology() -> list[str]:
     """Return sorted field list from ``ONTOLOGY`` or empty list when missing."""
@@ -134,11 +302,76 @@ def _compile_locale(lang: str) -> None:
             log.exception('Failed to compile translation', lang=lang)
 
 
+def _template_digest() -> str:
+    """Return digest of the page templates, ignoring static assets."""
+    h = hashlib.sha256()
+    for path in sorted(TEMPLATES.glob("*.html")):
+        h.update(path.name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def _jinja_dirs() -> tuple[Path, Path]:
+    """Return the bytecode cache and precompiled template directories.
+
+    Both live next to ``VIEWS_DIR`` so they are never deployed.
+    """
+    return VIEWS_DIR.parent / "jinja_cache", VIEWS_DIR.parent / "templates_compiled"
+
+
+def compile_templates() -> Path:
+    """Compile ``TEMPLATES`` into Python modules unless already current.
+
+    The modules are language independent because translations are looked up
+    at render time.  A ``DIGEST`` file records which templates they were
+    compiled from.
+    """
+    _, target = _jinja_dirs()
+    digest = _template_digest()
+    stamp = target / "DIGEST"
+    if stamp.exists() and stamp.read_text() == digest:
+        return target
+    if target.exists():
+        shutil.rmtree(target)
+    env = Environment(
+        loader=FileSystemLoader(str(TEMPLATES)),
+        extensions=['jinja2.ext.i18n'],
+    )
+    env.compile_templates(
+        str(target), zip=None, filter_func=lambda name: name.endswith(".html")
+    )
+    stamp.write_text(digest)
+    log.info("Compiled templates", path=str(target))
+    return target
+
+
+def _template_loader() -> tuple[BaseLoader, BytecodeCache | None]:
+    """Return the loader and bytecode cache for page environments.
+
+    Templates precompiled by :func:`compile_templates` are imported when they
+    match the sources.  Otherwise templates are parsed from ``TEMPLATES`` and
+    their bytecode is kept in a persistent cache.  Jinja checks each cached
+    entry against a hash of the template source, so edited templates are
+    compiled again.
+    """
+    cache_dir, compiled = _jinja_dirs()
+    stamp = compiled / "DIGEST"
+    if stamp.exists():
+        if stamp.read_text() == _template_digest():
+            return ModuleLoader(str(compiled)), None
+        log.info("Precompiled templates are stale", path=str(compiled))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return FileSystemLoader(str(TEMPLATES)), FileSystemBytecodeCache(str(cache_dir))
+
+
 def _env_for_lang(lang: str) -> Environment:
     """Return Jinja environment configured for ``lang``."""
     _compile_locale(lang)
+    loader, bytecode_cache = _template_loader()
     env = Environment(
-        loader=FileSystemLoader(str(TEMPLATES)),
+        loader=loader,
+        bytecode_cache=bytecode_cache,
         extensions=['jinja2.ext.i18n'],
     )
     mo = LOCALE_DIR / lang / 'LC_MESSAGES' / 'messages.mo'
@@ -158,61 +391,42 @@ def _env_for_lang(lang: str) -> Environment:
 
 
 
+def _lot_from_record(rec: LotRecord) -> dict | None:
+    """Return the lot of ``rec`` prepared for rendering or ``None`` if rejected."""
+    if rec.skip:
+        log.info(
+            "Skipping lot",
+            file=str(rec.path),
+            reason="moderation",
+            source=rec.lot.get("source:path"),
+        )
+        return None
+    lot = rec.lot
+    lot["_file"] = rec.path
+    lot["_id"] = rec.id
+    # Keep the raw post text so pages need not parse the post again.
+    lot["_orig_text"] = rec.text
+    return lot
+
+
 def _iter_lots() -> list[dict]:
     """Return all lots ready for rendering."""
-    lots = []
-    # ``iter_lot_files`` keeps file ordering consistent with ``pending_embed.py``
-    # so both scripts see the same data in the same order.
-    for path in iter_lot_files(LOTS_DIR):
-        data = read_lots(path)
-        if not data:
-            continue
-        rel = path.relative_to(LOTS_DIR).with_suffix("")
-        base = rel.name
-        prefix = rel.parent
-        for i, lot in enumerate(data):
-            src = lot.get("source:path")
-            meta: dict[str, str] | None = None
-            text = ""
-            if src:
-                raw_path = raw_post_path(src, RAW_DIR)
-                meta, text = read_post(raw_path)
-                if should_skip_message(meta, text):
-                    log.info(
-                        "Skipping lot",
-                        file=str(path),
-                        reason="moderation",
-                        source=str(src),
-                    )
-                    continue
-            if should_skip_lot(lot):
-                log.info(
-                    "Skipping lot",
-                    file=str(path),
-                    reason="moderation",
-                    source=str(src) if src else None,
-                )
-                continue
-            lot["_file"] = path
-            lot["_id"] = str(prefix / f"{base}-{i}") if prefix.parts else f"{base}-{i}"
-            lots.append(lot)
+    # ``LotStore`` walks ``iter_lot_files`` so the file ordering stays
+    # consistent with ``pending_embed.py`` and both scripts see the same data.
+    records = LotStore(LOTS_DIR, RAW_DIR).load()
+    lots = [lot for lot in map(_lot_from_record, records) if lot is not None]
     log.info("Loaded lots", count=len(lots))
     return lots
 
 
-def _copy_images(lots: list[dict]) -> None:
-    """Copy media referenced by ``lots`` into ``VIEWS_DIR``."""
-    media_dst = VIEWS_DIR / "media"
-    if media_dst.exists():
-        shutil.rmtree(media_dst)
-    for lot in lots:
-        for rel in lot.get("files", []):
-            src = MEDIA_DIR / rel
-            if not src.exists():
-                continue
-            dst = media_dst / rel
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst)
+def _copy_images(lots: list[dict]) -> dict[str, int]:
+    """Publish media referenced by ``lots`` into ``VIEWS_DIR``.
+
+    Files are hardlinked from ``MEDIA_DIR`` and synced incrementally, see
+    :mod:`media_sync`.  Returns the sync counts.
+    """
+    rels = {rel for lot in lots for rel in lot.get("files", [])}
+    return sync_media(MEDIA_DIR, VIEWS_DIR / "media", rels)
 
 
 def _copy_static() -> None:
@@ -227,182 +441,251 @@ def _copy_static() -> None:
 
 
 
-def _load_state() -> tuple[
+def _load_state(profile: BuildProfile | None = None) -> tuple[
     list[str],
     dict[str, list[float]],
     list[dict],
-    dict[str, list[dict]],
-    dict[str, list[dict]],
+    NeighbourView | NeighbourTable,
+    NeighbourView | dict[str, list[dict]],
     dict[str, list[str]],
 ]:
-    """Return ontology fields, embeddings, lots and similarity caches."""
+    """Return ontology fields, embeddings, lots and similarity caches.
+
+    Each step is recorded as a phase of ``profile``.
+    """
+    profile = profile or BuildProfile()
     log.debug("Loading ontology")
-    fields = _load_ontology()
+    with profile.phase("load_ontology") as rec:
+        fields = _load_ontology()
+        rec["items"] = len(fields)
     log.debug("Loading embeddings")
-    embeddings = _load_embeddings()
+    with profile.phase("load_embeddings") as rec:
+        embeddings = _load_embeddings()
+        rec["items"] = len(embeddings)
     log.debug("Loading lots")
-    lots = _iter_lots()
-    _copy_images(lots)
-    log.debug("Loading similar cache")
-    sim_map = _load_similar()
-    log.debug("Loading user cache")
-    more_user_map = _load_more_user()
+    with profile.phase("load_lots") as rec:
+        lots = _iter_lots()
+        rec["items"] = len(lots)
+    with profile.phase("copy_images") as rec:
+        rec.update(_copy_images(lots))
+    log.debug("Opening similar caches")
+    with profile.phase("open_neighbour_caches"):
+        sim_map, more_user_map = _open_neighbour_caches()
     log.debug("Loading clusters")
-    clusters = _load_clusters()
+    with profile.phase("load_clusters") as rec:
+        clusters = _load_clusters()
+        rec["items"] = len(clusters)
     return fields, embeddings, lots, sim_map, more_user_map, clusters
 
 
 
 
+def _group_order(groups: np.ndarray, values: np.ndarray, size: int):
+    """Return positions of non-NaN ``values`` sorted by group then value.
+
+    Also returns where each of the ``size`` groups starts in that order and
+    how many values it has.
+    """
+    pos = np.flatnonzero(~np.isnan(values))
+    pos = pos[np.lexsort((values[pos], groups[pos]))]
+    counts = np.bincount(groups[pos], minlength=size)
+    starts = np.cumsum(counts) - counts
+    return pos, starts, counts
+
+
+def _group_median(
+    groups: np.ndarray, values: np.ndarray, size: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return median, minimum and maximum of ``values`` per group.
+
+    ``NaN`` values are ignored and groups without values get ``NaN``.
+    """
+    pos, starts, counts = _group_order(groups, values, size)
+    ordered = values[pos]
+    median = np.full(size, np.nan)
+    low = np.full(size, np.nan)
+    high = np.full(size, np.nan)
+    has = counts > 0
+    s, c = starts[has], counts[has]
+    low[has] = ordered[s]
+    high[has] = ordered[s + c - 1]
+    median[has] = (ordered[s + (c - 1) // 2] + ordered[s + c // 2]) / 2
+    return median, low, high
+
+
+def _group_last(groups: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """Return the position of the largest non-NaN value per group or ``-1``."""
+    pos, starts, counts = _group_order(groups, values, size)
+    last = np.full(size, -1, dtype=np.intp)
+    has = counts > 0
+    last[has] = pos[starts[has] + counts[has] - 1]
+    return last
+
+
+def _group_centroids(
+    groups: np.ndarray,
+    members: np.ndarray,
+    vectors: list,
+    size: int,
+    chunk: int = 4096,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return the mean vector per group and how many vectors it has.
+
+    ``groups[k]`` is the group of membership ``k`` and ``members[k]`` the index
+    of its lot in ``vectors``.  Each lot vector is read once even when the lot
+    belongs to several groups.  Lots are ordered by the groups they belong to
+    and summed ``chunk`` at a time: a block is multiplied by a multi-hot
+    matrix of the few groups it touches, so BLAS does the summing and only
+    one block of vectors is copied at once.  Blocks are summed in ``float32``
+    and accumulated in ``float64``.
+    """
+    has = np.array([v is not None for v in vectors], dtype=bool)
+    keep = has[members]
+    groups, members = groups[keep], members[keep]
+    counts = np.bincount(groups, minlength=size)
+    lots = np.flatnonzero(has)
+    if not len(groups):
+        return np.zeros((size, 0)), counts
+    first = np.full(len(vectors), size, dtype=np.intp)
+    np.minimum.at(first, members, groups)
+    last = np.full(len(vectors), -1, dtype=np.intp)
+    np.maximum.at(last, members, groups)
+    lots = lots[np.lexsort((last[lots], first[lots]))]
+    rank = np.empty(len(vectors), dtype=np.intp)
+    rank[lots] = np.arange(len(lots))
+    ranks = rank[members]
+    order = np.argsort(ranks, kind="stable")
+    groups, ranks = groups[order], ranks[order]
+    dim = len(vectors[lots[0]])
+    sums = np.zeros((size, dim), dtype=np.float64)
+    for start in range(0, len(lots), chunk):
+        block = lots[start : start + chunk]
+        lo, hi = np.searchsorted(ranks, [start, start + len(block)])
+        cats, local = np.unique(groups[lo:hi], return_inverse=True)
+        onehot = np.zeros((len(cats), len(block)), dtype=np.float32)
+        onehot[local, ranks[lo:hi] - start] = 1.0
+        data = np.stack([np.asarray(vectors[i], dtype=np.float32) for i in block])
+        sums[cats] += onehot @ data
+    centroids = sums / np.maximum(counts, 1)[:, None]
+    return centroids, counts
+
+
 def _categorise(
-    lots: list[dict],
+    lots: list[LotInfo] | list[dict],
     langs: list[str],
     keep_days: int,
     id_to_vec: dict[str, list[float]],
     clusters: dict[str, list[str]] | None,
-) -> tuple[dict[str, list[dict]], dict[str, dict], list[dict]]:
+) -> tuple[dict[str, list[LotInfo]], dict[str, dict], list[dict]]:
     """Return category info and recent lot list.
 
     Categories are split by ``market:deal``. ``sell_item`` lots are further
     grouped by ``clusters`` when available and fall back to ``item:type``.
     ``clusters`` maps ``item:type`` values to cluster names. Stats include price
     range, last timestamp and embedding centroid so the sorting logic used on
-    item pages also works for categories.
+    item pages also works for categories.  Plain lot dicts are wrapped in
+    :class:`LotInfo` first.
     """
+    infos = [
+        lot if isinstance(lot, LotInfo) else LotInfo(lot, row)
+        for row, lot in enumerate(lots)
+    ]
     now = datetime.now(timezone.utc)
     recent_cutoff = now - timedelta(days=keep_days)
     recent: list[dict] = []
-    categories: dict[str, list[dict]] = {}
+    categories: dict[str, list[LotInfo]] = {}
     category_stats: dict[str, dict] = {}
     type_to_cluster: dict[str, str] = {}
     if clusters:
         for name, types in clusters.items():
             for t in types:
                 type_to_cluster[t] = name
-    def update_stat(cat: str) -> dict:
-        stat = category_stats.setdefault(
-            cat,
-            {
-                "recent": 0,
-                "users": set(),
-                "recent_users": set(),
-                "prices": [],
-                "prices_usd": [],
-                "times": [],
-                "vecsum": None,
-                "count": 0,
-            },
-        )
-        return stat
-
-    def add_lot(cat: str, lot: dict, dt: datetime | None) -> None:
-        categories.setdefault(cat, []).append(lot)
-        stat = update_stat(cat)
-        user = get_seller(lot)
-        if isinstance(user, list):
-            log.debug("Multiple sellers", id=lot.get("_id"), value=user)
-            user = user[0] if user else None
-        if user:
-            stat["users"].add(str(user))
-        if dt and dt >= recent_cutoff:
-            if user:
-                stat["recent_users"].add(str(user))
-            stat["recent"] += 1
-        price = lot.get("_display_value")
-        if price not in ("", None):
-            try:
-                stat["prices"].append(float(price))
-            except Exception:
-                pass
-        usd = lot.get("_usd_value")
-        if usd not in ("", None):
-            try:
-                stat["prices_usd"].append(float(usd))
-            except Exception:
-                pass
-        if dt:
-            stat["times"].append(dt)
-        vec = id_to_vec.get(lot.get("_id"))
-        # ``numpy.ndarray`` does not support boolean evaluation.  Check for
-        # ``None`` instead of relying on truthiness.
-        if vec is not None:
-            if stat["vecsum"] is None:
-                stat["vecsum"] = [0.0 for _ in vec]
-            for i, v in enumerate(vec):
-                stat["vecsum"][i] += v
-            stat["count"] += 1
-
-    for lot in lots:
-        dt = get_timestamp(lot)
-        deal = lot.get("market:deal", "misc")
-        if not isinstance(deal, str):
-            log.debug("Non-string deal", id=lot.get("_id"), value=deal)
-            if isinstance(deal, list) and deal:
-                deal = deal[0]
-            else:
-                deal = str(deal)
-
-        add_lot(deal, lot, dt)
-
+    nan = float("nan")
+    times = np.array([i.dt.timestamp() if i.dt else nan for i in infos], dtype=np.float64)
+    is_recent = times >= recent_cutoff.timestamp()
+    recent_flags = is_recent.tolist()
+    cat_index: dict[str, int] = {}
+    member_cat: list[int] = []
+    member_lot: list[int] = []
+
+    for pos, info in enumerate(infos):
+        deal = info.deal
+        cats = [deal]
         if deal == "sell_item":
-            itype = lot.get("item:type")
-            if isinstance(itype, list):
-                itype = itype[0] if itype else None
+            itype = info.item_type
             cname = type_to_cluster.get(itype or "")
             if cname:
-                add_lot(f"{deal}.{cname}", lot, dt)
-            elif isinstance(itype, str) and itype:
-                add_lot(f"{deal}.{itype}", lot, dt)
-
-        if dt and dt >= recent_cutoff:
+                cats.append(f"{deal}.{cname}")
+            elif itype:
+                cats.append(f"{deal}.{itype}")
+        for cat in cats:
+            ci = cat_index.get(cat)
+            if ci is None:
+                ci = cat_index[cat] = len(cat_index)
+                categories[cat] = []
+            categories[cat].append(info)
+            member_cat.append(ci)
+            member_lot.append(pos)
+
+        if recent_flags[pos]:
+            lot = info.lot
             titles = {lang: lot.get(f"title_{lang}") for lang in langs}
-            seller = get_seller(lot)
             recent.append(
                 {
-                    "id": lot["_id"],
+                    "id": info.id,
                     "titles": titles,
-                    "dt": dt,
-                    "price": lot.get("_display_price"),
-                    "price_class": lot.get("_price_class"),
-                    "seller": seller,
+                    "dt": info.dt,
+                    "price": info.price,
+                    "price_class": info.price_class,
+                    "seller": info.seller,
                 }
             )
 
-    for cat, stat in category_stats.items():
-        prices = stat.pop("prices")
-        prices_usd = stat.pop("prices_usd")
-        times = stat.pop("times")
-        vecsum = stat.pop("vecsum")
-        count = stat.pop("count")
-        if prices:
-            prices_sorted = sorted(prices)
-            mid = len(prices_sorted) // 2
-            if len(prices_sorted) % 2:
-                stat["price_typical"] = prices_sorted[mid]
-            else:
-                stat["price_typical"] = (
-                    prices_sorted[mid - 1] + prices_sorted[mid]
-                ) / 2
-            stat["price_min"] = prices_sorted[0]
-            stat["price_max"] = prices_sorted[-1]
-        else:
-            stat["price_typical"] = stat["price_min"] = stat["price_max"] = None
-        if prices_usd:
-            prices_sorted = sorted(prices_usd)
-            mid = len(prices_sorted) // 2
-            if len(prices_sorted) % 2:
-                stat["price_typical_usd"] = prices_sorted[mid]
-            else:
-                stat["price_typical_usd"] = (
-                    prices_sorted[mid - 1] + prices_sorted[mid]
-                ) / 2
-        else:
-            stat["price_typical_usd"] = None
-        stat["last_dt"] = max(times) if times else None
-        if vecsum is not None and count:
-            stat["centroid"] = [v / count for v in vecsum]
-        else:
-            stat["centroid"] = None
+    # Counts, prices, times and vectors are aggregated per category with
+    # numpy over (category, lot) membership pairs instead of per-lot Python
+    # lists.  Only the poster sets are still filled one membership at a time.
+    groups = np.asarray(member_cat, dtype=np.intp)
+    members = np.asarray(member_lot, dtype=np.intp)
+    ncat = len(cat_index)
+    recent_counts = np.bincount(groups[is_recent[members]], minlength=ncat)
+    users: list[set] = [set() for _ in range(ncat)]
+    recent_users: list[set] = [set() for _ in range(ncat)]
+    sellers = [i.seller for i in infos]
+    for ci, pos in zip(member_cat, member_lot):
+        user = sellers[pos]
+        if user:
+            users[ci].add(user)
+            if recent_flags[pos]:
+                recent_users[ci].add(user)
+    price = np.array(
+        [nan if i.price_value is None else i.price_value for i in infos], dtype=np.float64
+    )[members]
+    price_usd = np.array(
+        [nan if i.price_usd is None else i.price_usd for i in infos], dtype=np.float64
+    )[members]
+    typical, low, high = _group_median(groups, price, ncat)
+    typical_usd, _, _ = _group_median(groups, price_usd, ncat)
+    last = _group_last(groups, times[members], ncat)
+    centroids, counts = _group_centroids(
+        groups, members, [id_to_vec.get(i.id) for i in infos], ncat
+    )
+
+    def value(arr: np.ndarray, ci: int) -> float | None:
+        v = arr[ci]
+        return None if np.isnan(v) else float(v)
+
+    for cat, ci in cat_index.items():
+        stat = category_stats[cat] = {
+            "recent": int(recent_counts[ci]),
+            "users": users[ci],
+            "recent_users": recent_users[ci],
+        }
+        stat["price_typical"] = value(typical, ci)
+        stat["price_min"] = value(low, ci)
+        stat["price_max"] = value(high, ci)
+        stat["price_typical_usd"] = value(typical_usd, ci)
+        stat["last_dt"] = infos[member_lot[last[ci]]].dt if last[ci] >= 0 else None
+        stat["centroid"] = centroids[ci].tolist() if counts[ci] else None
 
     if not os.environ.get("ALLOW_EMPTY_POSTERS"):
         for cat, lots_list in categories.items():
@@ -412,6 +695,262 @@ def _categorise(
     return categories, category_stats, recent
 
 
+def _lang_digests(
+    langs: list[str],
+    fields: list[str],
+    rates: dict[str, float],
+    display_cur: str,
+    keep_days: int,
+) -> dict[str, str]:
+    """Return digest of the inputs shared by every page in each language.
+
+    Covers the templates, the compiled translation, this script itself and the
+    build settings so any of them changing invalidates all pages.
+    """
+    shared = build_cache.digest(
+        build_cache.tree_digest(TEMPLATES),
+        hashlib.sha256(Path(__file__).read_bytes()).hexdigest(),
+        langs,
+        fields,
+        rates,
+        display_cur,
+        keep_days,
+    )
+    return {
+        lang: build_cache.digest(
+            shared,
+            lang,
+            build_cache.file_stamp(LOCALE_DIR / lang / "LC_MESSAGES" / "messages.mo"),
+        )
+        for lang in langs
+    }
+
+
+def _lot_digest(
+    lot: dict,
+    similar: list[dict],
+    more_user: list[dict],
+    embedding,
+    lookup: dict[str, dict],
+) -> str:
+    """Return digest of everything a lot page is rendered from."""
+    neighbours = []
+    for item in list(similar) + list(more_user):
+        other = lookup.get(item["id"], {})
+        titles = {k: v for k, v in other.items() if k.startswith("title_")}
+        neighbours.append([item["id"], titles, (other.get("files") or [])[:1]])
+    captions = []
+    for rel in lot.get("files", []):
+        captions.append(caption_stamp(MEDIA_DIR / rel))
+    src = lot.get("source:path")
+    raw = build_cache.file_stamp(raw_post_path(src, RAW_DIR)) if src else None
+    vec = None
+    if embedding is not None:
+        vec = hashlib.sha256(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+    return build_cache.digest(lot, similar, more_user, neighbours, captions, raw, vec)
+
+
+# Render settings of the current process.  Pool workers fill it once in
+# ``_init_render`` so every task only carries the data of a single page.
+_RENDER_CTX: dict = {}
+
+
+def _init_render(
+    fields: list[str],
+    langs: list[str],
+    rates: dict[str, float],
+    display_cur: str,
+    envs: dict[str, Environment] | None = None,
+) -> None:
+    """Prepare ``_RENDER_CTX`` creating Jinja environments when not given."""
+    _RENDER_CTX.clear()
+    _RENDER_CTX.update(
+        fields=fields,
+        langs=langs,
+        rates=rates,
+        display_cur=display_cur,
+        envs=envs or {lang: _env_for_lang(lang) for lang in langs},
+    )
+
+
+def _render_lot_task(task: tuple) -> tuple[str, int, float, float]:
+    """Render one lot described by ``task`` with the process context.
+
+    Returns the template, page count, wall and CPU seconds for the profile.
+    """
+    lot, similar, more_user, embedding, lookup, render_langs = task
+    log.debug("Rendering", id=lot["_id"])
+    wall, cpu = time.perf_counter(), time.process_time()
+    build_page(
+        lot,
+        similar,
+        more_user,
+        _RENDER_CTX["fields"],
+        _RENDER_CTX["langs"],
+        embedding,
+        lookup,
+        _RENDER_CTX["rates"],
+        _RENDER_CTX["display_cur"],
+        _RENDER_CTX["envs"],
+        render_langs,
+    )
+    return (
+        "lot.html",
+        len(render_langs),
+        time.perf_counter() - wall,
+        time.process_time() - cpu,
+    )
+
+
+def _render_page_task(task: tuple) -> tuple[str, int, float, float]:
+    """Render a category or index page ``(template, lang, out, args)``.
+
+    Returns the template, page count, wall and CPU seconds for the profile.
+    """
+    template, lang, out, render_args = task
+    wall, cpu = time.perf_counter(), time.process_time()
+    tpl = _RENDER_CTX["envs"][lang].get_template(template)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(tpl.render(**render_args))
+    log.debug("Wrote", path=str(out))
+    return template, 1, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def _run_tasks(
+    func, tasks: list, pool, jobs: int, profile: BuildProfile | None = None
+) -> None:
+    """Run ``func`` over ``tasks`` in ``pool`` or inline when it is ``None``.
+
+    Template timings returned by the tasks are added to ``profile``.
+    """
+    if pool is None:
+        results = map(func, tasks)
+    else:
+        # Several chunks per worker keep the load balanced near the end.
+        chunk = max(1, len(tasks) // (jobs * 8))
+        results = pool.imap_unordered(func, tasks, chunksize=chunk)
+    for result in results:
+        if profile is not None:
+            profile.add_template(*result)
+
+
+def _neighbour_lookup(
+    similar: list[dict], more_user: list[dict], lookup: dict[str, dict]
+) -> dict[str, dict]:
+    """Return the part of ``lookup`` a lot page shows for its neighbours.
+
+    Only titles and the first file are used, which keeps the context sent to
+    worker processes small.
+    """
+    result: dict[str, dict] = {}
+    for item in list(similar) + list(more_user):
+        other = lookup.get(item["id"])
+        if other is None or item["id"] in result:
+            continue
+        entry = {k: v for k, v in other.items() if k.startswith("title_")}
+        entry["files"] = (other.get("files") or [])[:1]
+        result[item["id"]] = entry
+    return result
+
+
+def _category_pages(
+    deal: str,
+    lang: str,
+    langs: list[str],
+    lots: list[LotInfo],
+    rows: list[int | None],
+    page_size: int,
+    manifest: BuildManifest | None,
+    env: Environment,
+) -> list[tuple[str, dict]]:
+    """Return template and context of every page of category ``deal``.
+
+    ``lots`` are split into pages of ``page_size`` in their given order.  A
+    JSON index listing all pages is written next to the first one so
+    ``site.js`` can fetch the rest when it needs the whole category.
+    """
+    count = max(1, math.ceil(len(lots) / page_size))
+    paths = [_cat_page_path(deal, lang, n) for n in range(1, count + 1)]
+    index_path = _cat_index_path(deal, lang)
+    index = {
+        "count": len(lots),
+        "page_size": page_size,
+        "pages": [os.path.relpath(p, index_path.parent) for p in paths],
+    }
+    if manifest is None or not manifest.fresh(index_path, build_cache.digest(index)):
+        write_json(index_path, index)
+    pages = []
+    for number, out in enumerate(paths, 1):
+        page_dir = out.parent
+        start = (number - 1) * page_size
+        root = _root_prefix(page_dir)
+        items = [
+            {
+                "id": info.id,
+                "row": row,
+                "price_value": "" if info.price_value is None else info.price_value,
+                "cells": _place(_row_fragment(info, lang, langs, env), root),
+            }
+            for info, row in zip(lots[start : start + page_size], rows[start : start + page_size])
+        ]
+
+        def link(n: int) -> str | None:
+            return os.path.relpath(paths[n - 1], page_dir) if 1 <= n <= count else None
+
+        pages.append(
+            (
+                "category.html",
+                {
+                    "deal": deal,
+                    "items": items,
+                    "page": number,
+                    "page_count": count,
+                    "prev_link": link(number - 1),
+                    "next_link": link(number + 1),
+                    "page_index": os.path.relpath(index_path, page_dir),
+                },
+            )
+        )
+    return pages
+
+
+def _lot_task(
+    lot: dict,
+    sim_map,
+    more_user_map,
+    id_to_vec,
+    lookup,
+    langs: list[str],
+    lang_digests: dict[str, str],
+    manifest: BuildManifest | None,
+) -> tuple | None:
+    """Return the render task of ``lot`` or ``None`` when its pages are fresh."""
+    similar = sim_map.get(lot["_id"], [])
+    more_user = more_user_map.get(lot["_id"], [])
+    embedding = id_to_vec.get(lot["_id"])
+    render_langs = langs
+    if manifest is not None:
+        lot_digest = _lot_digest(lot, similar, more_user, embedding, lookup)
+        render_langs = [
+            lang
+            for lang in langs
+            if not manifest.fresh(
+                _lot_page_path(lot["_id"], lang),
+                build_cache.digest(lang_digests[lang], lot_digest),
+            )
+        ]
+        if not render_langs:
+            return None
+    return (
+        lot,
+        similar,
+        more_user,
+        embedding,
+        _neighbour_lookup(similar, more_user, lookup),
+        render_langs,
+    )
+
+
 def _render_site(
     lots: list[dict],
     fields: list[str],
@@ -420,38 +959,50 @@ def _render_site(
     keep_days: int,
     id_to_vec: dict[str, list[float]],
     lookup: dict[str, dict],
-    sim_map: dict[str, list[dict]],
-    more_user_map: dict[str, list[dict]],
-    categories: dict[str, list[dict]],
+    sim_map: NeighbourView | NeighbourTable,
+    more_user_map: NeighbourView | dict[str, list[dict]],
+    categories: dict[str, list[LotInfo]],
     category_stats: dict[str, dict],
     rates: dict[str, float],
     display_cur: str,
+    manifest: BuildManifest | None = None,
+    jobs: int = 1,
+    page_size: int = CATEGORY_PAGE_SIZE,
+    profile: BuildProfile | None = None,
+    render_prof: Path | None = None,
 ) -> None:
     """Render all HTML pages for ``lots`` using cached templates.
 
     ``envs`` supplies jinja environments for every language so they are
     initialised only once. ``rates`` maps currency codes to multipliers relative
     to USD.  The values are embedded into the pages so the front-end can
-    convert prices on the fly.
+    convert prices on the fly.  With a ``manifest`` pages whose input digest
+    did not change since the previous build are skipped.
+
+    Pages are collected as tasks first.  With ``jobs`` above one they are
+    rendered by a pool of forked workers, lot pages first and category and
+    index pages afterwards; every task writes its own file so the output is
+    identical to the serial build.  Categories list ``page_size`` lots per
+    page, newest first.  Lot cards and category rows are rendered once per
+    language into ``_FRAGMENTS`` and shared by every page listing the lot.
+
+    Rendering is timed per template into ``profile``.  With ``render_prof``
+    the render loop of this process runs under ``cProfile`` and the stats
+    are dumped there; use ``jobs=1`` to see the rendering itself.
     """
+    profile = profile or BuildProfile()
+    _FRAGMENTS.clear()
+    lang_digests = _lang_digests(langs, fields, rates, display_cur, keep_days)
+    lot_tasks = []
     for lot in lots:
-        log.debug("Rendering", id=lot["_id"])
-        build_page(
-            lot,
-            sim_map.get(lot["_id"], []),
-            more_user_map.get(lot["_id"], []),
-            fields,
-            langs,
-            id_to_vec.get(lot["_id"]),
-            lookup,
-            rates,
-            display_cur,
-            envs,
+        task = _lot_task(
+            lot, sim_map, more_user_map, id_to_vec, lookup, langs, lang_digests, manifest
         )
+        if task is not None:
+            lot_tasks.append(task)
 
-    log.debug("Writing category pages")
-    cat_tpls = {lang: envs[lang].get_template("category.html") for lang in langs}
-    subcat_tpls = {lang: envs[lang].get_template("category_index.html") for lang in langs}
+    log.debug("Collecting category pages")
+    page_tasks = []
     cat_dir = VIEWS_DIR / "deal"
     cat_dir.mkdir(parents=True, exist_ok=True)
     child_map: dict[str, list[str]] = {}
@@ -463,14 +1014,24 @@ def _render_site(
     for deal, lot_list in categories.items():
         lot_list_sorted = sorted(
             lot_list,
-            key=lambda x: get_timestamp(x) or datetime.min,
+            key=lambda x: x.dt or datetime.min,
             reverse=True,
         )
+        subcats = child_map.get(deal)
+        # Vectors go to one shard per category shared by every language.
+        if subcats:
+            shard_vectors = [category_stats.get(sub, {}).get("centroid") for sub in subcats]
+        else:
+            shard_vectors = [id_to_vec.get(info.id) for info in lot_list_sorted]
+        shard, shard_rows = _write_vector_shard(
+            VIEWS_DIR / "vectors" / "deal" / f"{_slug_component(deal)}.bin",
+            shard_vectors,
+            manifest,
+        )
         for lang in langs:
-            items_lang = []
-            subcats = child_map.get(deal)
             if subcats:
-                for sub in subcats:
+                items_lang = []
+                for sub, row in zip(subcats, shard_rows):
                     stat = category_stats.get(sub, {})
                     items_lang.append(
                         {
@@ -482,67 +1043,63 @@ def _render_site(
                             "price_value": stat.get("price_typical") or "",
                             "price_usd": stat.get("price_typical_usd"),
                             "dt": stat.get("last_dt"),
-                            "embed": _format_vector(stat.get("centroid")),
+                            "row": row,
                         }
                     )
-                tpl = subcat_tpls[lang]
-                render_args = {"deal": deal, "categories": items_lang}
+                pages = [("category_index.html", {"deal": deal, "categories": items_lang})]
             else:
-                for lot in lot_list_sorted:
-                    title = lot.get(f"title_{lang}") or next(
-                        (lot.get(f"title_{l}") for l in langs if lot.get(f"title_{l}")),
-                        lot.get("_id"),
-                    )
-                    seller = get_seller(lot)
-                    dt = get_timestamp(lot)
-                    items_lang.append(
-                        {
-                            "link": os.path.relpath(
-                                _lot_page_path(lot["_id"], lang),
-                                cat_dir,
-                            ),
-                            "title": title,
-                            "dt": dt,
-                            "price": lot.get("_display_price"),
-                            "price_class": lot.get("_price_class"),
-                            "price_value": lot.get("_display_value"),
-                            "price_usd": lot.get("_usd_value"),
-                            "seller": seller,
-                            "id": lot["_id"],
-                            "embed": _format_vector(id_to_vec.get(lot["_id"])),
-                        }
-                    )
-                tpl = cat_tpls[lang]
-                render_args = {"deal": deal, "items": items_lang}
-
-            out = _cat_page_path(deal, lang)
-            breadcrumbs = [
-                {"title": "Home", "link": os.path.relpath(VIEWS_DIR / f"index_{lang}.html", cat_dir)},
-                {"title": deal, "link": None},
-            ]
-            render_args.update(
-                {
-                    "langs": langs,
-                    "current_lang": lang,
-                    "page_basename": _slug_component(deal),
-                    "title": deal,
-                    "static_prefix": os.path.relpath(VIEWS_DIR / "static", cat_dir),
-                    "breadcrumbs": breadcrumbs,
-                    "rates": rates,
-                    "display_cur": display_cur,
-                    "keep_days": keep_days,
-                }
-            )
-            out.write_text(tpl.render(**render_args))
-            log.debug("Wrote", path=str(out))
+                pages = _category_pages(
+                    deal,
+                    lang,
+                    langs,
+                    lot_list_sorted,
+                    shard_rows,
+                    page_size,
+                    manifest,
+                    envs[lang],
+                )
 
-    log.debug("Writing index pages")
-    index_tpls = {lang: envs[lang].get_template("index.html") for lang in langs}
+            for number, (template, render_args) in enumerate(pages, 1):
+                out = _cat_page_path(deal, lang, number)
+                page_dir = out.parent
+                breadcrumbs = [
+                    {
+                        "title": "Home",
+                        "link": os.path.relpath(VIEWS_DIR / f"index_{lang}.html", page_dir),
+                    },
+                    {"title": deal, "link": None},
+                ]
+                render_args.update(
+                    {
+                        "langs": langs,
+                        "current_lang": lang,
+                        "page_basename": out.name[: -len(f"_{lang}.html")],
+                        "title": deal,
+                        "static_prefix": os.path.relpath(VIEWS_DIR / "static", page_dir),
+                        "breadcrumbs": breadcrumbs,
+                        "rates": rates,
+                        "display_cur": display_cur,
+                        "keep_days": keep_days,
+                        **_shard_args(shard, page_dir),
+                    }
+                )
+                if manifest is not None and manifest.fresh(
+                    out, build_cache.digest(lang_digests[lang], render_args)
+                ):
+                    continue
+                page_tasks.append((template, lang, out, render_args))
+
+    log.debug("Collecting index pages")
+    index_digests: dict[str, str] = {}
+    top_stats = [(deal, stat) for deal, stat in category_stats.items() if "." not in deal]
+    index_shard, index_rows = _write_vector_shard(
+        VIEWS_DIR / "vectors" / "index.bin",
+        [stat.get("centroid") for _, stat in top_stats],
+        manifest,
+    )
     for lang in langs:
         cats_lang = []
-        for deal, stat in category_stats.items():
-            if "." in deal:
-                continue
+        for (deal, stat), row in zip(top_stats, index_rows):
             cats_lang.append(
                 {
                     "link": os.path.relpath(_cat_page_path(deal, lang), VIEWS_DIR),
@@ -553,32 +1110,278 @@ def _render_site(
                     "price_value": stat.get("price_typical") or "",
                     "price_usd": stat.get("price_typical_usd"),
                     "dt": stat.get("last_dt"),
-                    "embed": _format_vector(stat.get("centroid")),
+                    "row": row,
                 }
             )
         out = VIEWS_DIR / f"index_{lang}.html"
         breadcrumbs = [{"title": "Home", "link": f"index_{lang}.html"}]
-        out.write_text(
-            index_tpls[lang].render(
-                categories=cats_lang,
-                langs=langs,
-                current_lang=lang,
-                page_basename="index",
-                title="Index",
-                static_prefix=os.path.relpath(VIEWS_DIR / "static", VIEWS_DIR),
-                breadcrumbs=breadcrumbs,
-                keep_days=keep_days,
-                rates=rates,
-                display_cur=display_cur,
-            )
+        render_args = {
+            "categories": cats_lang,
+            "langs": langs,
+            "current_lang": lang,
+            "page_basename": "index",
+            "title": "Index",
+            "static_prefix": os.path.relpath(VIEWS_DIR / "static", VIEWS_DIR),
+            "breadcrumbs": breadcrumbs,
+            "keep_days": keep_days,
+            "rates": rates,
+            "display_cur": display_cur,
+            **_shard_args(index_shard, VIEWS_DIR),
+        }
+        index_digests[lang] = build_cache.digest(lang_digests[lang], render_args)
+        if manifest is not None and manifest.fresh(out, index_digests[lang]):
+            continue
+        page_tasks.append(("index.html", lang, out, render_args))
+
+    log.info("Rendering pages", lots=len(lot_tasks), pages=len(page_tasks), jobs=jobs)
+    _init_render(fields, langs, rates, display_cur, envs)
+    pool = None
+    if jobs > 1 and len(lot_tasks) + len(page_tasks) > 1:
+        pool = multiprocessing.get_context("fork").Pool(
+            jobs, initializer=_init_render, initargs=(fields, langs, rates, display_cur)
         )
-        log.debug("Wrote", path=str(out))
+    profiler = cProfile.Profile() if render_prof is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with profile.phase("render_lot_pages") as rec:
+            rec["items"] = len(lot_tasks)
+            _run_tasks(_render_lot_task, lot_tasks, pool, jobs, profile)
+        with profile.phase("render_other_pages") as rec:
+            rec["items"] = len(page_tasks)
+            _run_tasks(_render_page_task, page_tasks, pool, jobs, profile)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(str(render_prof))
+            log.info("Render profile written", path=str(render_prof))
+        if pool is not None:
+            pool.close()
+            pool.join()
+
     if langs:
         default = VIEWS_DIR / "index.html"
         src = VIEWS_DIR / f"index_{langs[0]}.html"
-        default.write_text(src.read_text())
-        log.debug("Wrote", path=str(default))
+        if manifest is None or not manifest.fresh(default, index_digests[langs[0]]):
+            default.write_text(src.read_text())
+            log.debug("Wrote", path=str(default))
+
+
+class _LotSummaries:
+    """Titles and first image of every lot, standing in for ``lookup``.
+
+    Lot pages only show these for their neighbours, and category pages only
+    show titles.  Streaming builds keep them as tuples instead of the full lot
+    dicts.  :meth:`get` returns the same keys the page digest and the cards
+    read from a lot.
+    """
+
+    __slots__ = ("_rows",)
+
+    def __init__(self) -> None:
+        self._rows: dict[str, tuple[tuple, str | None]] = {}
+
+    def add(self, lot: dict) -> dict:
+        """Record ``lot`` and return its slim ``{"_id", "title_*"}`` dict."""
+        titles = tuple((k, v) for k, v in lot.items() if k.startswith("title_"))
+        files = lot.get("files") or []
+        self._rows[lot["_id"]] = (titles, files[0] if files else None)
+        return {"_id": lot["_id"], **dict(titles)}
 
+    def get(self, lot_id: str, default=None) -> dict | None:
+        row = self._rows.get(lot_id)
+        if row is None:
+            return default
+        titles, thumb = row
+        entry = dict(titles)
+        entry["files"] = [thumb] if thumb is not None else []
+        return entry
+
+    def __contains__(self, lot_id: object) -> bool:
+        return lot_id in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def _stream_lot_files(
+    embeddings: dict,
+    official_rates: dict[str, float],
+    price_model: tuple,
+    rates: dict[str, float],
+    display_cur: str,
+) -> Iterator[list[dict]]:
+    """Yield the publishable lots of one lot file at a time, ready to render.
+
+    Lots pass the same moderation, embedding and price steps as in a full
+    load.  ``price_model`` is the cached ``(model, currency_map, counts)``.
+    Without a model no AI prices are predicted.
+    """
+    model, cur_map, counts = price_model
+    for records in LotStore(LOTS_DIR, RAW_DIR).iter_files():
+        lots = [
+            lot
+            for lot in map(_lot_from_record, records)
+            if lot is not None and lot["_id"] in embeddings
+        ]
+        if not lots:
+            continue
+        if model is not None:
+            apply_price_model(lots, embeddings, official_rates, model, cur_map, counts)
+        prepare_price_fields(lots, rates, display_cur)
+        yield lots
+
+
+def _restream_lot_files(
+    infos: dict[str, LotInfo], ai_prices: dict[str, tuple]
+) -> Iterator[list[dict]]:
+    """Yield the lots :func:`_stream_lot_files` accepted, one file at a time.
+
+    Moderation and the price model do not run again.  Lots missing from
+    ``infos`` are skipped and the price fields are restored from the first
+    pass: ``ai_prices`` holds ``(ai_price, currency)`` of every lot the model
+    priced and the display fields come from its :class:`LotInfo`.
+    """
+    for records in LotStore(LOTS_DIR, RAW_DIR).iter_files(moderate=False):
+        lots = []
+        for rec in records:
+            info = infos.get(rec.id)
+            if info is None:
+                continue
+            lot = _lot_from_record(rec)
+            if rec.id in ai_prices:
+                lot["ai_price"], currency = ai_prices[rec.id]
+                if currency is not None:
+                    lot["price:currency"] = currency
+            lot["_display_price"] = info.price
+            lot["_price_class"] = info.price_class
+            lot["_display_value"] = "" if info.price_value is None else info.price_value
+            if info.price_usd is not None:
+                lot["_usd_value"] = info.price_usd
+            lots.append(lot)
+        if lots:
+            yield lots
+
+
+def _stream_lot_pages(
+    langs: list[str],
+    keep_days: int,
+    display_cur: str,
+    envs: dict[str, Environment],
+    manifest: BuildManifest | None,
+    jobs: int,
+    profile: BuildProfile,
+    search: SearchIndex | None = None,
+) -> tuple:
+    """Render lot pages reading lot files one at a time.
+
+    The first pass keeps only :class:`_LotSummaries`, slim
+    :class:`LotInfo` records for the category aggregates, image paths and
+    the AI prices.  The second pass reads the files again, see
+    :func:`_restream_lot_files`, and renders their lots in batches of
+    ``STREAM_BATCH``.  Lots are added to ``search`` during the first pass.
+    Returns the fields, embeddings, summaries, neighbour caches, categories,
+    category stats and rates that :func:`_render_site` needs for the
+    remaining pages.
+    """
+    with profile.phase("load_ontology") as rec:
+        fields = _load_ontology()
+        rec["items"] = len(fields)
+    with profile.phase("load_embeddings") as rec:
+        embeddings = _load_embeddings()
+        rec["items"] = len(embeddings)
+    with profile.phase("open_neighbour_caches"):
+        sim_map, more_user_map = _open_neighbour_caches()
+    with profile.phase("load_clusters") as rec:
+        clusters = _load_clusters()
+        rec["items"] = len(clusters)
+    with profile.phase("fetch_rates"):
+        official_rates = fetch_official_rates()
+    price_model = load_price_model(MODEL_FILE, projection_digest(EMBED_DIR))
+    if price_model[0] is None:
+        log.warning("No cached price model, streaming build skips AI prices")
+        ai_rates = {}
+    else:
+        ai_rates = apply_price_model([], embeddings, official_rates, *price_model)
+    rates = official_rates or ai_rates
+
+    summaries = _LotSummaries()
+    infos: list[LotInfo] = []
+    ai_prices: dict[str, tuple] = {}
+    rels: set[str] = set()
+    with profile.phase("scan_lots") as rec:
+        for lots in _stream_lot_files(
+            embeddings, official_rates, price_model, rates, display_cur
+        ):
+            for lot in lots:
+                rels.update(lot.get("files", []))
+                if "ai_price" in lot:
+                    ai_prices[lot["_id"]] = (lot["ai_price"], lot.get("price:currency"))
+                info = LotInfo(lot, len(infos))
+                info.lot = summaries.add(lot)
+                infos.append(info)
+                if search is not None:
+                    search.add(lot, _lot_page_base(lot["_id"]).as_posix())
+        rec["items"] = len(infos)
+    log.info("Scanned lots", count=len(infos))
+    with profile.phase("copy_images") as rec:
+        rec.update(sync_media(MEDIA_DIR, VIEWS_DIR / "media", rels))
+    del rels
+    with profile.phase("categorise") as rec:
+        categories, category_stats, _recent = _categorise(
+            infos, langs, keep_days, embeddings, clusters
+        )
+        rec["items"] = len(categories)
+
+    lang_digests = _lang_digests(langs, fields, rates, display_cur, keep_days)
+    _FRAGMENTS.clear()
+    _init_render(fields, langs, rates, display_cur, envs)
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.get_context("fork").Pool(
+            jobs, initializer=_init_render, initargs=(fields, langs, rates, display_cur)
+        )
+    try:
+        with profile.phase("stream_lot_pages") as rec:
+            batch: list[tuple] = []
+            rendered = 0
+            for lots in _restream_lot_files({i.id: i for i in infos}, ai_prices):
+                for lot in lots:
+                    task = _lot_task(
+                        lot,
+                        sim_map,
+                        more_user_map,
+                        embeddings,
+                        summaries,
+                        langs,
+                        lang_digests,
+                        manifest,
+                    )
+                    if task is not None:
+                        batch.append(task)
+                if len(batch) >= STREAM_BATCH:
+                    _run_tasks(_render_lot_task, batch, pool, jobs, profile)
+                    rendered += len(batch)
+                    batch = []
+                    # Captions of a batch are not needed by the next one.
+                    clear_caption_cache()
+            _run_tasks(_render_lot_task, batch, pool, jobs, profile)
+            rec["items"] = rendered + len(batch)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    log.info("Streamed lot pages", rendered=rec["items"])
+    return (
+        fields,
+        embeddings,
+        summaries,
+        sim_map,
+        more_user_map,
+        categories,
+        category_stats,
+        rates,
+    )
 
 
 def build_page(
@@ -592,20 +1395,26 @@ def build_page(
     rates: dict[str, float],
     display_cur: str,
     envs: dict[str, Environment],
+    render_langs: list[str] | None = None,
 ) -> None:
     """Render ``lot`` into separate HTML files for every language.
 
     ``rates`` provides currency multipliers used by the front-end for dynamic
     conversion. ``envs`` preloads jinja environments to avoid expensive
-    reinitialisation for each page.
+    reinitialisation for each page.  ``render_langs`` limits which language
+    versions are written, e.g. when the others are up to date.
     """
+    files = lot.get("files", [])
+    captions = [read_captions(MEDIA_DIR / rel, langs) for rel in files]
     for lang in langs:
+        if render_langs is not None and lang not in render_langs:
+            continue
+        out = _lot_page_path(lot["_id"], lang)
         env = envs[lang]
-        images = []
-        for rel in lot.get("files", []):
-            p = MEDIA_DIR / rel
-            caption = read_caption(p, lang)
-            images.append({"path": rel, "caption": caption})
+        images = [
+            {"path": rel, "caption": caps.get(lang, "")}
+            for rel, caps in zip(files, captions)
+        ]
 
         # Drop internal helper fields that are meaningless to end users.
         attrs = {
@@ -633,65 +1442,24 @@ def build_page(
             del sorted_attrs["timestamp"]
 
         # Show the original message text for context if available.
-        orig_text = ""
-        src = lot.get("source:path")
-        if src:
-            _, orig_text = read_post(raw_post_path(src, RAW_DIR))
+        orig_text = lot.get("_orig_text", "")
 
         chat = lot.get("source:chat")
         mid = lot.get("source:message_id")
         tg_link = f"https://t.me/{chat}/{mid}" if chat and mid else ""
 
         template = env.get_template("lot.html")
-        out = _lot_page_path(lot["_id"], lang)
         out.parent.mkdir(parents=True, exist_ok=True)
 
-        page_similar = []
-        for item in similar:
-            other = lookup.get(item["id"], {})
-            title = (
-                other.get(f"title_{lang}")
-                or other.get("title_en")
-                or next(
-                    (other.get(f"title_{l}") for l in langs if other.get(f"title_{l}")),
-                    item["id"],
-                )
-            )
-            files = other.get("files") or []
-            thumb = files[0] if files else ""
-            page_similar.append(
-                {
-                    "link": os.path.relpath(
-                        _lot_page_path(item["id"], lang),
-                        out.parent,
-                    ),
-                    "title": title,
-                    "thumb": thumb,
-                }
-            )
-        page_user = []
-        for item in more_user:
-            other = lookup.get(item["id"], {})
-            title = (
-                other.get(f"title_{lang}")
-                or other.get("title_en")
-                or next(
-                    (other.get(f"title_{l}") for l in langs if other.get(f"title_{l}")),
-                    item["id"],
-                )
-            )
-            files = other.get("files") or []
-            thumb = files[0] if files else ""
-            page_user.append(
-                {
-                    "link": os.path.relpath(
-                        _lot_page_path(item["id"], lang),
-                        out.parent,
-                    ),
-                    "title": title,
-                    "thumb": thumb,
-                }
-            )
+        root = _root_prefix(out.parent)
+        page_similar = [
+            _place(_card_fragment(item["id"], lookup.get(item["id"], {}), lang, langs, env), root)
+            for item in similar
+        ]
+        page_user = [
+            _place(_card_fragment(item["id"], lookup.get(item["id"], {}), lang, langs, env), root)
+            for item in more_user
+        ]
         static_prefix = os.path.relpath(VIEWS_DIR / "static", out.parent)
         media_prefix = os.path.relpath(VIEWS_DIR / "media", out.parent)
         home_link = os.path.relpath(VIEWS_DIR / f"index_{lang}.html", out.parent)
@@ -707,7 +1475,7 @@ def build_page(
             )
             breadcrumbs.append({"title": deal, "link": cat_link})
         breadcrumbs.append({"title": lot.get(f"title_{lang}") or lot['_id'], "link": None})
-        embed_str = _format_vector(embedding)
+        embed_str = _encode_vector(embedding)
         out.write_text(
             template.render(
                 title=lot.get(f"title_{lang}", "Lot"),
@@ -733,59 +1501,163 @@ def build_page(
         log.debug("Wrote", path=str(out))
 
 
-def main() -> None:
-    """Build the static site under ``VIEWS_DIR``."""
-    log.info("Building site")
+def main(argv: list[str] | None = None) -> None:
+    """Build the static site under ``VIEWS_DIR``.
+
+    Pages are rebuilt incrementally: only outputs whose input digest changed
+    are rendered and outputs of vanished lots are removed.  ``--full`` wipes
+    ``VIEWS_DIR`` and renders everything.  ``--stream`` renders lot pages file
+    by file instead of loading every lot first, see :func:`_stream_lot_pages`.
+    A static search index is written alongside, see :mod:`search_index`.
+    """
+    parser = argparse.ArgumentParser(description="Render the static site")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Delete previous output and render every page",
+    )
+    parser.add_argument(
+        "--compile-templates",
+        action="store_true",
+        help="Precompile templates into Python modules before rendering",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Render pages in this many worker processes",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Render lot pages file by file to bound memory use",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Write per-phase timings to data/{PROFILE_NAME}",
+    )
+    parser.add_argument(
+        "--profile-render",
+        action="store_true",
+        help=f"Also dump cProfile stats of the render loop to data/{RENDER_PROF_NAME}",
+    )
+    args = parser.parse_args(argv)
+
+    log.info("Building site", full=args.full)
     cfg = load_config()
     langs = getattr(cfg, "LANGS", ["en"])
     keep_days = getattr(cfg, "KEEP_DAYS", 7)
     display_cur = canonical_currency(getattr(cfg, "DISPLAY_CURRENCY", "USD")) or "USD"
-    envs = {lang: _env_for_lang(lang) for lang in langs}
+    page_size = getattr(cfg, "CATEGORY_PAGE_SIZE", CATEGORY_PAGE_SIZE)
+    profile = BuildProfile()
+    if args.full and VIEWS_DIR.exists():
+        shutil.rmtree(VIEWS_DIR)
+    with profile.phase("templates") as rec:
+        if args.compile_templates:
+            compile_templates()
+        envs = {lang: _env_for_lang(lang) for lang in langs}
+        rec["items"] = len(envs)
     VIEWS_DIR.mkdir(parents=True, exist_ok=True)
-
-    _copy_static()
-    fields, embeddings, lots, sim_map, more_user_map, clusters = _load_state()
-    lots, embeddings = _sync_embeddings(lots, embeddings)
-
-    id_to_vec = {lot["_id"]: embeddings.get(lot["_id"]) for lot in lots}
-    lookup = {lot["_id"]: lot for lot in lots}
-
-    rates_official = fetch_official_rates()
-    model, cur_map, counts = load_price_model(MODEL_FILE)
-    ai_rates = apply_price_model(
-        lots,
-        id_to_vec,
-        rates_official,
-        model,
-        cur_map,
-        counts,
-    )
-
-    if rates_official:
-        use_rates = rates_official
+    manifest = BuildManifest(VIEWS_DIR, full=args.full)
+    search = SearchIndex(langs)
+
+    with profile.phase("copy_static"):
+        _copy_static()
+    _FRAGMENTS.limit = STREAM_FRAGMENTS if args.stream else None
+    if args.stream:
+        lots = []
+        (
+            fields,
+            id_to_vec,
+            lookup,
+            sim_map,
+            more_user_map,
+            categories,
+            category_stats,
+            use_rates,
+        ) = _stream_lot_pages(
+            langs, keep_days, display_cur, envs, manifest, args.jobs, profile, search
+        )
     else:
-        use_rates = ai_rates
-    prepare_price_fields(lots, use_rates, display_cur)
+        fields, embeddings, lots, sim_map, more_user_map, clusters = _load_state(profile)
+        with profile.phase("sync_embeddings") as rec:
+            lots, embeddings = _sync_embeddings(lots, embeddings)
+            rec["items"] = len(lots)
+
+        id_to_vec = {lot["_id"]: embeddings.get(lot["_id"]) for lot in lots}
+        lookup = {lot["_id"]: lot for lot in lots}
+
+        with profile.phase("fetch_rates"):
+            rates_official = fetch_official_rates()
+        with profile.phase("apply_price_model") as rec:
+            model, cur_map, counts = load_price_model(
+                MODEL_FILE, projection_digest(EMBED_DIR)
+            )
+            ai_rates = apply_price_model(
+                lots,
+                id_to_vec,
+                rates_official,
+                model,
+                cur_map,
+                counts,
+            )
+            rec["items"] = len(lots)
 
-    categories, category_stats, _recent = _categorise(
-        lots, langs, keep_days, id_to_vec, clusters
-    )
+        if rates_official:
+            use_rates = rates_official
+        else:
+            use_rates = ai_rates
+        with profile.phase("prepare_prices") as rec:
+            prepare_price_fields(lots, use_rates, display_cur)
+            rec["items"] = len(lots)
+        with profile.phase("index_search") as rec:
+            for lot in lots:
+                search.add(lot, _lot_page_base(lot["_id"]).as_posix())
+            rec["items"] = len(search)
+
+        with profile.phase("categorise") as rec:
+            infos = [LotInfo(lot, row) for row, lot in enumerate(lots)]
+            categories, category_stats, _recent = _categorise(
+                infos, langs, keep_days, id_to_vec, clusters
+            )
+            rec["items"] = len(categories)
 
-    _render_site(
-        lots,
-        fields,
-        langs,
-        envs,
-        keep_days,
-        id_to_vec,
-        lookup,
-        sim_map,
-        more_user_map,
-        categories,
-        category_stats,
-        use_rates,
-        display_cur,
-    )
+    try:
+        with profile.phase("render_site"):
+            _render_site(
+                lots,
+                fields,
+                langs,
+                envs,
+                keep_days,
+                id_to_vec,
+                lookup,
+                sim_map,
+                more_user_map,
+                categories,
+                category_stats,
+                use_rates,
+                display_cur,
+                manifest,
+                args.jobs,
+                page_size,
+                profile,
+                VIEWS_DIR.parent / RENDER_PROF_NAME if args.profile_render else None,
+            )
+    finally:
+        _close_neighbour_caches(sim_map, more_user_map)
+    with profile.phase("search_index") as rec:
+        rec.update(search.write(VIEWS_DIR, manifest))
+    with profile.phase("save_manifest") as rec:
+        manifest.save()
+        rec.update(rendered=manifest.rendered, skipped=manifest.skipped)
+    with profile.phase("precompress") as rec:
+        rec.update(precompress(VIEWS_DIR))
+    with profile.phase("content_manifest") as rec:
+        rec["items"] = len(update_content_manifest(VIEWS_DIR))
+    if args.profile or args.profile_render:
+        profile.write(VIEWS_DIR.parent / PROFILE_NAME)
 
     log.info("Site build complete")
 
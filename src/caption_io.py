@@ -1,5 +1,6 @@
 """Helpers for translated caption files stored beside images."""
 
+from collections import OrderedDict
 from pathlib import Path
 
 from config_utils import load_config
@@ -13,6 +14,13 @@ LEGACY_SUFFIX = ".caption.md"
 
 log = get_logger().bind(module=__name__)
 
+# Images whose parsed captions are kept, least recently used dropped first.
+CACHE_SIZE = 1024
+
+# Parsed captions keyed by image path together with the stamps of the caption
+# files they were read from.  A changed stamp invalidates the entry.
+_CACHE: "OrderedDict[Path, tuple[tuple, dict[str, str] | None, str]]" = OrderedDict()
+
 
 def _get_langs() -> list[str]:
     """Return configured languages, caching the result."""
@@ -38,20 +46,77 @@ def has_caption(image: Path) -> bool:
     return caption_json_path(image).exists() or caption_md_path(image).exists()
 
 
+def _stamp(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def caption_stamp(image: Path) -> tuple:
+    """Return ``(mtime_ns, size)`` of both caption files of ``image``.
+
+    Missing files are ``None``.  The value changes whenever a caption does.
+    """
+    return _stamp(caption_json_path(image)), _stamp(caption_md_path(image))
+
+
+def _load(image: Path) -> tuple[dict[str, str] | None, str]:
+    """Return cached per-language captions and legacy text of ``image``.
+
+    Captions are ``None`` when only the legacy Markdown file applies.
+    """
+    stamp = caption_stamp(image)
+    hit = _CACHE.get(image)
+    if hit is not None and hit[0] == stamp:
+        _CACHE.move_to_end(image)
+        return hit[1], hit[2]
+    captions: dict[str, str] | None = {}
+    legacy = ""
+    data = load_json(caption_json_path(image)) if stamp[0] else None
+    if isinstance(data, dict):
+        for key, text in data.items():
+            if key.startswith("caption_") and isinstance(text, str):
+                if text and not text.endswith("\n"):
+                    text += "\n"
+                captions[key[len("caption_") :]] = text
+    else:
+        # Only consult the legacy Markdown file without a JSON caption.
+        captions = None
+        legacy = read_md(caption_md_path(image)) if stamp[1] else ""
+    _CACHE[image] = (stamp, captions, legacy)
+    _CACHE.move_to_end(image)
+    while len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return captions, legacy
+
+
+def read_captions(image: Path, langs: list[str] | None = None) -> dict[str, str]:
+    """Return captions for ``image`` keyed by each of ``langs``.
+
+    ``langs`` defaults to the configured languages.  The caption file is
+    parsed once and reused until it changes on disk.
+    """
+    captions, legacy = _load(image)
+    langs = langs or _get_langs()
+    if captions is None:
+        return {lang: legacy for lang in langs}
+    return {lang: captions.get(lang, "") for lang in langs}
+
+
 def read_caption(image: Path, lang: str | None = None) -> str:
     """Return caption for ``image`` in ``lang`` or empty string when missing."""
-    langs = _get_langs()
-    lang = lang or langs[0]
-    json_path = caption_json_path(image)
-    if json_path.exists():
-        data = load_json(json_path)
-        if isinstance(data, dict):
-            key = f"caption_{lang}"
-            text = data.get(key, "")
-            if text and not text.endswith("\n"):
-                text += "\n"
-            return text
-    return read_md(caption_md_path(image))
+    lang = lang or _get_langs()[0]
+    captions, legacy = _load(image)
+    if captions is None:
+        return legacy
+    return captions.get(lang, "")
+
+
+def clear_caption_cache() -> None:
+    """Forget all parsed captions."""
+    _CACHE.clear()
 
 
 def write_caption(image: Path, text: str, lang: str | None = None) -> None:
@@ -66,5 +131,6 @@ def write_caption(image: Path, text: str, lang: str | None = None) -> None:
             data.update(prev)
     data[f"caption_{lang}"] = text
     write_json(path, data)
+    _CACHE.pop(image, None)
     log.debug("Wrote caption", path=str(path))
 
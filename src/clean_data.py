@@ -13,6 +13,7 @@ from oom_utils import prefer_oom_kill
 from lot_io import read_lots, needs_cleanup
 from post_io import raw_post_path, RAW_DIR
 from caption_io import has_caption
+from embed_io import has_store, migrate
 
 log = get_logger().bind(script=__file__)
 install_excepthook(log)
@@ -111,6 +112,9 @@ def _clean_embeddings() -> None:
             count += 1
     if count:
         log.info("Removed orphan embeddings", count=count)
+        if has_store(EMBED_DIR):
+            # Drop rows of deleted files from the binary store as well.
+            migrate(EMBED_DIR)
 
 
 def _remove_empty_dirs(root: Path) -> None:
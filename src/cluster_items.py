@@ -9,9 +9,10 @@ import numpy as np
 
 from log_utils import get_logger, install_excepthook
 from oom_utils import prefer_oom_kill
-from lot_io import iter_lot_files, read_lots, make_lot_id, embedding_path
-from similar_utils import _cos_sim
-from notes_utils import write_json, load_json
+from lot_io import LotStore
+from similar_utils import _load_embeddings
+from knn_utils import normalise, topk_cosine
+from notes_utils import write_json
 
 from sklearn.cluster import KMeans
 
@@ -21,48 +22,40 @@ LOTS_DIR = Path("data/lots")
 OUTPUT_FILE = Path("data/item_clusters.json")
 
 
-def _iter_items() -> Iterable[tuple[str, str, np.ndarray]]:
+def _iter_items(
+    id_to_vec: dict[str, np.ndarray],
+) -> Iterable[tuple[str, str, np.ndarray]]:
     """Yield ``(id, item:type, embedding)`` for ``sell_item`` lots.
 
-    Embeddings are loaded on demand so memory usage stays minimal.
+    ``id_to_vec`` comes from :func:`similar_utils._load_embeddings` so the
+    vectors are memmap rows of the binary store, already projected when
+    ``embed_reduce`` saved a projection.
     """
-    for path in iter_lot_files(LOTS_DIR):
-        lots = read_lots(path)
-        if not lots:
+    for rec in LotStore(LOTS_DIR).load(posts=False):
+        lot = rec.lot
+        if lot.get("market:deal") != "sell_item":
             continue
-        rel = path.relative_to(LOTS_DIR)
-        epath = embedding_path(path)
-        embeds = load_json(epath) or []
-        embed_map = {}
-        if isinstance(embeds, dict) and "id" in embeds and "vec" in embeds:
-            embed_map[str(embeds["id"])] = np.asarray(embeds["vec"], dtype=np.float32)
-        elif isinstance(embeds, list):
-            for item in embeds:
-                if isinstance(item, dict) and "id" in item and "vec" in item:
-                    embed_map[str(item["id"])] = np.asarray(item["vec"], dtype=np.float32)
-        for idx, lot in enumerate(lots):
-            if lot.get("market:deal") != "sell_item":
-                continue
-            itype = lot.get("item:type")
-            if isinstance(itype, list):
-                itype = itype[0] if itype else None
-            if not isinstance(itype, str) or not itype:
-                continue
-            lot_id = make_lot_id(rel, idx)
-            vec = embed_map.get(lot_id)
-            if vec is None:
-                continue
-            yield lot_id, itype, vec
-
-
-def _collect_category_vectors() -> Dict[str, np.ndarray]:
+        itype = lot.get("item:type")
+        if isinstance(itype, list):
+            itype = itype[0] if itype else None
+        if not isinstance(itype, str) or not itype:
+            continue
+        vec = id_to_vec.get(rec.id)
+        if vec is None:
+            continue
+        yield rec.id, itype, vec
+
+
+def _collect_category_vectors(
+    id_to_vec: dict[str, np.ndarray],
+) -> Dict[str, np.ndarray]:
     """Return mean embedding for every ``item:type``.
 
-    Embeddings are streamed from disk so memory use stays manageable.
+    Rows are read from the memory mapped store so memory use stays manageable.
     """
     sums: Dict[str, np.ndarray] = {}
     counts: Dict[str, int] = defaultdict(int)
-    for _, itype, vec in _iter_items():
+    for _, itype, vec in _iter_items(id_to_vec):
         if itype not in sums:
             sums[itype] = np.zeros(len(vec), dtype=np.float32)
         sums[itype] += vec
@@ -78,7 +71,8 @@ def collect_clusters() -> dict[str, list[str]]:
     square root heuristic.
     """
 
-    cat_vecs = _collect_category_vectors()
+    id_to_vec = _load_embeddings()
+    cat_vecs = _collect_category_vectors(id_to_vec)
     if not cat_vecs:
         return {}
 
@@ -88,7 +82,7 @@ def collect_clusters() -> dict[str, list[str]]:
     n_clusters = max(1, round(math.sqrt(len(types))))
 
     counts = {t: 0 for t in types}
-    for _, itype, _ in _iter_items():
+    for _, itype, _ in _iter_items(id_to_vec):
         counts[itype] += 1
 
     top_types = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:n_clusters]
@@ -106,13 +100,15 @@ def collect_clusters() -> dict[str, list[str]]:
     for t, lab in zip(types, km.labels_):
         grouped[int(lab)].append(t)
 
+    # Rank members of every cluster by closeness to its centre in one pass.
+    unit = normalise(vectors)
+    row_of = {t: i for i, t in enumerate(types)}
     result: dict[str, list[str]] = {}
     for lab, names in grouped.items():
-        centroid = km.cluster_centers_[lab]
-        scores = []
-        for t in names:
-            sim = _cos_sim(cat_vecs[t], centroid)
-            scores.append((sim, t))
+        centroid = normalise(km.cluster_centers_[lab])
+        rows = [row_of[t] for t in names]
+        dist, neigh = topk_cosine(centroid, unit[rows], len(rows))
+        scores = [(1.0 - float(d), names[j]) for d, j in zip(dist[0], neigh[0])]
         scores.sort(reverse=True)
         cname = " ".join(t for _, t in scores)
         result[cname] = names
@@ -0,0 +1,105 @@
+"""Upload the built site, sending only files changed since the last deploy.
+
+``build_site.py`` leaves ``data/views_manifest.json`` with a content hash of
+every published file.  After a successful upload that manifest is copied to
+``data/deployed_manifest.json``.  The next run compares both and passes just
+the changed and removed paths to ``rsync --files-from``.  Removed paths are
+deleted on the server through ``--delete-missing-args``.  When no previous
+deploy is recorded, or with ``--full``, the whole tree is synchronised like
+before.
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import subprocess
+from pathlib import Path
+
+from log_utils import get_logger, install_excepthook
+from notes_utils import load_json
+from site_publish import content_manifest_path, update_content_manifest
+
+log = get_logger().bind(script=__file__)
+install_excepthook(log)
+
+VIEWS_DIR = Path("data/views")
+DEPLOYED_NAME = "deployed_manifest.json"
+
+SSH = "ssh -T -c aes128-ctr -o Compression=no"
+RSYNC = [
+    "rsync",
+    "-aH",
+    "-zz",
+    "--compress-choice=zstd",
+    "--compress-level=3",
+    "--omit-dir-times",
+    "--omit-link-times",
+    "--info=stats2,progress2",
+    "-e",
+    SSH,
+]
+
+
+def deployed_manifest_path(views_dir: Path) -> Path:
+    """Return where the manifest of the last deploy is kept."""
+    return views_dir.parent / DEPLOYED_NAME
+
+
+def diff_manifests(current: dict, deployed: dict) -> tuple[list[str], list[str]]:
+    """Return paths that changed or appeared and paths that were removed."""
+    changed = sorted(
+        rel
+        for rel, entry in current.items()
+        if (deployed.get(rel) or {}).get("hash") != entry.get("hash")
+    )
+    removed = sorted(set(deployed) - set(current))
+    return changed, removed
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Deploy data/views incrementally")
+    parser.add_argument("dest", help="rsync destination, e.g. host:/srv/www/site/")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Synchronise the whole tree and delete unknown remote files",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only log what would be sent")
+    args = parser.parse_args(argv)
+
+    current_path = content_manifest_path(VIEWS_DIR)
+    if current_path.exists():
+        current = load_json(current_path)
+    else:
+        current = update_content_manifest(VIEWS_DIR)
+    deployed_path = deployed_manifest_path(VIEWS_DIR)
+    deployed = None if args.full or not deployed_path.exists() else load_json(deployed_path)
+
+    if deployed is None:
+        log.info("Full deploy", files=len(current))
+        cmd = RSYNC + ["--delete-before", f"{VIEWS_DIR}/", args.dest]
+        files = None
+    else:
+        changed, removed = diff_manifests(current, deployed)
+        log.info("Delta deploy", changed=len(changed), removed=len(removed))
+        if not changed and not removed:
+            return
+        cmd = RSYNC + [
+            "--files-from=-",
+            "--from0",
+            "--delete-missing-args",
+            f"{VIEWS_DIR}/",
+            args.dest,
+        ]
+        files = "\0".join(changed + removed).encode("utf-8")
+    if args.dry_run:
+        log.info("Dry run", cmd=cmd)
+        return
+    subprocess.run(cmd, input=files, check=True)
+    shutil.copyfile(current_path, deployed_path)
+    log.info("Deploy complete")
+
+
+if __name__ == "__main__":
+    main()
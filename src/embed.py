@@ -1,4 +1,8 @@
-"""Generate embeddings for lots and store them as JSON files."""
+"""Generate embeddings for lots and store them as JSON files.
+
+Every batch is also appended to the binary store from ``embed_io`` so readers
+can memory-map all vectors instead of parsing the JSON files.
+"""
 
 from pathlib import Path
 
@@ -15,6 +19,7 @@ from oom_utils import prefer_oom_kill
 from token_utils import estimate_tokens
 from notes_utils import write_json
 from lot_io import read_lots, make_lot_id
+from embed_io import append_vectors
 import json
 
 log = get_logger().bind(script=__file__)
@@ -68,6 +73,7 @@ def embed_file(path: Path) -> None:
         for i, v in zip(lot_ids, vecs)
     ]
     write_json(out, data)
+    append_vectors(lot_ids, vecs, EMBED_DIR, out.relative_to(EMBED_DIR).as_posix())
     log.debug("Embedding written", path=str(out), count=len(data))
 
 
@@ -0,0 +1,301 @@
+"""Binary embedding store shared by every stage that needs lot vectors.
+
+Parsing thousands of JSON files with 3072 floats each dominated the start-up
+time of ``similar.py``, ``price_train.py``, ``build_site.py`` and
+``telegram_bot.py``.  The store keeps all vectors in one contiguous matrix
+``vectors.bin`` (raw rows of ``DTYPE``) next to ``vectors.ids`` which lists the
+lot id for every row, one per line.  Both files live directly under
+``data/embeddings`` so ``clean_data.py`` and ``pending_embed.py``, which only
+look at ``*.json`` files, keep working unchanged.
+
+``embed.py`` appends new rows while the per-file JSON vectors stay the source
+of truth.  When an id is embedded again the later row wins, and when a file
+is embedded again the earlier rows of its lots are blanked in ``vectors.ids``
+so lots removed by a re-chop disappear without rewriting the matrix; the
+next :func:`migrate` reclaims their space.  Readers open the
+matrix via ``numpy.memmap`` so loading is a near zero-copy operation.
+``vectors.files`` lists the JSON files, relative to the embedding directory,
+whose vectors the store already holds.  Readers parse only the JSON files
+missing from that list, so they neither stat nor read the imported ones.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fcntl
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from log_utils import get_logger
+from notes_utils import load_json
+
+log = get_logger().bind(module=__name__)
+
+EMBED_DIR = Path("data/embeddings")
+MATRIX_NAME = "vectors.bin"
+IDS_NAME = "vectors.ids"
+LOCK_NAME = "vectors.lock"
+FILES_NAME = "vectors.files"
+# ``float32`` keeps the values identical to the JSON source so pages formatted
+# from the store match the ones built from JSON byte for byte.
+DTYPE = np.float32
+
+
+def matrix_path(root: Path = EMBED_DIR) -> Path:
+    """Return path of the raw vector matrix under ``root``."""
+    return root / MATRIX_NAME
+
+
+def ids_path(root: Path = EMBED_DIR) -> Path:
+    """Return path of the row index file under ``root``."""
+    return root / IDS_NAME
+
+
+def files_path(root: Path = EMBED_DIR) -> Path:
+    """Return path of the list of imported JSON files under ``root``."""
+    return root / FILES_NAME
+
+
+def has_store(root: Path = EMBED_DIR) -> bool:
+    """Return ``True`` when a binary store exists under ``root``."""
+    return matrix_path(root).exists() and ids_path(root).exists()
+
+
+@contextmanager
+def _locked(root: Path) -> Iterator[None]:
+    """Hold an exclusive lock so parallel ``embed.py`` runs do not interleave."""
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / LOCK_NAME, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _read_ids(root: Path) -> list[str]:
+    """Return row ids stored under ``root``."""
+    path = ids_path(root)
+    if not path.exists():
+        return []
+    return path.read_text(encoding="utf-8").splitlines()
+
+
+def _source_rows(ids: list[str], source: str) -> list[int]:
+    """Return rows holding lots embedded from ``source``.
+
+    Lot ids are the lot file path without suffix plus ``-<index>``, see
+    ``lot_io.make_lot_id``, and ``source`` mirrors that path with ``.json``.
+    """
+    stem = source.removesuffix(".json")
+    return [row for row, lot_id in enumerate(ids) if lot_id.rsplit("-", 1)[0] == stem]
+
+
+def imported_files(root: Path = EMBED_DIR) -> set[str] | None:
+    """Return JSON files already held by the store under ``root``.
+
+    ``None`` means the store predates the list, so callers have to fall back
+    to comparing modification times.
+    """
+    path = files_path(root)
+    if not path.exists():
+        return None
+    return set(path.read_text(encoding="utf-8").splitlines())
+
+
+def parse_embedding_json(obj, path: Path | None = None) -> dict[str, np.ndarray]:
+    """Return ``{id: vector}`` parsed from an embedding JSON payload.
+
+    Both the current list layout and the legacy single ``{id, vec}`` object are
+    accepted.  Bad entries are logged and skipped.
+    """
+    data: dict[str, np.ndarray] = {}
+    if isinstance(obj, dict) and "id" in obj and "vec" in obj:
+        data[str(obj["id"])] = np.asarray(obj["vec"], dtype=DTYPE)
+    elif isinstance(obj, list):
+        for item in obj:
+            if isinstance(item, dict) and "id" in item and "vec" in item:
+                data[str(item["id"])] = np.asarray(item["vec"], dtype=DTYPE)
+            else:
+                log.error("Bad embedding entry", file=str(path))
+    else:
+        log.error("Failed to parse embedding file", file=str(path))
+    return data
+
+
+def append_vectors(
+    ids: list[str], vecs: list, root: Path = EMBED_DIR, source: str | None = None
+) -> None:
+    """Append ``vecs`` for ``ids`` to the store under ``root``.
+
+    The matrix is truncated to the number of indexed rows before writing so a
+    crash between the two writes never misaligns ids and vectors.  ``source``
+    names the JSON file the vectors were written to, relative to ``root``; it
+    is recorded last so a crash only makes readers parse that file again.
+    Earlier rows of lots from the same file are blanked first so lots a
+    re-chop removed stop being served.
+    """
+    if not ids:
+        return
+    rows = np.asarray(vecs, dtype=DTYPE)
+    if rows.ndim != 2 or rows.shape[0] != len(ids):
+        log.error("Bad vector batch", count=len(ids))
+        return
+    with _locked(root):
+        existing = _read_ids(root)
+        mpath = matrix_path(root)
+        row_bytes = rows.shape[1] * rows.itemsize
+        if existing and mpath.exists():
+            size = mpath.stat().st_size
+            if size < len(existing) * row_bytes or size % row_bytes:
+                log.error(
+                    "Embedding store dimension mismatch",
+                    path=str(mpath),
+                    dim=rows.shape[1],
+                )
+                return
+        with open(mpath, "ab") as fh:
+            fh.truncate(len(existing) * row_bytes)
+            fh.seek(len(existing) * row_bytes)
+            fh.write(rows.tobytes())
+        stale = _source_rows(existing, source) if source is not None else []
+        if stale:
+            for row in stale:
+                existing[row] = ""
+            itmp = ids_path(root).with_suffix(".idstmp")
+            itmp.write_text("".join(f"{i}\n" for i in existing + ids), encoding="utf-8")
+            os.replace(itmp, ids_path(root))
+        else:
+            with open(ids_path(root), "a", encoding="utf-8") as fh:
+                fh.write("".join(f"{i}\n" for i in ids))
+        if source is not None and (files_path(root).exists() or not existing):
+            with open(files_path(root), "a", encoding="utf-8") as fh:
+                fh.write(f"{source}\n")
+    log.debug("Appended vectors", count=len(ids), dropped=len(stale), path=str(mpath))
+
+
+def load_store(root: Path = EMBED_DIR) -> tuple[dict[str, int], np.ndarray | None]:
+    """Return ``(id_to_row, matrix)`` with ``matrix`` opened via ``memmap``.
+
+    Later rows override earlier ones for the same id and blanked rows are
+    skipped.  ``matrix`` is ``None`` when the store is missing or empty.
+    """
+    if not has_store(root):
+        return {}, None
+    ids = _read_ids(root)
+    mpath = matrix_path(root)
+    size = mpath.stat().st_size
+    itemsize = np.dtype(DTYPE).itemsize
+    if not ids or not size or size % (len(ids) * itemsize):
+        if ids:
+            log.error("Embedding store size mismatch", path=str(mpath), rows=len(ids))
+        return {}, None
+    dim = size // (len(ids) * itemsize)
+    matrix = np.memmap(mpath, dtype=DTYPE, mode="r", shape=(len(ids), dim))
+    index = {lot_id: row for row, lot_id in enumerate(ids) if lot_id}
+    log.debug("Opened embedding store", rows=len(ids), dim=dim)
+    return index, matrix
+
+
+def write_store(
+    data: dict[str, np.ndarray],
+    root: Path = EMBED_DIR,
+    files: list[str] | None = None,
+) -> int:
+    """Replace the store under ``root`` with ``data`` and return the row count.
+
+    Files are written to temporary names first and renamed so readers never see
+    a half written matrix.  ``files`` lists the JSON files ``data`` was read
+    from.  Without it the list is dropped and readers compare mtimes instead.
+    """
+    ids = [i for i, v in data.items() if v is not None]
+    dims = {len(data[i]) for i in ids}
+    if len(dims) > 1:
+        # Mixed dimensions can't share a matrix; keep the most common one.
+        counts: dict[int, int] = {}
+        for i in ids:
+            counts[len(data[i])] = counts.get(len(data[i]), 0) + 1
+        keep = max(counts, key=counts.get)
+        log.error("Mixed embedding dimensions", dims=sorted(dims), kept=keep)
+        ids = [i for i in ids if len(data[i]) == keep]
+    with _locked(root):
+        mtmp = matrix_path(root).with_suffix(".tmp")
+        itmp = ids_path(root).with_suffix(".idstmp")
+        with open(mtmp, "wb") as fh:
+            for lot_id in ids:
+                fh.write(np.asarray(data[lot_id], dtype=DTYPE).tobytes())
+        itmp.write_text("".join(f"{i}\n" for i in ids), encoding="utf-8")
+        os.replace(mtmp, matrix_path(root))
+        os.replace(itmp, ids_path(root))
+        if files is None:
+            files_path(root).unlink(missing_ok=True)
+        else:
+            ftmp = files_path(root).with_suffix(".filestmp")
+            ftmp.write_text("".join(f"{f}\n" for f in sorted(files)), encoding="utf-8")
+            os.replace(ftmp, files_path(root))
+    log.info("Wrote embedding store", rows=len(ids), path=str(matrix_path(root)))
+    return len(ids)
+
+
+def _scan_json(
+    root: Path, newer_than: float | None = None, skip: set[str] | None = None
+) -> tuple[dict[str, np.ndarray], list[str]]:
+    """Return vectors and relative names of the ``*.json`` files parsed."""
+    data: dict[str, np.ndarray] = {}
+    names: list[str] = []
+    if not root.exists():
+        return data, names
+    for path in root.rglob("*.json"):
+        rel = path.relative_to(root).as_posix()
+        if skip is not None and rel in skip:
+            continue
+        if newer_than is not None and path.stat().st_mtime <= newer_than:
+            continue
+        data.update(parse_embedding_json(load_json(path), path))
+        names.append(rel)
+    return data, names
+
+
+def load_json_vectors(
+    root: Path = EMBED_DIR,
+    newer_than: float | None = None,
+    skip: set[str] | None = None,
+) -> dict[str, np.ndarray]:
+    """Return vectors parsed from ``*.json`` files under ``root``.
+
+    Files named in ``skip``, relative to ``root``, are left out by name, see
+    :func:`imported_files`.  When ``newer_than`` is given only files modified
+    after that timestamp are parsed.  This lets readers pick up vectors
+    written without the store.
+    """
+    return _scan_json(root, newer_than, skip)[0]
+
+
+def migrate(root: Path = EMBED_DIR) -> int:
+    """Rebuild the store from the JSON files under ``root``.
+
+    This is the one-shot migration for existing installations and also
+    compacts the store, dropping superseded rows and ids whose JSON file has
+    been removed by ``clean_data.py``.
+    """
+    data, names = _scan_json(root)
+    return write_store(data, root, names)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point used by ``make embed-store``."""
+    parser = argparse.ArgumentParser(description="Rebuild the binary embedding store")
+    parser.add_argument(
+        "--root", default=str(EMBED_DIR), help="Embedding directory to migrate"
+    )
+    args = parser.parse_args(argv)
+    rows = migrate(Path(args.root))
+    log.info("Embedding store migrated", rows=rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Optional PCA projection shrinking embeddings for every consumer.
+
+``text-embedding-3-large`` vectors have 3072 dimensions which makes the
+similarity search, price regression, clustering and the vectors embedded in
+HTML pages heavier than needed.  This module fits a PCA projection on the
+stored vectors and saves it as ``projection.npz`` next to them under
+``data/embeddings``.  :func:`similar_utils._load_embeddings`, which every
+stage including ``cluster_items.py`` loads vectors through, applies it
+whenever the file exists so all stages see the same reduced vectors.
+
+The target dimension comes from ``EMBED_DIM`` in ``config.py`` or ``--dim``.
+Running the script without a dimension removes the projection again.
+:func:`projection_digest` identifies the current vector space; the neighbour
+cache of ``similar.py`` and the price model record it and are recomputed when
+it changes.
+``scripts/embed_dim_benchmark.py`` compares candidate sizes with the full
+vectors.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from log_utils import get_logger, install_excepthook
+from oom_utils import prefer_oom_kill
+
+log = get_logger().bind(module=__name__)
+
+EMBED_DIR = Path("data/embeddings")
+PROJECTION_NAME = "projection.npz"
+# Rows used to estimate the covariance matrix.  More barely changes the axes.
+FIT_SAMPLE = 20000
+# Rows projected per matrix product when converting a whole mapping.
+_CHUNK = 4096
+
+
+def projection_path(root: Path = EMBED_DIR) -> Path:
+    """Return path of the stored projection under ``root``."""
+    return root / PROJECTION_NAME
+
+
+def projection_digest(root: Path = EMBED_DIR) -> str | None:
+    """Return a digest of the projection under ``root`` or ``None`` without one."""
+    path = projection_path(root)
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+    except FileNotFoundError:
+        return None
+
+
+class Projection:
+    """Centre and rotate vectors onto their first principal components."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained: float = 0.0):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.explained = float(explained)
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(
+        cls, matrix: np.ndarray, dim: int, sample: int = FIT_SAMPLE, seed: int = 0
+    ) -> "Projection":
+        """Return projection onto the top ``dim`` components of ``matrix``."""
+        data = np.asarray(matrix)
+        if len(data) > sample:
+            rng = np.random.default_rng(seed)
+            data = data[np.sort(rng.choice(len(data), size=sample, replace=False))]
+        data = np.asarray(data, dtype=np.float64)
+        mean = data.mean(axis=0)
+        centred = data - mean
+        cov = centred.T @ centred / max(1, len(data) - 1)
+        values, vectors = np.linalg.eigh(cov)
+        order = np.argsort(values)[::-1][:dim]
+        total = float(values.sum())
+        explained = float(values[order].sum()) / total if total > 0 else 0.0
+        log.info("Fitted projection", dim=dim, rows=len(data), explained=explained)
+        return cls(mean, vectors[:, order].T, explained)
+
+    def apply(self, matrix) -> np.ndarray:
+        """Return ``matrix`` rows projected to :attr:`dim` as ``float32``."""
+        mat = np.asarray(matrix, dtype=np.float32)
+        if mat.ndim == 1:
+            mat = mat.reshape(1, -1)
+        return (mat - self.mean) @ self.components.T
+
+    def apply_map(self, data: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        """Return ``data`` with every vector projected.
+
+        Vectors of a different length than the projection expects are dropped
+        with a warning because mixing spaces would make distances meaningless.
+        """
+        ids = [lid for lid, vec in data.items() if len(vec) == self.input_dim]
+        if len(ids) != len(data):
+            log.warning("Skipping vectors of other size", count=len(data) - len(ids))
+        out: dict[str, np.ndarray] = {}
+        for start in range(0, len(ids), _CHUNK):
+            part = ids[start : start + _CHUNK]
+            out.update(zip(part, self.apply(np.stack([data[i] for i in part]))))
+        return out
+
+    def save(self, path: Path) -> None:
+        """Write the projection to ``path`` in ``numpy`` ``.npz`` format."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            np.savez(
+                fh,
+                mean=self.mean,
+                components=self.components,
+                explained=np.float64(self.explained),
+            )
+        tmp.replace(path)
+        log.info("Saved projection", path=str(path), dim=self.dim)
+
+    @classmethod
+    def load(cls, path: Path) -> "Projection | None":
+        """Return projection stored at ``path`` or ``None`` when missing or bad."""
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                proj = cls(data["mean"], data["components"], float(data["explained"]))
+        except Exception:
+            log.exception("Failed to load projection", path=str(path))
+            return None
+        if proj.mean.shape != (proj.input_dim,):
+            log.error("Bad projection", path=str(path))
+            return None
+        return proj
+
+
+def load_projection(root: Path = EMBED_DIR) -> Projection | None:
+    """Return the projection configured for ``root`` if any."""
+    return Projection.load(projection_path(root))
+
+
+def _config_dim() -> int | None:
+    from config_utils import load_config
+
+    return getattr(load_config(), "EMBED_DIM", None)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Fit, refresh or remove the projection under ``EMBED_DIR``."""
+    install_excepthook(log)
+    prefer_oom_kill()
+    parser = argparse.ArgumentParser(description="Reduce embedding dimension")
+    parser.add_argument(
+        "--dim",
+        type=int,
+        help="Target dimension, 0 for full vectors (default: EMBED_DIM from config)",
+    )
+    parser.add_argument("--sample", type=int, default=FIT_SAMPLE, help="Rows used to fit")
+    parser.add_argument("--refit", action="store_true", help="Fit even when up to date")
+    args = parser.parse_args(argv)
+
+    dim = args.dim if args.dim is not None else _config_dim()
+    path = projection_path(EMBED_DIR)
+    if not dim:
+        if path.exists():
+            path.unlink()
+            log.info("Removed projection, consumers use full vectors", path=str(path))
+        return
+
+    from similar_utils import _load_embeddings
+
+    embeddings = _load_embeddings(project=False)
+    if not embeddings:
+        log.error("No embeddings to fit the projection")
+        return
+    input_dim = len(next(iter(embeddings.values())))
+    current = Projection.load(path)
+    if (
+        current is not None
+        and not args.refit
+        and current.dim == dim
+        and current.input_dim == input_dim
+    ):
+        log.info("Projection up to date", dim=dim)
+        return
+    if dim >= input_dim:
+        log.error("Target dimension is not smaller than the vectors", dim=dim, input=input_dim)
+        return
+    # Stack only the sampled rows; the whole store may not fit in memory.
+    ids = [lid for lid, vec in embeddings.items() if len(vec) == input_dim]
+    if len(ids) > args.sample:
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(len(ids), size=args.sample, replace=False))
+        ids = [ids[i] for i in rows]
+    matrix = np.stack([embeddings[lid] for lid in ids])
+    Projection.fit(matrix, dim, args.sample).save(path)
+    log.info(
+        "Projection changed, neighbours and price model follow on their next run",
+        dim=dim,
+        digest=projection_digest(EMBED_DIR),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Exact cosine top-k search using blocked matrix multiplication.
+
+Every similarity consumer (``similar.py`` for the global and per-seller
+neighbour lists and ``cluster_items.py`` for ordering cluster members) goes
+through :func:`topk_cosine`.  The corpus is normalised once so cosine
+similarity becomes a plain dot product handled by BLAS.  Queries are processed
+in chunks sized so the temporary similarity block stays within
+``memory_mb`` megabytes, and ``numpy.argpartition`` selects the top ``k``
+without sorting whole rows.
+
+When memory is tight :func:`quantise_int8` keeps the corpus as ``int8`` rows
+with one scale per vector, :func:`topk_cosine_int8` ranks full precision
+queries against it and :func:`rerank_cosine` re-scores the short list with the
+original vectors.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from log_utils import get_logger
+
+log = get_logger().bind(module=__name__)
+
+# Upper bound for the ``queries x corpus`` similarity block in megabytes.
+KNN_MEMORY_MB = 256
+
+
+def normalise(matrix) -> np.ndarray:
+    """Return ``matrix`` rows scaled to unit length as ``float32``.
+
+    Zero vectors stay zero so they never look similar to anything.
+    """
+    mat = np.asarray(matrix, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def chunk_rows(corpus_size: int, memory_mb: float = KNN_MEMORY_MB) -> int:
+    """Return how many queries fit into ``memory_mb`` against ``corpus_size``."""
+    per_query = max(1, corpus_size) * np.dtype(np.float32).itemsize
+    return max(1, int(memory_mb * 1024 * 1024 // per_query))
+
+
+def topk_cosine(
+    queries: np.ndarray,
+    corpus: np.ndarray,
+    k: int,
+    query_rows=None,
+    memory_mb: float = KNN_MEMORY_MB,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return ``(dist, neigh)`` with the ``k`` closest ``corpus`` rows per query.
+
+    ``queries`` and ``corpus`` must already be normalised.  ``dist`` holds
+    cosine distances (``1 - similarity``) in ascending order and ``neigh`` the
+    matching corpus row indexes.  When ``query_rows`` is given each query is
+    the corpus row with that index and is excluded from its own result.  Rows
+    with fewer than ``k`` candidates are padded with ``-1`` and ``inf``.
+    """
+    nq = len(queries)
+    n = len(corpus)
+    dist = np.full((nq, k), np.inf, dtype=np.float32)
+    neigh = np.full((nq, k), -1, dtype=np.int64)
+    if not nq or not n or k <= 0:
+        return dist, neigh
+    rows = None if query_rows is None else np.asarray(query_rows, dtype=np.int64)
+    avail = n - 1 if rows is not None else n
+    take = min(k, avail)
+    if take <= 0:
+        return dist, neigh
+
+    step = chunk_rows(n, memory_mb)
+    for start in range(0, nq, step):
+        stop = min(start + step, nq)
+        sims = queries[start:stop] @ corpus.T
+        if rows is not None:
+            sims[np.arange(stop - start), rows[start:stop]] = -np.inf
+        if take < n:
+            part = np.argpartition(-sims, take - 1, axis=1)[:, :take]
+        else:
+            part = np.tile(np.arange(n), (stop - start, 1))
+        part_sims = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_sims, axis=1, kind="stable")
+        top = np.take_along_axis(part, order, axis=1)
+        top_sims = np.take_along_axis(part_sims, order, axis=1)
+        neigh[start:stop, :take] = top[:, :take]
+        dist[start:stop, :take] = 1.0 - top_sims[:, :take]
+    return dist, neigh
+
+
+def grouped_topk_cosine(
+    corpus: np.ndarray,
+    groups,
+    k: int,
+    memory_mb: float = KNN_MEMORY_MB,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return ``(dist, neigh)`` restricted to rows sharing the same group.
+
+    ``corpus`` must be normalised and ``groups`` holds one integer label per
+    row.  Rows are sorted by label once.  Groups with at most ``k + 1`` rows
+    need every pair anyway, so all groups of the same size are stacked and
+    compared with a single batched matrix product.  Larger groups fall back to
+    :func:`topk_cosine` on their own rows.  The output layout matches
+    :func:`topk_cosine` with the row itself excluded.
+    """
+    n = len(corpus)
+    dist = np.full((n, k), np.inf, dtype=np.float32)
+    neigh = np.full((n, k), -1, dtype=np.int64)
+    if not n or k <= 0:
+        return dist, neigh
+    labels = np.asarray(groups)
+    order = np.argsort(labels, kind="stable")
+    starts = np.flatnonzero(np.r_[True, labels[order][1:] != labels[order][:-1]])
+    sizes = np.diff(np.r_[starts, n])
+    dim = corpus.shape[1]
+    budget = memory_mb * 1024 * 1024
+
+    for size in np.unique(sizes):
+        size = int(size)
+        if size < 2:
+            continue
+        group_starts = starts[sizes == size]
+        if size > k + 1:
+            for start in group_starts:
+                rows = order[start : start + size]
+                sub = corpus[rows]
+                d, nb = topk_cosine(sub, sub, k, np.arange(size), memory_mb)
+                dist[rows] = d
+                neigh[rows] = np.where(nb >= 0, rows[nb], -1)
+            continue
+        take = size - 1
+        per_group = size * (dim + size) * np.dtype(np.float32).itemsize
+        step = max(1, int(budget // per_group))
+        diag = np.arange(size)
+        for first in range(0, len(group_starts), step):
+            chunk = group_starts[first : first + step]
+            rows = order[chunk[:, None] + diag]
+            block = corpus[rows]
+            sims = block @ block.transpose(0, 2, 1)
+            sims[:, diag, diag] = -np.inf
+            best = np.argsort(-sims, axis=2, kind="stable")[:, :, :take]
+            best_sims = np.take_along_axis(sims, best, axis=2)
+            flat = rows.reshape(-1)
+            dist[flat, :take] = (1.0 - best_sims).reshape(-1, take)
+            neigh[flat, :take] = np.take_along_axis(
+                np.broadcast_to(rows[:, None, :], best.shape[:2] + (size,)),
+                best,
+                axis=2,
+            ).reshape(-1, take)
+    return dist, neigh
+
+
+def quantise_int8(vectors, memory_mb: float = KNN_MEMORY_MB) -> tuple[np.ndarray, np.ndarray]:
+    """Return ``(codes, scales)`` with normalised ``vectors`` stored as ``int8``.
+
+    ``vectors`` is a sequence of equally sized rows, for example memory-mapped
+    store rows, and is converted in chunks so the full ``float32`` matrix is
+    never materialised.  Each row gets its own scale so that
+    ``codes[i] * scales[i]`` approximates the unit vector within half a step.
+    """
+    n = len(vectors)
+    dim = len(vectors[0]) if n else 0
+    codes = np.empty((n, dim), dtype=np.int8)
+    scales = np.empty(n, dtype=np.float32)
+    step = chunk_rows(dim, memory_mb)
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        block = normalise(np.stack([np.asarray(v) for v in vectors[start:stop]]))
+        peak = np.abs(block).max(axis=1)
+        peak[peak == 0] = 1.0
+        scale = peak / 127.0
+        codes[start:stop] = np.rint(block / scale[:, None]).astype(np.int8)
+        scales[start:stop] = scale
+    return codes, scales
+
+
+def topk_cosine_int8(
+    queries: np.ndarray,
+    codes: np.ndarray,
+    scales: np.ndarray,
+    k: int,
+    query_rows=None,
+    memory_mb: float = KNN_MEMORY_MB,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return approximate ``(dist, neigh)`` against an ``int8`` corpus.
+
+    Distances are asymmetric: ``queries`` stay full precision and only the
+    corpus is quantised by :func:`quantise_int8`.  The corpus is decoded block
+    by block within ``memory_mb`` and a running top ``k`` is merged after each
+    block.  Layout and ``query_rows`` handling match :func:`topk_cosine`.
+    """
+    nq = len(queries)
+    n, dim = codes.shape
+    dist = np.full((nq, k), np.inf, dtype=np.float32)
+    neigh = np.full((nq, k), -1, dtype=np.int64)
+    if not nq or not n or k <= 0:
+        return dist, neigh
+    rows = None if query_rows is None else np.asarray(query_rows, dtype=np.int64)
+    take = min(k, n - 1 if rows is not None else n)
+    if take <= 0:
+        return dist, neigh
+
+    best_sims = np.full((nq, take), -np.inf, dtype=np.float32)
+    best_idx = np.full((nq, take), -1, dtype=np.int64)
+    # Every corpus row of a block costs its decoded vector and, per query, the
+    # similarity, its negated copy, the copy argpartition sorts and the int64
+    # index it returns.  Only ``take`` columns per block reach the merge.
+    per_row = (dim + 5 * nq) * np.dtype(np.float32).itemsize
+    step = max(1, int(memory_mb * 1024 * 1024 // per_row))
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        block = codes[start:stop].astype(np.float32)
+        block *= scales[start:stop, None]
+        sims = queries @ block.T
+        del block
+        if rows is not None:
+            hit = np.flatnonzero((rows >= start) & (rows < stop))
+            sims[hit, rows[hit] - start] = -np.inf
+        if sims.shape[1] > take:
+            part = np.argpartition(-sims, take - 1, axis=1)[:, :take]
+            sims = np.take_along_axis(sims, part, axis=1)
+            cols = part + start
+        else:
+            cols = np.broadcast_to(np.arange(start, stop), sims.shape)
+        merged = np.concatenate([best_sims, sims], axis=1)
+        idx = np.concatenate([best_idx, cols], axis=1)
+        part = np.argpartition(-merged, take - 1, axis=1)[:, :take]
+        best_sims = np.take_along_axis(merged, part, axis=1)
+        best_idx = np.take_along_axis(idx, part, axis=1)
+
+    order = np.argsort(-best_sims, axis=1, kind="stable")
+    best_sims = np.take_along_axis(best_sims, order, axis=1)
+    best_idx = np.take_along_axis(best_idx, order, axis=1)
+    found = np.isfinite(best_sims)
+    neigh[:, :take] = np.where(found, best_idx, -1)
+    dist[:, :take] = np.where(found, 1.0 - best_sims, np.inf)
+    return dist, neigh
+
+
+def rerank_cosine(
+    queries: np.ndarray,
+    candidates: np.ndarray,
+    vectors,
+    k: int,
+    memory_mb: float = KNN_MEMORY_MB,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return exact ``(dist, neigh)`` of the best ``k`` among ``candidates``.
+
+    ``queries`` must be normalised and ``candidates`` holds row indexes into
+    ``vectors`` (``-1`` for none) as returned by :func:`topk_cosine_int8`.
+    Only the candidate rows of ``vectors`` are read, so full precision
+    vectors can stay on disk behind a memory map.
+    """
+    nq, width = candidates.shape
+    dist = np.full((nq, k), np.inf, dtype=np.float32)
+    neigh = np.full((nq, k), -1, dtype=np.int64)
+    valid = candidates >= 0
+    if not nq or not valid.any() or k <= 0:
+        return dist, neigh
+    uniq, inverse = np.unique(candidates[valid], return_inverse=True)
+    full = normalise(np.stack([np.asarray(vectors[r]) for r in uniq]))
+    local = np.zeros(candidates.shape, dtype=np.int64)
+    local[valid] = inverse
+    take = min(k, width)
+    step = chunk_rows(width * full.shape[1], memory_mb)
+    for start in range(0, nq, step):
+        stop = min(start + step, nq)
+        sims = np.einsum("qd,qcd->qc", queries[start:stop], full[local[start:stop]])
+        sims[~valid[start:stop]] = -np.inf
+        order = np.argsort(-sims, axis=1, kind="stable")[:, :take]
+        top_sims = np.take_along_axis(sims, order, axis=1)
+        top = np.take_along_axis(candidates[start:stop], order, axis=1)
+        found = np.isfinite(top_sims)
+        neigh[start:stop, :take] = np.where(found, top, -1)
+        dist[start:stop, :take] = np.where(found, 1.0 - top_sims, np.inf)
+    return dist, neigh
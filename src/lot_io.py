@@ -2,8 +2,13 @@ from __future__ import annotations
 
 """Serialise and validate lot JSON files."""
 
+import fcntl
+import json
+import tempfile
+import zlib
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterable
+from typing import Callable, Iterable, Iterator
 from datetime import datetime, timezone
 
 from log_utils import get_logger
@@ -11,6 +16,8 @@ from notes_utils import load_json, write_json
 
 LOTS_DIR = Path("data/lots")
 EMBED_DIR = Path("data/embeddings")
+# Number of files each :class:`LotStore` snapshot is split into.
+SNAPSHOT_SHARDS = 64
 
 log = get_logger().bind(module=__name__)
 
@@ -186,3 +193,362 @@ def get_lot(lot_id: str, root: Path = LOTS_DIR) -> dict | None:
         return None
     return data[idx]
 
+
+
+class LotRecord:
+    """One lot together with everything the pipeline derives from it.
+
+    ``meta`` and ``text`` come from the raw post named by ``source:path`` and
+    are ``None`` and ``""`` for lots without one.  ``skip`` holds the
+    moderation reason or ``None`` when the lot may be published.
+    """
+
+    __slots__ = ("id", "path", "lot", "meta", "text", "skip", "timestamp", "seller")
+
+    def __init__(
+        self,
+        lot_id: str,
+        path: Path,
+        lot: dict,
+        meta: dict | None,
+        text: str,
+        skip: str | None,
+    ):
+        self.id = lot_id
+        self.path = path
+        self.lot = lot
+        self.meta = meta
+        self.text = text
+        self.skip = skip
+        self.timestamp = get_timestamp(lot)
+        self.seller = get_seller(lot)
+
+
+def _first(value):
+    """Return the first item of list ``value`` or ``value`` itself."""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+class LotInfo:
+    """Fields the category and index pages need from one lot, parsed once.
+
+    Build steps sort and group every lot several times.  Reading those values
+    from the lot dict each time re-parsed the timestamp and scanned
+    ``SELLER_FIELDS`` again, so they are resolved here once.  ``lot`` keeps
+    the full dict for titles.  ``row`` is the position of the lot in the list
+    it was built from, which is also its row in stacked embedding arrays.
+    Price fields are read from the values ``price_utils.prepare_price_fields``
+    stores on the lot, so build this after preparing prices.
+    """
+
+    __slots__ = (
+        "id",
+        "lot",
+        "dt",
+        "seller",
+        "deal",
+        "item_type",
+        "price",
+        "price_class",
+        "price_value",
+        "price_usd",
+        "row",
+    )
+
+    def __init__(self, lot: dict, row: int = -1):
+        self.id = lot.get("_id")
+        self.lot = lot
+        self.dt = get_timestamp(lot)
+        self.seller = get_seller(lot)
+        deal = lot.get("market:deal", "misc")
+        if not isinstance(deal, str):
+            log.debug("Non-string deal", id=self.id, value=deal)
+            deal = _first(deal) if isinstance(deal, list) and deal else str(deal)
+        self.deal = deal
+        itype = _first(lot.get("item:type"))
+        self.item_type = itype if isinstance(itype, str) and itype else None
+        self.price = lot.get("_display_price")
+        self.price_class = lot.get("_price_class")
+        self.price_value = _float(lot.get("_display_value"))
+        self.price_usd = _float(lot.get("_usd_value"))
+        self.row = row
+
+
+def _float(value) -> float | None:
+    """Return ``value`` as ``float`` or ``None`` when empty or invalid."""
+    if value in ("", None):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def snapshot_path(root: Path = LOTS_DIR) -> Path:
+    """Return the directory of the :class:`LotStore` snapshot shards for ``root``.
+
+    It sits beside the lot tree so scripts globbing ``*.json`` never see it.
+    """
+    return root.parent / f"{root.name}_store"
+
+
+def posts_snapshot_path(root: Path = LOTS_DIR) -> Path:
+    """Return the raw post snapshot directory kept next to :func:`snapshot_path`."""
+    return root.parent / f"{root.name}_posts"
+
+
+def _shard(key: str) -> int:
+    """Return the snapshot shard holding ``key``, stable across processes."""
+    return zlib.crc32(key.encode("utf-8")) % SNAPSHOT_SHARDS
+
+
+def _shard_path(snapshot: Path, shard: int) -> Path:
+    return snapshot / f"{shard:02d}.json"
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on ``path`` so parallel stages do not interleave."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _replace_json(path: Path, data) -> None:
+    """Write ``data`` to ``path`` through a temporary file of this process."""
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, prefix=f"{path.name}.", delete=False
+    ) as fh:
+        json.dump(data, fh, ensure_ascii=False)
+    try:
+        Path(fh.name).replace(path)
+    except BaseException:
+        Path(fh.name).unlink(missing_ok=True)
+        raise
+
+
+def _stamp(path: Path) -> list[int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class LotStore:
+    """Lots under ``root`` with their raw posts and moderation verdicts.
+
+    Every stage used to re-read each lot file and parse each raw post on its
+    own.  :meth:`load` does it once per process and keeps the parsed files in
+    a snapshot keyed by their mtime and size, so the next stage of the same
+    ``make`` run only re-reads files that changed.  The snapshot is split into
+    ``SNAPSHOT_SHARDS`` files by a hash of the lot file name and only shards
+    holding a changed file are rewritten.  Raw posts have their own shards
+    which stages that only need the lots never open.  Moderation verdicts and
+    timestamps are recomputed on every load because they depend on the
+    configuration and the current time.
+    """
+
+    def __init__(self, root: Path = LOTS_DIR, raw_dir: Path | None = None):
+        from post_io import RAW_DIR
+
+        self.root = root
+        self.raw_dir = RAW_DIR if raw_dir is None else raw_dir
+        self.snapshot = snapshot_path(root)
+        self.posts_snapshot = posts_snapshot_path(root)
+        self._records: list[LotRecord] | None = None
+        self._with_posts = False
+
+    def _read_shard(self, snapshot: Path, shard: int) -> dict:
+        """Return the entries of one snapshot shard, empty when unusable."""
+        path = _shard_path(snapshot, shard)
+        if not path.exists():
+            return {}
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            log.warning("Ignoring broken lot snapshot", path=str(path))
+            return {}
+        if not isinstance(data, dict) or data.get("raw_dir") != str(self.raw_dir):
+            return {}
+        return data.get("entries", {})
+
+    def _write_snapshots(self, files: dict[int, dict], posts: dict[int, dict]) -> None:
+        """Replace the given shards of both snapshots, removing empty ones.
+
+        Every process writes through its own temporary file and the lock
+        keeps stages running side by side under ``make -j`` apart.
+        """
+        raw_dir = str(self.raw_dir)
+        with _locked(self.snapshot.with_suffix(".lock")):
+            for snapshot, shards in ((self.snapshot, files), (self.posts_snapshot, posts)):
+                if shards:
+                    snapshot.mkdir(parents=True, exist_ok=True)
+                for shard, entries in shards.items():
+                    path = _shard_path(snapshot, shard)
+                    if entries:
+                        _replace_json(path, {"raw_dir": raw_dir, "entries": entries})
+                    else:
+                        path.unlink(missing_ok=True)
+            # Snapshots of older versions were single files.
+            for snapshot in (self.snapshot, self.posts_snapshot):
+                snapshot.with_suffix(".json").unlink(missing_ok=True)
+
+    def _file_records(
+        self,
+        path: Path,
+        rel: Path,
+        lots: list[dict] | None,
+        get_post: Callable | None,
+        moderate: bool = True,
+    ) -> list[LotRecord]:
+        """Return records for ``lots`` read from ``path``.
+
+        ``get_post`` maps a ``source:path`` to ``{"meta", "text"}``.  Without
+        it raw posts are ignored and only the lot itself is moderated.  With
+        ``moderate`` false no verdicts are computed and ``skip`` stays ``None``.
+        """
+        import moderation
+
+        records = []
+        for i, lot in enumerate(lots or []):
+            meta = None
+            text = ""
+            skip = None
+            src = lot.get("source:path")
+            if src and get_post is not None:
+                post = get_post(str(src))
+                meta = dict(post["meta"])
+                text = post["text"]
+                if moderate:
+                    skip = moderation.message_skip_reason(meta, text)
+            if skip is None and moderate:
+                skip = moderation.lot_skip_reason(lot)
+            records.append(LotRecord(make_lot_id(rel, i), path, lot, meta, text, skip))
+        return records
+
+    def load(self, posts: bool = True) -> list[LotRecord]:
+        """Return records for every lot, reading only files that changed.
+
+        With ``posts`` false the raw posts and their snapshot are skipped:
+        records have no ``meta`` or ``text`` and ``skip`` only reflects the
+        lot itself.  Post shards are read only once a lot refers to them.
+        """
+        if self._records is not None and (self._with_posts or not posts):
+            return self._records
+        from post_io import read_post, raw_post_path
+
+        old_files = [self._read_shard(self.snapshot, i) for i in range(SNAPSHOT_SHARDS)]
+        files: list[dict[str, dict]] = [{} for _ in range(SNAPSHOT_SHARDS)]
+        old_posts: dict[int, dict] = {}
+        new_posts: dict[int, dict[str, dict]] = {}
+        changed_files: set[int] = set()
+        changed_posts: set[int] = set()
+        reread = 0
+        reparsed = 0
+
+        def get_post(src: str) -> dict:
+            nonlocal reparsed
+            shard = _shard(src)
+            if shard not in old_posts:
+                old_posts[shard] = self._read_shard(self.posts_snapshot, shard)
+                new_posts[shard] = {}
+            post = new_posts[shard].get(src)
+            if post is None:
+                raw_path = raw_post_path(src, self.raw_dir)
+                raw_stamp = _stamp(raw_path)
+                post = old_posts[shard].get(src)
+                if post is None or post["stamp"] != raw_stamp:
+                    post_meta, post_text = read_post(raw_path)
+                    post = {"stamp": raw_stamp, "meta": post_meta, "text": post_text}
+                    reparsed += 1
+                    changed_posts.add(shard)
+                new_posts[shard][src] = post
+            return post
+
+        records: list[LotRecord] = []
+        for path in iter_lot_files(self.root):
+            rel = path.relative_to(self.root).with_suffix("")
+            key = rel.as_posix()
+            shard = _shard(key)
+            stamp = _stamp(path)
+            entry = old_files[shard].get(key)
+            if entry is None or entry["stamp"] != stamp:
+                entry = {"stamp": stamp, "lots": read_lots(path)}
+                reread += 1
+                changed_files.add(shard)
+            files[shard][key] = entry
+            records.extend(
+                self._file_records(path, rel, entry["lots"], get_post if posts else None)
+            )
+        changed_files.update(
+            i for i in range(SNAPSHOT_SHARDS) if files[i].keys() != old_files[i].keys()
+        )
+        if posts:
+            changed_posts.update(
+                i for i, entries in new_posts.items() if entries.keys() != old_posts[i].keys()
+            )
+            # Shards no lot refers to any more only hold removed posts.
+            if self.posts_snapshot.exists():
+                changed_posts.update(
+                    i
+                    for i in range(SNAPSHOT_SHARDS)
+                    if i not in new_posts and _shard_path(self.posts_snapshot, i).exists()
+                )
+        if changed_files or changed_posts:
+            self._write_snapshots(
+                {i: files[i] for i in changed_files},
+                {i: new_posts.get(i, {}) for i in changed_posts},
+            )
+        log.info(
+            "Loaded lot store",
+            lots=len(records),
+            files=sum(len(f) for f in files),
+            reread=reread + reparsed,
+            rewritten=len(changed_files) + len(changed_posts),
+        )
+        self._records = records
+        self._with_posts = posts
+        return records
+
+    def iter_files(self, moderate: bool = True) -> Iterator[list[LotRecord]]:
+        """Yield the records of one lot file at a time.
+
+        Unlike :meth:`load` nothing is kept and the snapshots are neither read
+        nor written, so memory is bounded by the largest file.  Streaming
+        builds of the site call this once per pass and skip moderation in the
+        second one.
+        """
+        from post_io import read_post, raw_post_path
+
+        posts: dict[str, dict] = {}
+
+        def get_post(src: str) -> dict:
+            post = posts.get(src)
+            if post is None:
+                meta, text = read_post(raw_post_path(src, self.raw_dir))
+                post = posts[src] = {"meta": meta, "text": text}
+            return post
+
+        for path in iter_lot_files(self.root):
+            rel = path.relative_to(self.root).with_suffix("")
+            # Lots of one file come from the same post, so the cache stays small.
+            posts.clear()
+            yield self._file_records(path, rel, read_lots(path), get_post, moderate)
+
+    def lots(self, moderated: bool = True) -> list[dict]:
+        """Return lot dicts with ``_id`` set, skipping rejected ones by default."""
+        out = []
+        # Unmoderated lots need nothing from the raw posts.
+        for rec in self.load(posts=moderated):
+            if moderated and rec.skip:
+                continue
+            rec.lot["_id"] = rec.id
+            out.append(rec.lot)
+        return out
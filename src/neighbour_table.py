@@ -0,0 +1,250 @@
+"""Compact bounded top-k neighbour lists for the similar items cache.
+
+``similar.py`` keeps up to ``k`` neighbours for every lot.  Instead of a dict
+of lists of small dicts the table stores one row per lot in two fixed-width
+arrays: ``neigh`` (``int32`` row indexes into :attr:`NeighbourTable.ids`) and
+``dist`` (``float32`` cosine distances).  Every row is a max-heap keyed by
+distance with empty slots holding ``(-1, inf)``, so the worst kept neighbour
+is always at slot ``0`` and offering a new candidate costs ``O(log k)``.
+
+A row sorted by descending distance is a valid heap, which lets bulk
+operations like pruning re-heapify all rows with one vectorised sort.  The
+arrays are written to disk as they are with :func:`numpy.savez`, together
+with the generation of the database they mirror so a stale file is ignored.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from log_utils import get_logger
+
+log = get_logger().bind(module=__name__)
+
+_EMPTY = -1
+
+
+class NeighbourTable:
+    """Mapping-like store of the ``k`` closest neighbours per lot id."""
+
+    def __init__(self, k: int = 6, capacity: int = 16):
+        self.k = k
+        self.ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        capacity = max(1, capacity)
+        self.neigh = np.full((capacity, k), _EMPTY, dtype=np.int32)
+        self.dist = np.full((capacity, k), np.inf, dtype=np.float32)
+        # ``True`` once neighbours were computed for the row.  Rows referenced
+        # only as neighbours of other lots stay ``False``.
+        self.filled = np.zeros(capacity, dtype=bool)
+        # Database generation the table was saved for, ``-1`` when unknown.
+        self.generation = -1
+
+    # -- row bookkeeping -------------------------------------------------
+
+    def _row(self, lot_id: str) -> int:
+        """Return row for ``lot_id`` creating it when needed."""
+        row = self._rows.get(lot_id)
+        if row is not None:
+            return row
+        row = len(self.ids)
+        if row >= len(self.neigh):
+            grow = max(1, len(self.neigh))
+            self.neigh = np.vstack(
+                [self.neigh, np.full((grow, self.k), _EMPTY, dtype=np.int32)]
+            )
+            self.dist = np.vstack(
+                [self.dist, np.full((grow, self.k), np.inf, dtype=np.float32)]
+            )
+            self.filled = np.concatenate([self.filled, np.zeros(grow, dtype=bool)])
+        self.ids.append(lot_id)
+        self._rows[lot_id] = row
+        return row
+
+    def __contains__(self, lot_id: object) -> bool:
+        row = self._rows.get(lot_id)  # type: ignore[arg-type]
+        return row is not None and bool(self.filled[row])
+
+    def __iter__(self) -> Iterator[str]:
+        return (lid for lid, row in self._rows.items() if self.filled[row])
+
+    def __len__(self) -> int:
+        return int(self.filled[: len(self.ids)].sum())
+
+    # -- reading ---------------------------------------------------------
+
+    def get(self, lot_id: str, default=None) -> list[dict] | None:
+        """Return neighbours of ``lot_id`` closest first as ``{id, dist}``."""
+        if lot_id not in self:
+            return default
+        row = self._rows[lot_id]
+        order = np.argsort(self.dist[row], kind="stable")
+        return [
+            {"id": self.ids[self.neigh[row, j]], "dist": float(self.dist[row, j])}
+            for j in order
+            if self.neigh[row, j] != _EMPTY
+        ]
+
+    def __getitem__(self, lot_id: str) -> list[dict]:
+        result = self.get(lot_id)
+        if result is None:
+            raise KeyError(lot_id)
+        return result
+
+    def items(self) -> Iterator[tuple[str, list[dict]]]:
+        """Yield ``(lot_id, neighbours)`` for every filled row."""
+        for lot_id in self:
+            yield lot_id, self[lot_id]
+
+    # -- writing ---------------------------------------------------------
+
+    def set(self, lot_id: str, neigh_ids: Iterable[str], dists: Iterable[float]) -> None:
+        """Replace the neighbours of ``lot_id`` with the closest ``k`` given."""
+        row = self._row(lot_id)
+        pairs = sorted(zip(dists, neigh_ids), key=lambda p: p[0])[: self.k]
+        self.neigh[row] = _EMPTY
+        self.dist[row] = np.inf
+        # Store descending so the row is a valid max-heap.
+        for slot, (d, other) in enumerate(reversed(pairs)):
+            self.neigh[row, self.k - len(pairs) + slot] = self._row(other)
+            self.dist[row, self.k - len(pairs) + slot] = d
+        self._heapify_row(row)
+        self.filled[row] = True
+
+    def offer(self, lot_id: str, other_id: str, dist: float) -> None:
+        """Insert ``other_id`` into the heap of ``lot_id`` if it is closer.
+
+        An existing entry for ``other_id`` gets its distance updated.  Rows not
+        computed yet are created so a later ``set`` starts from scratch.
+        """
+        row = self._row(lot_id)
+        other = self._row(other_id)
+        heap_n = self.neigh[row]
+        heap_d = self.dist[row]
+        hit = np.flatnonzero(heap_n == other)
+        if len(hit):
+            heap_d[hit[0]] = dist
+            self._heapify_row(row)
+            return
+        if dist >= heap_d[0]:
+            return
+        heap_n[0] = other
+        heap_d[0] = dist
+        self._sift_down(row, 0)
+
+    def pop(self, lot_id: str, default=None):
+        """Forget the computed neighbours of ``lot_id``."""
+        row = self._rows.get(lot_id)
+        if row is None or not self.filled[row]:
+            return default
+        result = self.get(lot_id)
+        self.neigh[row] = _EMPTY
+        self.dist[row] = np.inf
+        self.filled[row] = False
+        return result
+
+    def prune(self, valid_ids: set[str]) -> None:
+        """Drop rows and references for ids missing from ``valid_ids``."""
+        n = len(self.ids)
+        keep = np.array([lid in valid_ids for lid in self.ids], dtype=bool)
+        remap = np.full(n + 1, _EMPTY, dtype=np.int32)
+        remap[:n][keep] = np.arange(int(keep.sum()), dtype=np.int32)
+        neigh = self.neigh[:n][keep]
+        dist = self.dist[:n][keep]
+        # ``remap[-1]`` maps empty slots to ``_EMPTY`` as well.
+        neigh = remap[neigh]
+        dist[neigh == _EMPTY] = np.inf
+        self.ids = [lid for lid, k in zip(self.ids, keep) if k]
+        self._rows = {lid: i for i, lid in enumerate(self.ids)}
+        self.filled = self.filled[:n][keep]
+        self.neigh = neigh
+        self.dist = dist
+        self._heapify_all()
+
+    # -- heap helpers ----------------------------------------------------
+
+    def _heapify_row(self, row: int) -> None:
+        order = np.argsort(-self.dist[row], kind="stable")
+        self.neigh[row] = self.neigh[row, order]
+        self.dist[row] = self.dist[row, order]
+
+    def _heapify_all(self) -> None:
+        if not len(self.dist):
+            return
+        order = np.argsort(-self.dist, axis=1, kind="stable")
+        self.neigh = np.take_along_axis(self.neigh, order, axis=1)
+        self.dist = np.take_along_axis(self.dist, order, axis=1)
+
+    def _sift_down(self, row: int, pos: int) -> None:
+        heap_n = self.neigh[row]
+        heap_d = self.dist[row]
+        k = self.k
+        while True:
+            left = 2 * pos + 1
+            if left >= k:
+                return
+            child = left
+            if left + 1 < k and heap_d[left + 1] > heap_d[left]:
+                child = left + 1
+            if heap_d[child] <= heap_d[pos]:
+                return
+            heap_d[pos], heap_d[child] = heap_d[child], heap_d[pos]
+            heap_n[pos], heap_n[child] = heap_n[child], heap_n[pos]
+            pos = child
+
+    # -- conversion and persistence -------------------------------------
+
+    @classmethod
+    def from_dict(cls, data: dict[str, list[dict]], k: int = 6) -> "NeighbourTable":
+        """Return table built from the legacy ``{id: [{id, dist}]}`` mapping."""
+        table = cls(k, capacity=len(data))
+        for lot_id, sims in data.items():
+            table.set(lot_id, [s["id"] for s in sims], [s["dist"] for s in sims])
+        return table
+
+    def save(self, path: Path, generation: int = -1) -> None:
+        """Write the arrays to ``path`` in ``numpy`` ``.npz`` format."""
+        n = len(self.ids)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fh:
+            np.savez(
+                fh,
+                ids=np.asarray(self.ids, dtype=str),
+                neigh=self.neigh[:n],
+                dist=self.dist[:n],
+                filled=self.filled[:n],
+                generation=np.int64(generation),
+            )
+        self.generation = generation
+        log.debug("Saved neighbour table", path=str(path), rows=n)
+
+    @classmethod
+    def load(cls, path: Path, k: int = 6) -> "NeighbourTable | None":
+        """Return table stored at ``path`` or ``None`` when missing or bad."""
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                ids = [str(i) for i in data["ids"]]
+                neigh = data["neigh"].astype(np.int32)
+                dist = data["dist"].astype(np.float32)
+                filled = data["filled"].astype(bool)
+                generation = int(data["generation"]) if "generation" in data else -1
+        except Exception:
+            log.exception("Failed to load neighbour table", path=str(path))
+            return None
+        if neigh.shape != (len(ids), k) or dist.shape != neigh.shape:
+            log.error("Bad neighbour table", path=str(path))
+            return None
+        table = cls(k, capacity=len(ids))
+        table.ids = ids
+        table._rows = {lid: i for i, lid in enumerate(ids)}
+        table.generation = generation
+        if ids:
+            table.neigh = neigh
+            table.dist = dist
+            table.filled = filled
+        return table
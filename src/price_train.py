@@ -2,10 +2,11 @@ from __future__ import annotations
 
 from pathlib import Path
 
+from embed_reduce import projection_digest
 from log_utils import get_logger, install_excepthook
 from oom_utils import prefer_oom_kill
-from similar_utils import _load_embeddings, _sync_embeddings
-from lot_io import iter_lot_files, read_lots
+from similar_utils import EMBED_DIR, _load_embeddings, _sync_embeddings
+from lot_io import LotStore
 from price_utils import train_price_regression, save_price_model
 
 log = get_logger().bind(script=__file__)
@@ -18,18 +19,7 @@ MODEL_FILE = Path("data/price_model.json")
 
 def _iter_lots() -> list[dict]:
     """Return all lots with generated ids."""
-    lots: list[dict] = []
-    for path in iter_lot_files(LOTS_DIR):
-        data = read_lots(path)
-        if not data:
-            continue
-        rel = path.relative_to(LOTS_DIR).with_suffix("")
-        base = rel.name
-        prefix = rel.parent
-        for i, lot in enumerate(data):
-            lid = str(prefix / f"{base}-{i}") if prefix.parts else f"{base}-{i}"
-            lot["_id"] = lid
-            lots.append(lot)
+    lots = LotStore(LOTS_DIR).lots(moderated=False)
     log.info("Loaded lots", count=len(lots))
     return lots
 
@@ -45,7 +35,7 @@ def main() -> None:
     if model is None:
         log.error("No training samples")
         return
-    save_price_model(model, cur_map, counts, MODEL_FILE)
+    save_price_model(model, cur_map, counts, MODEL_FILE, projection_digest(EMBED_DIR))
     log.info("Price model saved", path=str(MODEL_FILE))
 
 
@@ -177,26 +177,39 @@ def save_price_model(
     currencies: Mapping[str, int],
     counts: Mapping[str, int],
     path: Path,
+    projection: str | None = None,
 ) -> None:
-    """Write ``model`` parameters to ``path`` as JSON."""
+    """Write ``model`` parameters to ``path`` as JSON.
+
+    ``projection`` is the ``embed_reduce.projection_digest`` of the vectors the
+    model was trained on."""
 
     data = {
         "intercept": float(model.intercept_),
         "coef": [float(c) for c in model.coef_],
         "currencies": {str(k): int(v) for k, v in currencies.items()},
         "counts": {str(k): int(v) for k, v in counts.items()},
+        "projection": projection,
     }
     write_json(path, data)
     log.debug("Saved price model", path=str(path))
 
 
-def load_price_model(path: Path) -> tuple[LinearRegression | None, dict[str, int], dict[str, int]]:
-    """Return ``(model, currencies, counts)`` loaded from ``path``."""
+def load_price_model(
+    path: Path, projection: str | None = None
+) -> tuple[LinearRegression | None, dict[str, int], dict[str, int]]:
+    """Return ``(model, currencies, counts)`` loaded from ``path``.
+
+    A model trained on vectors of another ``projection`` digest is treated as
+    missing until ``price_train.py`` runs again."""
 
     obj = load_json(path)
     if not isinstance(obj, dict):
         log.warning("Price model missing", path=str(path))
         return None, {}, {}
+    if obj.get("projection") != projection:
+        log.warning("Price model trained on another projection", path=str(path))
+        return None, {}, {}
     try:
         coef = [float(c) for c in obj.get("coef", [])]
         intercept = float(obj["intercept"])
@@ -229,6 +242,10 @@ def predict_price(
     if model is None or vec is None:
         return None
     dim = len(vec)
+    if dim + len(currencies) - 1 != model.coef_.shape[0]:
+        # Happens right after switching ``EMBED_DIM`` until the model is retrained.
+        log.warning("Price model dimension mismatch", dim=dim)
+        return None
     row = list(vec)
     idx = currencies.get(str(currency), 0)
     if idx > 0:
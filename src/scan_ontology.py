@@ -10,17 +10,15 @@ from pathlib import Path
 
 from log_utils import get_logger, install_excepthook
 from oom_utils import prefer_oom_kill
-from lot_io import get_seller, get_timestamp
+from lot_io import LotStore, get_seller, get_timestamp
 from message_utils import gather_chop_input
 from post_io import (
-    read_post,
     get_contact as get_post_contact,
     get_timestamp as get_post_timestamp,
     raw_post_path,
     RAW_DIR,
 )
 from notes_utils import write_json
-from lot_io import read_lots
 
 log = get_logger().bind(script=__file__)
 
@@ -82,51 +80,42 @@ def collect_ontology() -> tuple[
     has_raw = RAW_DIR.exists()
     if not has_raw:
         log.debug("RAW_DIR missing", path=str(RAW_DIR))
-    for path in LOTS_DIR.rglob("*.json"):
-        lots = read_lots(path)
-        if not lots:
-            continue
-        for lot in lots:
-            if not isinstance(lot, dict):
-                continue
-            src = lot.get("source:path")
-            meta = None
+    for rec in LotStore(LOTS_DIR, RAW_DIR).load():
+        lot = rec.lot
+        src = lot.get("source:path")
+        meta = rec.meta if src and has_raw else None
+        if is_misparsed(lot, meta):
+            prompt = ""
             if src and has_raw:
-                meta, _ = read_post(raw_post_path(src, RAW_DIR))
-            if is_misparsed(lot, meta):
-                prompt = ""
-                if src and has_raw:
-                    try:
-                        prompt = gather_chop_input(raw_post_path(src, RAW_DIR), MEDIA_DIR)
-                    except Exception:
-                        log.exception("Failed to build parser input", source=src)
-                misparsed.append({"lot": lot, "input": prompt})
-            if lot.get("fraud") is not None:
-                prompt = ""
-                if src and has_raw:
-                    try:
-                        prompt = gather_chop_input(raw_post_path(src, RAW_DIR), MEDIA_DIR)
-                    except Exception:
-                        log.exception("Failed to build parser input", source=src)
-                fraud.append({"lot": lot, "input": prompt})
+                try:
+                    prompt = gather_chop_input(raw_post_path(src, RAW_DIR), MEDIA_DIR)
+                except Exception:
+                    log.exception("Failed to build parser input", source=src)
+            misparsed.append({"lot": lot, "input": prompt})
+        if lot.get("fraud") is not None:
+            prompt = ""
             if src and has_raw:
-                if meta is None:
-                    meta, _ = read_post(raw_post_path(src, RAW_DIR))
-                if not meta.get("id") or not meta.get("chat") or not meta.get("date"):
-                    chat = lot.get("source:chat") or meta.get("chat")
-                    mid = lot.get("source:message_id") or meta.get("id")
-                    if chat and mid:
-                        broken.append({"chat": chat, "id": int(mid)})
-            for f in REVIEW_FIELDS:
-                val = lot.get(f)
-                if isinstance(val, str):
-                    values[f][val] += 1
-            for key, value in lot.items():
-                if isinstance(value, (dict, list)):
-                    val = json.dumps(value, ensure_ascii=False, sort_keys=True)
-                else:
-                    val = str(value)
-                ontology[key][val] += 1
+                try:
+                    prompt = gather_chop_input(raw_post_path(src, RAW_DIR), MEDIA_DIR)
+                except Exception:
+                    log.exception("Failed to build parser input", source=src)
+            fraud.append({"lot": lot, "input": prompt})
+        if meta is not None:
+            if not meta.get("id") or not meta.get("chat") or not meta.get("date"):
+                chat = lot.get("source:chat") or meta.get("chat")
+                mid = lot.get("source:message_id") or meta.get("id")
+                if chat and mid:
+                    broken.append({"chat": chat, "id": int(mid)})
+        for f in REVIEW_FIELDS:
+            val = lot.get(f)
+            if isinstance(val, str):
+                values[f][val] += 1
+        for key, value in lot.items():
+            if isinstance(value, (dict, list)):
+                val = json.dumps(value, ensure_ascii=False, sort_keys=True)
+            else:
+                val = str(value)
+            ontology[key][val] += 1
     # Convert counters to plain dicts sorted by count
     result: dict[str, dict[str, int]] = {}
     for key, counter in ontology.items():
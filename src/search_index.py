@@ -0,0 +1,232 @@
+"""Static full-text search index for ``build_site.py``.
+
+Every lot is tokenised per language from its title, description and
+attribute values.  Title tokens count :data:`TITLE_WEIGHT` times so a match
+in the title outranks one in the description.  The index is written under
+``data/views/search/<lang>/``:
+
+- ``meta.json`` holds the BM25 statistics (document count and average
+  length), the shard counts with a content version per shard, and the terms
+  left out as too common.
+- ``t<n>.json`` shards map terms to postings ``[doc, tf, length]``.  A term
+  lives in shard ``term_hash(term) % shards``.
+- ``d<n>.json`` shards map doc keys to ``[page, title, thumb]``.  ``page``
+  is the lot page path relative to the site root without the
+  ``_<lang>.html`` suffix.
+
+``site.js`` reads ``meta.json``, hashes the query terms the same way and
+fetches only their shards, then the doc shards of the best hits.  Shard
+counts are powers of two sized for about :data:`TERM_SHARD_POSTINGS`
+postings or :data:`DOC_SHARD_DOCS` documents each, so a query costs a few
+small requests even on a slow mobile link.
+
+Shards are recorded in the build manifest under the hash of their content.
+An incremental build rewrites only the shards whose terms or documents
+changed, and the deploy ships only those.  The tokeniser and
+:func:`term_hash` must stay in sync with ``templates/static/site.js``.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import math
+import re
+import unicodedata
+from array import array
+from pathlib import Path
+
+from build_cache import BuildManifest
+from log_utils import get_logger
+
+log = get_logger().bind(module=__name__)
+
+SEARCH_DIR = "search"
+TITLE_WEIGHT = 3
+TERM_SHARD_POSTINGS = 2048
+DOC_SHARD_DOCS = 256
+# Terms found in more than this share of documents are left out once the
+# index is large enough; their BM25 weight is close to zero anyway.
+STOP_DF = 0.5
+STOP_MIN_DOCS = 1000
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+# Attributes shown on lot pages but useless as search terms.
+_SKIP_ATTRS = {"files", "ai_price", "price", "timestamp"}
+
+
+def tokenize(text: str) -> list[str]:
+    """Return lower-case word tokens of ``text``.
+
+    Single letters are dropped, single digits kept.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    return [t for t in _TOKEN_RE.findall(text) if len(t) > 1 or t.isdigit()]
+
+
+def term_hash(text: str) -> int:
+    """Return the 32-bit FNV-1a hash of ``text`` encoded as UTF-8."""
+    h = 0x811C9DC5
+    for byte in text.encode("utf-8"):
+        h = ((h ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return h
+
+
+def doc_key(lot_id: str) -> str:
+    """Return the short stable key postings use for ``lot_id``."""
+    digest = hashlib.blake2b(lot_id.encode("utf-8"), digest_size=6).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii")
+
+
+def _attr_text(lot: dict) -> str:
+    """Return the attribute values of ``lot`` that are worth searching."""
+    parts = []
+    for key, value in lot.items():
+        if (
+            key in _SKIP_ATTRS
+            or key.startswith(("title_", "description_", "source:", "_"))
+        ):
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, str):
+                parts.append(item)
+    return " ".join(parts)
+
+
+def _shard_count(items: int, per_shard: int) -> int:
+    """Return the power of two giving at most about ``per_shard`` items each."""
+    return 1 << max(0, math.ceil(math.log2(max(1, items / per_shard))))
+
+
+def _dump(data) -> bytes:
+    return json.dumps(
+        data, ensure_ascii=False, separators=(",", ":"), sort_keys=True
+    ).encode("utf-8")
+
+
+class SearchIndex:
+    """Collect lots and write the sharded index of every language.
+
+    Postings are kept as flat ``array`` pairs of document number and term
+    frequency so large catalogues stay compact in memory.
+    """
+
+    def __init__(self, langs: list[str]) -> None:
+        self.langs = langs
+        self._keys: list[str] = []
+        self._pages: list[str] = []
+        self._thumbs: list[str | None] = []
+        self._seen: set[str] = set()
+        self._titles: dict[str, list[str]] = {lang: [] for lang in langs}
+        self._lengths: dict[str, array] = {lang: array("I") for lang in langs}
+        self._postings: dict[str, dict[str, array]] = {lang: {} for lang in langs}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, lot: dict, page: str) -> None:
+        """Index ``lot`` whose pages are ``<page>_<lang>.html``."""
+        key = doc_key(lot["_id"])
+        if key in self._seen:
+            log.warning("Search key collision, lot not indexed", id=lot["_id"])
+            return
+        self._seen.add(key)
+        num = len(self._keys)
+        self._keys.append(key)
+        self._pages.append(page)
+        files = lot.get("files") or []
+        self._thumbs.append(files[0] if files else None)
+        attrs = tokenize(_attr_text(lot))
+        for lang in self.langs:
+            title = lot.get(f"title_{lang}") or ""
+            counts: dict[str, int] = {}
+            for token in tokenize(title):
+                counts[token] = counts.get(token, 0) + TITLE_WEIGHT
+            for token in tokenize(lot.get(f"description_{lang}") or "") + attrs:
+                counts[token] = counts.get(token, 0) + 1
+            postings = self._postings[lang]
+            for token, tf in counts.items():
+                plist = postings.get(token)
+                if plist is None:
+                    plist = postings[token] = array("I")
+                plist.append(num)
+                plist.append(tf)
+            self._titles[lang].append(title)
+            self._lengths[lang].append(sum(counts.values()))
+
+    def write(self, root: Path, manifest: BuildManifest | None = None) -> dict[str, int]:
+        """Write the index of every language under ``root / SEARCH_DIR``.
+
+        Shards up to date in ``manifest`` are left alone.  Returns counts of
+        documents, shards and written files.
+        """
+        stats = {"items": len(self._keys), "shards": 0, "written": 0}
+        for lang in self.langs:
+            out = root / SEARCH_DIR / lang
+            files = self._lang_files(lang)
+            stats["shards"] += len(files) - 1
+            for name, data in files.items():
+                path = out / name
+                version = hashlib.sha256(data).hexdigest()
+                if manifest is None or not manifest.fresh(path, version):
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.write_bytes(data)
+                    stats["written"] += 1
+        log.info("Search index written", **stats)
+        return stats
+
+    def _lang_files(self, lang: str) -> dict[str, bytes]:
+        """Return file name to content of the index of ``lang``."""
+        n = len(self._keys)
+        lengths = self._lengths[lang]
+        postings = self._postings[lang]
+        stop = set()
+        if n >= STOP_MIN_DOCS:
+            stop = {t for t, p in postings.items() if len(p) // 2 > STOP_DF * n}
+        terms = sorted(t for t in postings if t not in stop)
+        term_shards = _shard_count(
+            sum(len(postings[t]) // 2 for t in terms), TERM_SHARD_POSTINGS
+        )
+        buckets: list[dict] = [{} for _ in range(term_shards)]
+        keys = self._keys
+        doc_lengths = lengths.tolist()
+        for term in terms:
+            # Postings follow the order lots were added in, which is the lot
+            # file order for both full and streaming builds.
+            plist = postings[term]
+            buckets[term_hash(term) % term_shards][term] = [
+                [keys[num], tf, doc_lengths[num]]
+                for num, tf in zip(plist[::2], plist[1::2])
+            ]
+
+        doc_shards = _shard_count(n, DOC_SHARD_DOCS)
+        docs: list[dict] = [{} for _ in range(doc_shards)]
+        titles = self._titles[lang]
+        for num, key in enumerate(self._keys):
+            docs[term_hash(key) % doc_shards][key] = [
+                self._pages[num],
+                titles[num],
+                self._thumbs[num],
+            ]
+
+        files = {}
+        for i, bucket in enumerate(buckets):
+            files[f"t{i}.json"] = _dump(bucket)
+        for i, bucket in enumerate(docs):
+            files[f"d{i}.json"] = _dump(bucket)
+        version = {name: hashlib.sha256(data).hexdigest()[:8] for name, data in files.items()}
+        meta = {
+            "lang": lang,
+            "n": n,
+            "avgdl": round(sum(lengths) / n, 4) if n else 0,
+            "k1": BM25_K1,
+            "b": BM25_B,
+            "stop": sorted(stop),
+            "terms": [version[f"t{i}.json"] for i in range(term_shards)],
+            "docs": [version[f"d{i}.json"] for i in range(doc_shards)],
+        }
+        files["meta.json"] = _dump(meta)
+        return files
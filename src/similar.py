@@ -2,23 +2,35 @@
 
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
 
 from log_utils import get_logger, install_excepthook
 from oom_utils import prefer_oom_kill
-from lot_io import iter_lot_files, read_lots
-from post_io import RAW_DIR, read_post, raw_post_path
-from moderation import should_skip_message, should_skip_lot
+from lot_io import LotStore
+from post_io import RAW_DIR
+from knn_utils import KNN_MEMORY_MB
+from neighbour_table import NeighbourTable
 from similar_utils import (
     _load_embeddings,
     _load_similar,
+    _projection_changed,
+    _drop_ann_indexes,
     _save_similar,
-    _load_more_user,
     _save_more_user,
     _prune_similar,
     _calc_similar_nn,
+    _calc_similar_ann,
+    _calc_similar_quant,
+    _calc_similar_partitioned,
+    _partition_index_file,
+    _partition_keys,
+    PARTITION_MIN,
+    ANN_INDEX_FILE,
+    ANN_NPROBE,
+    QUANT_RERANK,
     _sync_embeddings,
-    _similar_by_user,
+    _update_more_user,
 )
 
 log = get_logger().bind(script=__file__)
@@ -30,37 +42,63 @@ LOTS_DIR = Path("data/lots")
 
 def _iter_lots() -> list[dict]:
     """Return lots filtered by moderation rules."""
-    lots: list[dict] = []
-    for path in iter_lot_files(LOTS_DIR):
-        data = read_lots(path)
-        if not data:
-            continue
-        rel = path.relative_to(LOTS_DIR).with_suffix("")
-        base = rel.name
-        prefix = rel.parent
-        for i, lot in enumerate(data):
-            src = lot.get("source:path")
-            meta: dict[str, str] | None = None
-            text = ""
-            if src:
-                raw_path = raw_post_path(src, RAW_DIR)
-                meta, text = read_post(raw_path)
-                if should_skip_message(meta, text):
-                    continue
-            if should_skip_lot(lot):
-                continue
-            lot["_id"] = str(prefix / f"{base}-{i}") if prefix.parts else f"{base}-{i}"
-            lots.append(lot)
+    lots = LotStore(LOTS_DIR, RAW_DIR).lots()
     log.info("Loaded lots", count=len(lots))
     return lots
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     """Update ``data/similar`` using available embeddings."""
+    parser = argparse.ArgumentParser(description="Compute lot recommendations")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--ann",
+        action="store_true",
+        help="Use the persisted approximate index instead of exact search",
+    )
+    mode.add_argument(
+        "--int8",
+        action="store_true",
+        help="Search an int8 quantised copy of the vectors and re-rank the best",
+    )
+    parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=ANN_NPROBE,
+        help="Inverted lists scanned per query in --ann mode (higher is more exact)",
+    )
+    parser.add_argument(
+        "--rerank",
+        type=int,
+        default=QUANT_RERANK,
+        help="Candidates re-ranked with full precision vectors in --int8 mode",
+    )
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help="Search only lots of the same market:deal and sell_item cluster",
+    )
+    parser.add_argument(
+        "--partition-min",
+        type=int,
+        default=PARTITION_MIN,
+        help="Smaller partitions fall back to the global corpus",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=float,
+        default=KNN_MEMORY_MB,
+        help="Memory budget for one block of the exact similarity search",
+    )
+    args = parser.parse_args(argv)
+
     log.info("Computing similar lots")
     embeddings = _load_embeddings()
     lots = _iter_lots()
-    sim_map = _load_similar()
+    stale = _projection_changed()
+    if stale:
+        log.warning("Projection changed, recomputing all neighbours")
+    sim_map = NeighbourTable() if stale else _load_similar()
 
     lots, embeddings = _sync_embeddings(lots, embeddings)
     id_to_vec = {lot["_id"]: embeddings.get(lot["_id"]) for lot in lots}
@@ -70,13 +108,48 @@ def main() -> None:
     # ``numpy.ndarray`` does not define boolean semantics, thus check explicitly
     # for ``None`` instead of relying on truthiness which raises an error.
     vec_ids = [i for i in lot_keys if id_to_vec.get(i) is not None]
-    _calc_similar_nn(sim_map, new_ids, vec_ids, id_to_vec)
+    indexes: set[str] = set()
+
+    def search(
+        q_ids: list[str],
+        c_ids: list[str],
+        key: str | None,
+        reciprocal: set[str] | None = None,
+    ) -> None:
+        if args.ann:
+            name = ANN_INDEX_FILE if key is None else _partition_index_file(key)
+            indexes.add(name)
+            _calc_similar_ann(
+                sim_map, q_ids, c_ids, id_to_vec, args.nprobe, name, reciprocal, stale
+            )
+        elif args.int8:
+            _calc_similar_quant(
+                sim_map, q_ids, c_ids, id_to_vec, args.memory_mb, args.rerank, reciprocal
+            )
+        else:
+            _calc_similar_nn(
+                sim_map, q_ids, c_ids, id_to_vec, args.memory_mb, reciprocal
+            )
+
+    if args.partition:
+        keys = _partition_keys(lots)
+        _calc_similar_partitioned(new_ids, vec_ids, keys, search, args.partition_min)
+    else:
+        search(new_ids, vec_ids, None)
 
-    more_user_map = _similar_by_user(lots, id_to_vec)
+    more_user_map, groups = _update_more_user(lots, id_to_vec, args.memory_mb)
 
-    _save_similar(sim_map)
-    _save_more_user(more_user_map)
-    log.info("Similar cache updated")
+    sim_touched, sim_same = _save_similar(sim_map)
+    user_touched, user_same = _save_more_user(more_user_map, groups)
+    log.info(
+        "Similar cache updated",
+        touched=sim_touched + user_touched,
+        unchanged=sim_same + user_same,
+    )
+    if stale:
+        # Only now the new projection is recorded; indexes not rebuilt above
+        # still hold centroids of the old vector space.
+        _drop_ann_indexes(indexes)
 
 
 if __name__ == "__main__":
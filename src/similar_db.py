@@ -0,0 +1,174 @@
+"""Consolidated SQLite store for the similar and per-seller neighbour caches.
+
+``data/similar`` and ``data/more_user`` hold one JSON file per lot file which
+``build_site.py`` used to ``rglob`` and validate entry by entry before
+rendering a single page.  This module keeps both caches in one SQLite file
+keyed by ``(kind, lot id)`` so a page fetches its neighbours with one indexed
+lookup and ``similar.py`` updates only the rows whose lists changed.
+
+Every row stores the neighbour list as compact JSON, exactly what the pages
+consume, so no per-field validation is needed when reading.  The database is
+the canonical copy of both caches.  A small ``state`` table keeps a generation
+counter per cache kind, bumped whenever rows change, and other bookkeeping of
+``similar.py`` such as the digests of the seller groups.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from log_utils import get_logger
+
+log = get_logger().bind(module=__name__)
+
+SIMILAR = "similar"
+MORE_USER = "more_user"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS neighbours (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class NeighbourDB:
+    """Connection to the consolidated neighbour cache at ``path``."""
+
+    def __init__(self, path: Path, readonly: bool = False):
+        self.path = Path(path)
+        if readonly:
+            # ``as_uri`` escapes characters like ``?`` and ``#`` in the path.
+            uri = f"{self.path.resolve().as_uri()}?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "NeighbourDB":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def get(self, kind: str, lot_id: str, default=None) -> list[dict] | None:
+        """Return neighbours of ``lot_id`` in cache ``kind`` or ``default``."""
+        row = self.conn.execute(
+            "SELECT data FROM neighbours WHERE kind = ? AND id = ?", (kind, lot_id)
+        ).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def ids(self, kind: str) -> set[str]:
+        """Return every lot id stored for ``kind``."""
+        cur = self.conn.execute("SELECT id FROM neighbours WHERE kind = ?", (kind,))
+        return {r[0] for r in cur}
+
+    def items(self, kind: str) -> Iterator[tuple[str, list[dict]]]:
+        """Yield ``(lot_id, neighbours)`` pairs stored for ``kind``."""
+        cur = self.conn.execute(
+            "SELECT id, data FROM neighbours WHERE kind = ? ORDER BY id", (kind,)
+        )
+        for lot_id, data in cur:
+            yield lot_id, json.loads(data)
+
+    def update(self, kind: str, entries: Iterable[tuple[str, list[dict]]]) -> int:
+        """Upsert ``entries`` in place and return how many rows changed.
+
+        Rows whose serialised list is identical are left untouched.
+        """
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO neighbours (kind, id, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (kind, id) DO UPDATE SET data = excluded.data "
+                "WHERE data != excluded.data",
+                (
+                    (kind, lot_id, json.dumps(sims, ensure_ascii=False, separators=(",", ":")))
+                    for lot_id, sims in entries
+                ),
+            )
+        return self.conn.total_changes - before
+
+    def retain(self, kind: str, valid_ids: set[str]) -> int:
+        """Delete rows of ``kind`` not listed in ``valid_ids``; return count."""
+        stale = self.ids(kind) - valid_ids
+        if stale:
+            with self.conn:
+                self.conn.executemany(
+                    "DELETE FROM neighbours WHERE kind = ? AND id = ?",
+                    ((kind, lot_id) for lot_id in stale),
+                )
+        return len(stale)
+
+    def get_state(self, key: str, default=None):
+        """Return the JSON value stored under ``key`` or ``default``."""
+        try:
+            row = self.conn.execute(
+                "SELECT value FROM state WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.OperationalError:  # created before the state table
+            return default
+        return default if row is None else json.loads(row[0])
+
+    def set_state(self, key: str, value) -> None:
+        """Store JSON-serialisable ``value`` under ``key``."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO state (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value, ensure_ascii=False, separators=(",", ":"))),
+            )
+
+    def generation(self, kind: str) -> int:
+        """Return the change counter of cache ``kind``."""
+        return int(self.get_state(f"generation:{kind}", 0))
+
+    def bump(self, kind: str) -> int:
+        """Advance and return the change counter of cache ``kind``."""
+        generation = self.generation(kind) + 1
+        self.set_state(f"generation:{kind}", generation)
+        return generation
+
+    def view(self, kind: str) -> "NeighbourView":
+        """Return a read-only mapping-like view of cache ``kind``."""
+        return NeighbourView(self, kind)
+
+
+class NeighbourView:
+    """Lazy ``{lot_id: neighbours}`` mapping backed by :class:`NeighbourDB`."""
+
+    def __init__(self, db: NeighbourDB, kind: str):
+        self.db = db
+        self.kind = kind
+
+    def get(self, lot_id: str, default=None) -> list[dict] | None:
+        return self.db.get(self.kind, lot_id, default)
+
+    def __getitem__(self, lot_id: str) -> list[dict]:
+        result = self.get(lot_id)
+        if result is None:
+            raise KeyError(lot_id)
+        return result
+
+    def __contains__(self, lot_id: object) -> bool:
+        return self.get(lot_id) is not None  # type: ignore[arg-type]
+
+    def close(self) -> None:
+        """Close the underlying connection, shared by all views of it."""
+        self.db.close()
@@ -2,6 +2,9 @@
 
 from __future__ import annotations
 
+import base64
+import hashlib
+import json
 import math
 from pathlib import Path
 
@@ -11,45 +14,84 @@ except ModuleNotFoundError:  # Debian ships the module as ``progressbar2``
     import progressbar2 as progressbar
 import numpy as np
 
-from notes_utils import load_json, write_json
-from sklearn.neighbors import NearestNeighbors
+from notes_utils import load_json
+import embed_io
+import embed_reduce
 
 from lot_io import LOTS_DIR, EMBED_DIR, lot_json_path, get_seller
+from ann_index import IVFIndex
+from neighbour_table import NeighbourTable
+from similar_db import MORE_USER, SIMILAR, NeighbourDB, NeighbourView
+from knn_utils import (
+    KNN_MEMORY_MB,
+    chunk_rows,
+    grouped_topk_cosine,
+    normalise,
+    quantise_int8,
+    rerank_cosine,
+    topk_cosine,
+    topk_cosine_int8,
+)
 from log_utils import get_logger
 
 log = get_logger().bind(module=__name__)
 
 SIMILAR_DIR = Path("data/similar")
 MORE_USER_DIR = Path("data/more_user")
-
-
-def _load_embeddings() -> dict[str, np.ndarray]:
+ANN_INDEX_FILE = "ann_index.npz"
+SIMILAR_TABLE_FILE = "table.npz"
+# Consolidated SQLite cache with both neighbour lists keyed by lot id.  This
+# is the canonical store, ``SIMILAR_TABLE_FILE`` only speeds up loading it.
+SIMILAR_DB_FILE = "cache.sqlite"
+# ``sha256sum`` style manifest of the JSON files in each cache directory.
+HASHES_FILE = "hashes.sha256"
+# ``state`` key holding the digest of every seller group.
+GROUPS_STATE = "more_user_groups"
+# ``state`` key holding the ``embed_reduce`` projection the distances used.
+PROJECTION_STATE = "projection"
+# Number of inverted lists scanned per query by ``_calc_similar_ann``.
+ANN_NPROBE = 8
+# Candidates from the ``int8`` search re-ranked with full precision vectors.
+QUANT_RERANK = 24
+# ``cluster_items.py`` output used to split ``sell_item`` partitions.
+CLUSTER_FILE = Path("data/item_clusters.json")
+# Partitions with fewer lots search the global corpus instead.
+PARTITION_MIN = 50
+
+
+def _load_embeddings(project: bool = True) -> dict[str, np.ndarray]:
     """Return mapping of lot id to embedding vector.
 
-    Vectors are stored as ``numpy.float16`` arrays which halves the
-    memory footprint compared to ``float32`` and drastically reduces
-    memory usage compared to plain Python lists.
+    Vectors come from the binary store maintained by ``embed_io`` and are
+    views into a read-only ``numpy.memmap`` so opening even a large store is
+    nearly free.  JSON files the store has not imported, or all of them when
+    no store exists yet, are parsed as a fallback.  Values stay ``float32`` to
+    preserve precision when formatting for HTML.  When ``embed_reduce`` saved
+    a projection next to the vectors and ``project`` is true every vector is
+    reduced with it.
     """
     if not EMBED_DIR.exists():
         log.info("Embedding directory missing", path=str(EMBED_DIR))
         return {}
-    data: dict[str, np.ndarray] = {}
-    for path in EMBED_DIR.rglob("*.json"):
-        obj = load_json(path)
-        if isinstance(obj, dict) and "id" in obj and "vec" in obj:
-            # Keep vectors as ``float32`` to preserve precision when formatting
-            # for HTML.  ``float16`` would slightly alter values and break
-            # tests expecting round-trip parity.
-            data[obj["id"]] = np.asarray(obj["vec"], dtype=np.float32)
-        elif isinstance(obj, list):
-            for item in obj:
-                if isinstance(item, dict) and "id" in item and "vec" in item:
-                    data[item["id"]] = np.asarray(item["vec"], dtype=np.float32)
-                else:
-                    log.error("Bad embedding entry", file=str(path))
+    index, matrix = embed_io.load_store(EMBED_DIR)
+    if matrix is not None:
+        data: dict[str, np.ndarray] = {lid: matrix[row] for lid, row in index.items()}
+        imported = embed_io.imported_files(EMBED_DIR)
+        if imported is None:
+            newer = embed_io.ids_path(EMBED_DIR).stat().st_mtime
+            extra = embed_io.load_json_vectors(EMBED_DIR, newer_than=newer)
         else:
-            log.error("Failed to parse embedding file", file=str(path))
+            extra = embed_io.load_json_vectors(EMBED_DIR, skip=imported)
+        if extra:
+            log.debug("Embeddings newer than store", count=len(extra))
+            data.update(extra)
+    else:
+        data = embed_io.load_json_vectors(EMBED_DIR)
     log.info("Loaded embeddings", count=len(data))
+    projection = embed_reduce.load_projection(EMBED_DIR) if project else None
+    if projection is not None and data:
+        data = projection.apply_map(data)
+        log.info("Projected embeddings", dim=projection.dim)
     return data
 
 
@@ -65,16 +107,24 @@ def _cos_sim(a: "list[float] | np.ndarray", b: "list[float] | np.ndarray") -> fl
     return dot / (na * nb)
 
 
-def _format_vector(vec: "list[float] | np.ndarray | None") -> str | None:
-    """Return compact JSON representation for ``vec``."""
+def _encode_vectors(vectors: "list[list[float] | np.ndarray]") -> bytes:
+    """Return ``vectors`` as raw ``int8`` rows for the browser.
+
+    Pages only compare vectors by cosine similarity, which ignores the
+    per-row scale, so the scales of :func:`knn_utils.quantise_int8` are
+    dropped.  ``site.js`` reads the bytes into an ``Int8Array``.
+    """
+    if not len(vectors):
+        return b""
+    codes, _ = quantise_int8(vectors)
+    return codes.tobytes()
+
+
+def _encode_vector(vec: "list[float] | np.ndarray | None") -> str | None:
+    """Return ``vec`` as base64 encoded :func:`_encode_vectors` bytes."""
     if vec is None:
         return None
-    if isinstance(vec, np.ndarray):
-        values = vec.tolist()
-    else:
-        values = list(vec)
-    parts = [f"{v:.4f}".rstrip("0").rstrip(".") for v in values]
-    return "[" + ",".join(parts) + "]"
+    return base64.b64encode(_encode_vectors([vec])).decode("ascii")
 
 
 def _similar_path(lot_path: Path) -> Path:
@@ -89,10 +139,28 @@ def _more_user_path(lot_path: Path) -> Path:
     return (MORE_USER_DIR / rel).with_suffix(".json")
 
 
-def _load_similar() -> dict[str, list[dict]]:
-    """Return cached similar lots mapping."""
+def _load_similar() -> NeighbourTable:
+    """Return cached similar lots as a :class:`NeighbourTable`.
+
+    The database is read through the binary table written by
+    :func:`_save_similar` while the table matches its generation.  The JSON
+    files are parsed only when no database exists yet, e.g. after an upgrade.
+    Check :func:`_projection_changed` first; stale distances are returned
+    as they are.
+    """
+    db_path = SIMILAR_DIR / SIMILAR_DB_FILE
+    if db_path.exists():
+        with NeighbourDB(db_path, readonly=True) as db:
+            generation = db.generation(SIMILAR)
+            table = NeighbourTable.load(SIMILAR_DIR / SIMILAR_TABLE_FILE)
+            if table is not None and table.generation == generation:
+                log.info("Loaded similar table", count=len(table))
+                return table
+            table = NeighbourTable.from_dict(dict(db.items(SIMILAR)))
+        log.info("Loaded similar database", count=len(table))
+        return table
     if not SIMILAR_DIR.exists():
-        return {}
+        return NeighbourTable()
     data: dict[str, list[dict]] = {}
     for path in SIMILAR_DIR.rglob("*.json"):
         obj = load_json(path)
@@ -115,11 +183,38 @@ def _load_similar() -> dict[str, list[dict]]:
                         data[item["id"]] = sims
     if data:
         log.info("Loaded similar cache", count=len(data))
-    return data
+    return NeighbourTable.from_dict(data)
+
+
+def _projection_changed() -> bool:
+    """Return ``True`` when the database holds distances of another vector space.
+
+    :func:`_save_similar` records the ``embed_reduce`` projection digest the
+    distances were measured with.  Distances of an older projection are not
+    comparable with new ones, so everything has to be searched again.
+    """
+    db_path = SIMILAR_DIR / SIMILAR_DB_FILE
+    if not db_path.exists():
+        return False
+    with NeighbourDB(db_path, readonly=True) as db:
+        recorded = db.get_state(PROJECTION_STATE)
+    return recorded != embed_reduce.projection_digest(EMBED_DIR)
+
+
+def _drop_ann_indexes(keep: set[str]) -> int:
+    """Delete persisted ANN indexes under ``SIMILAR_DIR`` not named in ``keep``."""
+    dropped = 0
+    for path in SIMILAR_DIR.glob("ann_index*.npz"):
+        if path.name not in keep:
+            path.unlink()
+            dropped += 1
+    if dropped:
+        log.info("Dropped stale ANN indexes", count=dropped)
+    return dropped
 
 
 def _load_more_user() -> dict[str, list[dict]]:
-    """Return cached per-user lot mapping."""
+    """Return the per-user lot mapping from the ``MORE_USER_DIR`` JSON files."""
     if not MORE_USER_DIR.exists():
         return {}
     data: dict[str, list[dict]] = {}
@@ -143,105 +238,268 @@ def _load_more_user() -> dict[str, list[dict]]:
     return data
 
 
-def _save_similar(sim_map: dict[str, list[dict]]) -> None:
-    """Write ``sim_map`` to ``SIMILAR_DIR`` mirroring ``LOTS_DIR`` layout."""
+def _load_hashes(root: Path) -> dict[str, str]:
+    """Return ``{relative path: sha256}`` recorded for files under ``root``."""
+    path = root / HASHES_FILE
+    if not path.exists():
+        return {}
+    hashes: dict[str, str] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        digest, sep, rel = line.partition("  ")
+        if sep and len(digest) == 64:
+            hashes[rel] = digest
+    return hashes
+
+
+def _write_changed(root: Path, files: dict[Path, list]) -> tuple[int, int]:
+    """Write ``files`` under ``root`` skipping those whose content is unchanged.
+
+    Payloads are serialised like :func:`notes_utils.write_json` and compared
+    with the hash manifest from the previous run so untouched files keep their
+    mtime and are not picked up by the next deploy.  Files missing on disk are
+    always written.  Returns ``(touched, unchanged)`` counts.
+    """
+    old = _load_hashes(root)
+    hashes: dict[str, str] = {}
+    touched = unchanged = 0
+    for path, items in files.items():
+        text = json.dumps(items, ensure_ascii=False, indent=2)
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        rel = path.relative_to(root).as_posix()
+        hashes[rel] = digest
+        if old.get(rel) == digest and path.exists():
+            unchanged += 1
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+        touched += 1
+    if hashes != old:
+        root.mkdir(parents=True, exist_ok=True)
+        lines = [f"{hashes[rel]}  {rel}\n" for rel in sorted(hashes)]
+        (root / HASHES_FILE).write_text("".join(lines), encoding="utf-8")
+    log.info("Wrote cache files", root=str(root), touched=touched, unchanged=unchanged)
+    return touched, unchanged
+
+
+def _open_neighbour_caches() -> tuple[
+    "NeighbourView | NeighbourTable", "NeighbourView | dict[str, list[dict]]"
+]:
+    """Return lookups for the similar and per-user caches.
+
+    With the consolidated database present both are lazy views fetching one
+    lot at a time; release them with :func:`_close_neighbour_caches`.
+    Otherwise the JSON trees are loaded into memory.
+    """
+    db_path = SIMILAR_DIR / SIMILAR_DB_FILE
+    if db_path.exists():
+        db = NeighbourDB(db_path, readonly=True)
+        log.info("Using similar database", path=str(db_path))
+        return db.view(SIMILAR), db.view(MORE_USER)
+    return _load_similar(), _load_more_user()
+
+
+def _close_neighbour_caches(*caches) -> None:
+    """Close database connections behind caches from ``_open_neighbour_caches``."""
+    for cache in caches:
+        if isinstance(cache, NeighbourView):
+            cache.close()
+
+
+def _update_db(
+    kind: str, entries: dict[str, list[dict]], state: dict | None = None
+) -> tuple[int, int, int]:
+    """Sync cache ``kind`` of the consolidated database with ``entries``.
+
+    ``state`` values are stored alongside.  Returns the changed and removed
+    row counts and the generation of ``kind`` after the update.
+    """
+    with NeighbourDB(SIMILAR_DIR / SIMILAR_DB_FILE) as db:
+        changed = db.update(kind, entries.items())
+        removed = db.retain(kind, set(entries))
+        if changed or removed:
+            generation = db.bump(kind)
+        else:
+            generation = db.generation(kind)
+        for key, value in (state or {}).items():
+            db.set_state(key, value)
+    log.info("Updated similar database", kind=kind, changed=changed, removed=removed)
+    return changed, removed, generation
+
+
+def _save_similar(sim_map: NeighbourTable) -> tuple[int, int]:
+    """Write ``sim_map`` to the database and ``SIMILAR_DIR`` JSON files.
+
+    The database is the store ``similar.py`` and ``build_site.py`` read; the
+    JSON files mirror the ``LOTS_DIR`` layout for the deploy and other
+    consumers.  ``table.npz`` is rewritten only when rows changed or it does
+    not match the database, and only JSON files whose neighbour lists changed
+    are rewritten.  Returns the ``(touched, unchanged)`` file counts.
+    """
+    entries = dict(sim_map.items())
+    state = {PROJECTION_STATE: embed_reduce.projection_digest(EMBED_DIR)}
+    _, _, generation = _update_db(SIMILAR, entries, state)
+    path = SIMILAR_DIR / SIMILAR_TABLE_FILE
+    if sim_map.generation != generation or not path.exists():
+        sim_map.save(path, generation)
     files: dict[Path, list] = {}
-    for lot_id, sims in sim_map.items():
-        lot_path = lot_json_path(lot_id, LOTS_DIR)
-        out = _similar_path(lot_path)
+    for lot_id, sims in entries.items():
+        out = _similar_path(lot_json_path(lot_id, LOTS_DIR))
         files.setdefault(out, []).append({"id": lot_id, "similar": sims})
-    for path, items in files.items():
-        write_json(path, items)
+    return _write_changed(SIMILAR_DIR, files)
 
 
-def _save_more_user(more_map: dict[str, list[dict]]) -> None:
-    """Write ``more_map`` to ``MORE_USER_DIR`` mirroring ``LOTS_DIR`` layout."""
+def _save_more_user(
+    more_map: dict[str, list[dict]], groups: dict[str, str] | None = None
+) -> tuple[int, int]:
+    """Write ``more_map`` to the database and ``MORE_USER_DIR`` JSON files.
+
+    ``groups`` are the seller group digests from :func:`_update_more_user`.
+    Returns ``(touched, unchanged)`` file counts like :func:`_save_similar`.
+    """
+    state = None if groups is None else {GROUPS_STATE: groups}
+    _update_db(MORE_USER, more_map, state)
     files: dict[Path, list] = {}
     for lot_id, sims in more_map.items():
-        lot_path = lot_json_path(lot_id, LOTS_DIR)
-        out = _more_user_path(lot_path)
+        out = _more_user_path(lot_json_path(lot_id, LOTS_DIR))
         files.setdefault(out, []).append({"id": lot_id, "more_user": sims})
-    for path, items in files.items():
-        write_json(path, items)
-
-
-def _update_reciprocal(sim_map: dict[str, list[dict]], lot_id: str, sims: list[dict]) -> None:
-    """Insert ``lot_id`` into caches of lots listed in ``sims`` if closer."""
-    for entry in sims:
-        other = entry["id"]
-        dist = entry["dist"]
-        items = sim_map.setdefault(other, [])
-        found = False
-        for item in items:
-            if item["id"] == lot_id:
-                item["dist"] = dist
-                found = True
-                break
-        if not found:
-            items.append({"id": lot_id, "dist": dist})
-        items.sort(key=lambda x: x["dist"])
-        if len(items) > 6:
-            del items[6:]
-
-
-def _prune_similar(sim_map: dict[str, list[dict]], valid_ids: set[str]) -> None:
+    return _write_changed(MORE_USER_DIR, files)
+
+
+def _update_reciprocal(
+    sim_map: NeighbourTable,
+    lot_id: str,
+    neigh_ids: list[str],
+    dists: list[float],
+    reciprocal: set[str] | None = None,
+) -> None:
+    """Insert ``lot_id`` into caches of lots listed in ``neigh_ids`` if closer.
+
+    With ``reciprocal`` given only the lots in it are updated.
+    """
+    for other, dist in zip(neigh_ids, dists):
+        if reciprocal is None or other in reciprocal:
+            sim_map.offer(other, lot_id, dist)
+
+
+def _prune_similar(sim_map: NeighbourTable, valid_ids: set[str]) -> None:
     """Drop cache entries referring to ids not in ``valid_ids``."""
-    removed = set(sim_map) - valid_ids
-    for key in removed:
-        sim_map.pop(key, None)
-    for items in sim_map.values():
-        items[:] = [i for i in items if i.get("id") in valid_ids]
+    sim_map.prune(valid_ids)
 
 
 def _calc_similar_nn(
-    sim_map: dict[str, list[dict]],
+    sim_map: NeighbourTable,
     new_ids: list[str],
     vec_ids: list[str],
     id_to_vec: dict[str, list[float]],
+    memory_mb: float = KNN_MEMORY_MB,
+    reciprocal: set[str] | None = None,
 ) -> None:
-    """Fill ``sim_map`` for ``new_ids`` using a nearest neighbour search.
+    """Fill ``sim_map`` for ``new_ids`` using an exact nearest neighbour search.
 
     ``vec_ids`` lists all lots that have an embedding.  ``new_ids`` is a subset
-    for which we still need recommendations.  We gather vectors for
-    ``vec_ids`` and use ``NearestNeighbors`` from scikit-learn to find the
-    closest items.  Embeddings of lots without a vector are skipped.
+    for which we still need recommendations.  The vectors for ``vec_ids`` are
+    normalised once and :func:`knn_utils.topk_cosine` ranks them in chunks
+    bounded by ``memory_mb``.  Embeddings of lots without a vector are skipped.
+    ``reciprocal`` limits the lots offered the queries as neighbours, see
+    :func:`_store_neighbours`.
     """
     if not vec_ids:
         for lid in new_ids:
-            sim_map[lid] = []
+            sim_map.set(lid, [], [])
         return
 
-    # Convert embedding map to a list so we can build a contiguous matrix for
-    # scikit-learn.  ``vec_ids`` preserve the order of vectors in this matrix.
-    matrix = [id_to_vec[i] for i in vec_ids]
-    k = min(7, len(matrix))
-
-    # Fit nearest neighbours on the full matrix once.
-    nn = NearestNeighbors(n_neighbors=k, metric="cosine")
-    nn.fit(matrix)
+    # ``vec_ids`` preserve the order of vectors in the normalised matrix.
+    matrix = normalise(np.stack([np.asarray(id_to_vec[i]) for i in vec_ids]))
 
     # Map each lot id to its row index to quickly look up vectors.
     index_map = {v: idx for idx, v in enumerate(vec_ids)}
 
-    # Build a batch of vectors to query at once.  Lots missing an embedding get
+    # Build a batch of rows to query at once.  Lots missing an embedding get
     # an empty result immediately.
-    queries = []
+    q_rows = []
     q_ids = []
     for lid in new_ids:
         idx = index_map.get(lid)
         if idx is not None:
-            queries.append(matrix[idx])
+            q_rows.append(idx)
             q_ids.append(lid)
         else:
-            sim_map[lid] = []
+            sim_map.set(lid, [], [])
 
-    if not queries:
+    if not q_ids:
         return
 
-    # Find neighbours for all queries in a single call which is much faster than
-    # querying one by one.
-    dist, neigh = nn.kneighbors(queries, n_neighbors=k)
+    # The query item itself is excluded by passing its row index.
+    dist, neigh = topk_cosine(matrix[q_rows], matrix, 6, q_rows, memory_mb)
+    _store_neighbours(sim_map, q_ids, dist, neigh, vec_ids, reciprocal)
+
 
+def _calc_similar_quant(
+    sim_map: NeighbourTable,
+    new_ids: list[str],
+    vec_ids: list[str],
+    id_to_vec: dict[str, list[float]],
+    memory_mb: float = KNN_MEMORY_MB,
+    rerank: int = QUANT_RERANK,
+    reciprocal: set[str] | None = None,
+) -> None:
+    """Fill ``sim_map`` for ``new_ids`` searching an ``int8`` copy of the vectors.
+
+    The corpus is quantised chunk by chunk so only a quarter of the ``float32``
+    matrix is ever resident.  Every query keeps full precision, collects
+    ``rerank`` candidates with :func:`knn_utils.topk_cosine_int8` and the final
+    six are picked by exact cosine against the original vectors.
+    """
+    if not vec_ids:
+        for lid in new_ids:
+            sim_map.set(lid, [], [])
+        return
+
+    vectors = [id_to_vec[i] for i in vec_ids]
+    index_map = {v: idx for idx, v in enumerate(vec_ids)}
+    q_rows = []
+    q_ids = []
+    for lid in new_ids:
+        idx = index_map.get(lid)
+        if idx is not None:
+            q_rows.append(idx)
+            q_ids.append(lid)
+        else:
+            sim_map.set(lid, [], [])
+    if not q_ids:
+        return
+
+    codes, scales = quantise_int8(vectors, memory_mb)
+    log.info("Quantised embeddings", count=len(vec_ids), mb=round(codes.nbytes / 2**20, 1))
+    dist = np.full((len(q_rows), 6), np.inf, dtype=np.float32)
+    neigh = np.full((len(q_rows), 6), -1, dtype=np.int64)
+    step = chunk_rows(codes.shape[1], memory_mb)
+    for start in range(0, len(q_rows), step):
+        rows = q_rows[start : start + step]
+        queries = normalise(np.stack([np.asarray(vectors[r]) for r in rows]))
+        _, cand = topk_cosine_int8(
+            queries, codes, scales, max(rerank, 6), rows, memory_mb
+        )
+        d, nb = rerank_cosine(queries, cand, vectors, 6, memory_mb)
+        dist[start : start + len(rows)] = d
+        neigh[start : start + len(rows)] = nb
+    _store_neighbours(sim_map, q_ids, dist, neigh, vec_ids, reciprocal)
+
+
+def _store_neighbours(
+    sim_map: NeighbourTable,
+    q_ids: list[str],
+    dist,
+    neigh,
+    vec_ids: list[str],
+    reciprocal: set[str] | None = None,
+) -> None:
+    """Write neighbour rows for ``q_ids`` into ``sim_map``.
+
+    ``neigh`` holds row indexes into ``vec_ids`` without the query item itself.
+    Negative indexes mark missing neighbours and are skipped.  Every query is
+    also offered to its neighbours, or only to those in ``reciprocal``.
+    """
     # ``progressbar2`` changed the ``maxval`` argument to ``max_value`` in newer
     # releases.  Handle both so we work across distributions.
     widgets = [
@@ -260,17 +518,156 @@ def _calc_similar_nn(
             raise
     bar.start()
     for i, lot_id in enumerate(q_ids):
-        # Skip the first neighbour which is the query item itself.
-        sims = []
-        for d, other_idx in zip(dist[i][1:], neigh[i][1:]):
-            other_id = vec_ids[other_idx]
-            sims.append({"id": other_id, "dist": float(d)})
-        sim_map[lot_id] = sims
-        _update_reciprocal(sim_map, lot_id, sims)
+        valid = neigh[i] >= 0
+        other_ids = [vec_ids[j] for j in neigh[i][valid]]
+        dists = dist[i][valid].tolist()
+        sim_map.set(lot_id, other_ids, dists)
+        _update_reciprocal(sim_map, lot_id, other_ids, dists, reciprocal)
         bar.update(i + 1)
     bar.finish()
 
 
+def _calc_similar_ann(
+    sim_map: NeighbourTable,
+    new_ids: list[str],
+    vec_ids: list[str],
+    id_to_vec: dict[str, list[float]],
+    nprobe: int = ANN_NPROBE,
+    index_file: str = ANN_INDEX_FILE,
+    reciprocal: set[str] | None = None,
+    retrain: bool = False,
+) -> None:
+    """Fill ``sim_map`` for ``new_ids`` using the persisted IVF index.
+
+    The index ``index_file`` under ``SIMILAR_DIR`` is loaded, updated with the
+    ids that appeared since the last run and saved again.  It is retrained from
+    scratch only when missing, when the corpus outgrew its centroids or when
+    ``retrain`` is set, e.g. after the vector space changed.
+    ``nprobe`` trades recall for speed; see :mod:`ann_index`.
+    """
+    if not vec_ids:
+        for lid in new_ids:
+            sim_map.set(lid, [], [])
+        return
+
+    matrix = normalise(np.stack([np.asarray(id_to_vec[i]) for i in vec_ids]))
+    path = SIMILAR_DIR / index_file
+    index = None if retrain else IVFIndex.load(path)
+    if index is None or index.needs_retrain(len(vec_ids), matrix.shape[1]):
+        index = IVFIndex.train(vec_ids, matrix)
+    else:
+        added = index.update(vec_ids, matrix)
+        log.info("Updated ANN index", added=added, count=len(vec_ids))
+    index.save(path)
+
+    index_map = {v: idx for idx, v in enumerate(vec_ids)}
+    q_ids = []
+    q_rows = []
+    for lid in new_ids:
+        idx = index_map.get(lid)
+        if idx is not None:
+            q_ids.append(lid)
+            q_rows.append(idx)
+        else:
+            sim_map.set(lid, [], [])
+    if not q_ids:
+        return
+    dist, neigh = index.search(q_rows, matrix, 6, nprobe)
+    _store_neighbours(sim_map, q_ids, dist, neigh, vec_ids, reciprocal)
+
+
+def _load_type_clusters() -> dict[str, str]:
+    """Return mapping of ``item:type`` to its cluster name."""
+    if not CLUSTER_FILE.exists():
+        return {}
+    data = load_json(CLUSTER_FILE)
+    if not isinstance(data, dict):
+        log.error("Bad cluster file", path=str(CLUSTER_FILE))
+        return {}
+    result: dict[str, str] = {}
+    for name, types in data.items():
+        if isinstance(name, str) and isinstance(types, list):
+            for t in types:
+                if isinstance(t, str):
+                    result[t] = name
+    return result
+
+
+def _partition_keys(lots: list[dict]) -> dict[str, str]:
+    """Return partition name for every lot id.
+
+    Lots are split by ``market:deal`` and ``sell_item`` lots further by the
+    cluster of their ``item:type`` from ``CLUSTER_FILE``, mirroring the
+    category pages of ``build_site.py``.  Lots without a deal are left out and
+    therefore always use the global search.
+    """
+    type_to_cluster = _load_type_clusters()
+    keys: dict[str, str] = {}
+    for lot in lots:
+        deal = lot.get("market:deal")
+        if isinstance(deal, list):
+            deal = deal[0] if deal else None
+        if not isinstance(deal, str) or not deal:
+            continue
+        key = deal
+        if deal == "sell_item":
+            itype = lot.get("item:type")
+            if isinstance(itype, list):
+                itype = itype[0] if itype else None
+            cname = type_to_cluster.get(itype or "")
+            if cname:
+                key = f"{deal}.{cname}"
+        keys[lot["_id"]] = key
+    return keys
+
+
+def _partition_index_file(key: str) -> str:
+    """Return ANN index file name for partition ``key``."""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return f"ann_index-{digest}.npz"
+
+
+def _calc_similar_partitioned(
+    new_ids: list[str],
+    vec_ids: list[str],
+    keys: dict[str, str],
+    search,
+    min_size: int = PARTITION_MIN,
+) -> None:
+    """Run ``search`` separately inside every partition of ``keys``.
+
+    ``search(new_ids, vec_ids, key, reciprocal)`` is one of the
+    ``_calc_similar_*`` helpers bound to the shared cache; ``key`` is ``None``
+    for the global corpus.  Lots of partitions with fewer than ``min_size``
+    vectors, and lots without a partition, query the whole corpus so they
+    still get six neighbours.  ``reciprocal`` then lists only those fallback
+    lots, so a global query never enters the lists of a searched partition.
+    """
+    part_vecs: dict[str, list[str]] = {}
+    for lid in vec_ids:
+        key = keys.get(lid)
+        if key is not None:
+            part_vecs.setdefault(key, []).append(lid)
+    fallback = {
+        lid
+        for lid in vec_ids
+        if keys.get(lid) is None or len(part_vecs[keys[lid]]) < min_size
+    }
+    part_new: dict[str | None, list[str]] = {}
+    for lid in new_ids:
+        key = keys.get(lid)
+        if key is None or len(part_vecs.get(key, ())) < min_size:
+            key = None
+        part_new.setdefault(key, []).append(lid)
+    for key, q_ids in sorted(part_new.items(), key=lambda kv: kv[0] or ""):
+        if key is None:
+            log.info("Searching global corpus", queries=len(q_ids))
+            search(q_ids, vec_ids, None, fallback)
+        else:
+            log.info("Searching partition", key=key, queries=len(q_ids), size=len(part_vecs[key]))
+            search(q_ids, part_vecs[key], key, None)
+
+
 def _sync_embeddings(
     lots: list[dict],
     embeddings: dict[str, list[float]],
@@ -291,40 +688,93 @@ def _sync_embeddings(
 
 
 def _similar_by_user(
-    lots: list[dict], id_to_vec: dict[str, list[float]]
+    lots: list[dict],
+    id_to_vec: dict[str, list[float]],
+    memory_mb: float = KNN_MEMORY_MB,
 ) -> dict[str, list[dict]]:
     """Return map of lot id to other lots from the same user.
 
     ``get_seller`` unifies multiple contact fields so the best option is
-    used consistently when grouping lots."""
-    user_map: dict[str, list[dict]] = {}
+    used consistently when grouping lots.  All lots with a vector are
+    normalised into one matrix and :func:`knn_utils.grouped_topk_cosine`
+    ranks every seller group in a single pass instead of one search per
+    seller."""
+    more_user_map: dict[str, list[dict]] = {}
+    ids: list[str] = []
+    vecs = []
+    labels: list[int] = []
+    seller_codes: dict[str, int] = {}
     for lot in lots:
+        lid = lot["_id"]
+        more_user_map[lid] = []
         user = get_seller(lot)
-        if user is not None:
-            user_map.setdefault(str(user), []).append(lot)
-
-    more_user_map: dict[str, list[dict]] = {}
-    for user, user_lots in user_map.items():
-        ids = [lot["_id"] for lot in user_lots]
         # Avoid boolean evaluation of ``numpy.ndarray`` by checking for ``None``
         # explicitly; otherwise a ``ValueError`` is raised when numpy attempts
         # to determine truthiness.
-        matrix = [id_to_vec[i] for i in ids if id_to_vec.get(i) is not None]
-        if len(matrix) < 2:
-            for lid in ids:
-                more_user_map[lid] = []
+        vec = id_to_vec.get(lid)
+        if user is None or vec is None:
             continue
-
-        k = min(len(matrix), 21)
-        nn = NearestNeighbors(n_neighbors=k, metric="cosine")
-        nn.fit(matrix)
-        dist, neigh = nn.kneighbors(matrix, n_neighbors=k)
-
-        for i, lid in enumerate(ids[: len(matrix)]):
-            sims = []
-            for other_idx in neigh[i][1:]:
-                other_id = ids[other_idx]
-                sims.append({"id": other_id})
-            more_user_map[lid] = sims[:20]
+        ids.append(lid)
+        vecs.append(np.asarray(vec))
+        labels.append(seller_codes.setdefault(str(user), len(seller_codes)))
+    if not ids:
+        return more_user_map
+
+    matrix = normalise(np.stack(vecs))
+    _, neigh = grouped_topk_cosine(matrix, labels, 20, memory_mb)
+    for i, lid in enumerate(ids):
+        more_user_map[lid] = [{"id": ids[j]} for j in neigh[i] if j >= 0]
     return more_user_map
 
+
+def _seller_groups(
+    lots: list[dict], id_to_vec: dict[str, list[float]]
+) -> dict[str, list[str]]:
+    """Return ids of lots with a vector grouped like :func:`_similar_by_user`."""
+    groups: dict[str, list[str]] = {}
+    for lot in lots:
+        user = get_seller(lot)
+        if user is not None and id_to_vec.get(lot["_id"]) is not None:
+            groups.setdefault(str(user), []).append(lot["_id"])
+    return groups
+
+
+def _group_digest(ids: list[str], id_to_vec: dict[str, list[float]]) -> str:
+    """Return digest of a seller group over its ids and full vectors."""
+    h = hashlib.sha1()
+    for lid in sorted(ids):
+        h.update(lid.encode("utf-8"))
+        h.update(np.asarray(id_to_vec[lid], dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def _update_more_user(
+    lots: list[dict],
+    id_to_vec: dict[str, list[float]],
+    memory_mb: float = KNN_MEMORY_MB,
+) -> tuple[dict[str, list[dict]], dict[str, str]]:
+    """Return the per-seller cache and the digest of every seller group.
+
+    Sellers whose group digest matches the one saved by the previous run keep
+    their lists from the database; only the others are ranked again with
+    :func:`_similar_by_user`.  Pass the digests to :func:`_save_more_user`.
+    """
+    groups = _seller_groups(lots, id_to_vec)
+    digests = {user: _group_digest(ids, id_to_vec) for user, ids in groups.items()}
+    kept: dict[str, list[dict]] = {}
+    db_path = SIMILAR_DIR / SIMILAR_DB_FILE
+    if db_path.exists():
+        with NeighbourDB(db_path, readonly=True) as db:
+            old = db.get_state(GROUPS_STATE, {})
+            for user, digest in digests.items():
+                if old.get(user) != digest:
+                    continue
+                rows = {lid: db.get(MORE_USER, lid) for lid in groups[user]}
+                if all(row is not None for row in rows.values()):
+                    kept.update(rows)
+    todo = [lot for lot in lots if lot["_id"] not in kept]
+    more_user_map = {lot["_id"]: [] for lot in lots}
+    more_user_map.update(kept)
+    more_user_map.update(_similar_by_user(todo, id_to_vec, memory_mb))
+    log.info("Ranked seller groups", kept=len(kept), ranked=len(todo))
+    return more_user_map, digests
@@ -0,0 +1,122 @@
+"""Precompress the site tree and record its content for delta deploys.
+
+``build_site.py`` calls :func:`precompress` so every HTML, JS, CSS and JSON
+file gets ``.gz`` and, when the ``brotli`` module is installed, ``.br``
+siblings.  The web server can send these as is (``gzip_static`` /
+``brotli_static`` in nginx) instead of compressing each response.  A sibling
+carries the mtime of its source, so unchanged files are not compressed again.
+
+:func:`update_content_manifest` then maps every file under ``data/views`` to
+the SHA-256 of its contents.  ``deploy.py`` compares that map with the one
+recorded at the last deploy and ships only the difference.  Hashes are reused
+while a file's ``[mtime_ns, size]`` stamp is unchanged, so large media trees
+are not read on every build.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+from pathlib import Path
+
+try:
+    import brotli
+except ModuleNotFoundError:  # optional, only ``.gz`` siblings are written
+    brotli = None
+
+from build_cache import file_stamp
+from log_utils import get_logger
+from notes_utils import load_json, write_json
+
+log = get_logger().bind(module=__name__)
+
+COMPRESS_SUFFIXES = {".html", ".js", ".css", ".json"}
+CONTENT_MANIFEST_NAME = "views_manifest.json"
+
+
+def content_manifest_path(views_dir: Path) -> Path:
+    """Return the content manifest location for ``views_dir``.
+
+    Like the build manifest it stays outside the published tree.
+    """
+    return views_dir.parent / CONTENT_MANIFEST_NAME
+
+
+def _encoders() -> dict[str, object]:
+    """Return sibling suffix to compression function."""
+    encoders = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoders[".br"] = lambda data: brotli.compress(data, quality=11)
+    return encoders
+
+
+def precompress(root: Path) -> dict[str, int]:
+    """Write compressed siblings of text files under ``root``.
+
+    Siblings whose source vanished are removed.  Returns counts of written,
+    kept and removed files.
+    """
+    encoders = _encoders()
+    stats = {"written": 0, "kept": 0, "removed": 0}
+    if not root.exists():
+        return stats
+    for path in sorted(root.rglob("*")):
+        if not path.is_file():
+            continue
+        if path.suffix in (".gz", ".br"):
+            src = path.with_suffix("")
+            if src.suffix not in COMPRESS_SUFFIXES or not src.is_file():
+                path.unlink()
+                stats["removed"] += 1
+            continue
+        if path.suffix not in COMPRESS_SUFFIXES:
+            continue
+        st = path.stat()
+        data = None
+        for suffix, encode in encoders.items():
+            dst = path.with_name(path.name + suffix)
+            try:
+                if dst.stat().st_mtime_ns == st.st_mtime_ns:
+                    stats["kept"] += 1
+                    continue
+            except OSError:
+                pass
+            if data is None:
+                data = path.read_bytes()
+            dst.write_bytes(encode(data))
+            os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+            stats["written"] += 1
+    log.info("Precompressed site", brotli=brotli is not None, **stats)
+    return stats
+
+
+def _file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def update_content_manifest(root: Path) -> dict[str, dict]:
+    """Write and return ``{relpath: {"hash", "stamp"}}`` for files under ``root``."""
+    path = content_manifest_path(root)
+    old = load_json(path) if path.exists() else None
+    old = old if isinstance(old, dict) else {}
+    new: dict[str, dict] = {}
+    hashed = 0
+    for file in sorted(root.rglob("*")):
+        if not file.is_file():
+            continue
+        rel = file.relative_to(root).as_posix()
+        stamp = file_stamp(file)
+        prev = old.get(rel)
+        if isinstance(prev, dict) and prev.get("stamp") == stamp:
+            new[rel] = prev
+            continue
+        new[rel] = {"hash": _file_hash(file), "stamp": stamp}
+        hashed += 1
+    write_json(path, new)
+    log.info("Content manifest updated", files=len(new), hashed=hashed)
+    return new
@@ -6,8 +6,13 @@ function saveList(name, arr) {
   localStorage.setItem(name, JSON.stringify(arr));
 }
 
-function parseJSON(str) {
-  try { return JSON.parse(str); } catch (e) { return null; }
+// Vectors arrive as int8 rows; cosine similarity ignores their scale.
+function decodeVector(b64) {
+  if (!b64) return null;
+  const bin = atob(b64);
+  const out = new Array(bin.length);
+  for (let i = 0; i < bin.length; i++) out[i] = (bin.charCodeAt(i) << 24) >> 24;
+  return out;
 }
 
 function cosSim(a, b) {
@@ -31,7 +36,79 @@ function bestSim(vec, arr) {
   return best;
 }
 
+// Static search index written by search_index.py.  Tokens and shard hashes
+// must match the Python side.
+const SEARCH_RESULTS = 20;
+
+function searchTokens(text) {
+  const words = text.normalize('NFKC').toLowerCase().match(/[\p{L}\p{N}]+/gu) || [];
+  return words.filter(t => t.length > 1 || /^\p{Nd}$/u.test(t));
+}
+
+// 32-bit FNV-1a over UTF-8 bytes.
+function termHash(text) {
+  let h = 0x811c9dc5;
+  for (const byte of new TextEncoder().encode(text)) h = Math.imul(h ^ byte, 0x01000193) >>> 0;
+  return h;
+}
+
+function searchIndex(metaUrl) {
+  const shards = new Map();
+  let meta = null;
+  // meta.json changes every build, shards carry their version in the URL so
+  // browsers may cache them for good.
+  function loadMeta() {
+    if (!meta) {
+      meta = fetch(metaUrl, { cache: 'no-cache' })
+        .then(r => r.ok ? r.json() : null)
+        .catch(() => null);
+    }
+    return meta;
+  }
+  function shard(kind, i, version) {
+    const url = new URL(`${kind}${i}.json?v=${version}`, metaUrl).href;
+    if (!shards.has(url)) {
+      shards.set(url, fetch(url).then(r => r.ok ? r.json() : {}).catch(() => ({})));
+    }
+    return shards.get(url);
+  }
+  // BM25 over the shards of the query terms, then only the doc shards of
+  // the best ``limit`` hits are fetched.
+  function search(query, limit) {
+    return loadMeta().then(m => {
+      if (!m) return [];
+      const stop = new Set(m.stop);
+      const terms = Array.from(new Set(searchTokens(query))).filter(t => !stop.has(t));
+      return Promise.all(terms.map(t => {
+        const i = termHash(t) % m.terms.length;
+        return shard('t', i, m.terms[i]).then(s => s[t] || []);
+      })).then(lists => {
+        const scores = new Map();
+        for (const postings of lists) {
+          const df = postings.length;
+          const idf = Math.log(1 + (m.n - df + 0.5) / (df + 0.5));
+          for (const [key, tf, len] of postings) {
+            const norm = tf + m.k1 * (1 - m.b + m.b * len / (m.avgdl || 1));
+            scores.set(key, (scores.get(key) || 0) + idf * tf * (m.k1 + 1) / norm);
+          }
+        }
+        const best = Array.from(scores)
+          .sort((a, b) => b[1] - a[1] || (a[0] < b[0] ? -1 : 1))
+          .slice(0, limit);
+        return Promise.all(best.map(([key]) => {
+          const i = termHash(key) % m.docs.length;
+          return shard('d', i, m.docs[i]).then(d => d[key]);
+        }));
+      }).then(docs => docs.filter(Boolean).map(([page, title, thumb]) => (
+        { link: `${page}_${m.lang}.html`, title, thumb }
+      )));
+    });
+  }
+  return { search, loadMeta };
+}
+
 document.addEventListener('DOMContentLoaded', () => {
+  let refreshPrices = () => {};
   document.querySelectorAll('[data-set-lang]').forEach(a => {
     a.addEventListener('click', () => {
       localStorage.setItem('lang', a.dataset.setLang);
@@ -61,9 +138,59 @@ document.addEventListener('DOMContentLoaded', () => {
       });
     };
     curSel.addEventListener('change', updateCur);
+    refreshPrices = updateCur;
     updateCur();
   }
 
+  const searchBox = document.getElementById('search-box');
+  const searchResults = document.getElementById('search-results');
+  if (searchBox && searchResults && searchBox.dataset.index) {
+    const metaUrl = new URL(searchBox.dataset.index, location.href).href;
+    const root = new URL('../../', metaUrl);
+    const index = searchIndex(metaUrl);
+    let timer = null;
+    let seq = 0;
+    function showResults(hits) {
+      searchResults.replaceChildren(...hits.map(hit => {
+        const a = document.createElement('a');
+        a.href = new URL(hit.link, root).href;
+        if (hit.thumb) {
+          const img = document.createElement('img');
+          img.src = new URL('media/' + hit.thumb, root).href;
+          img.alt = '';
+          a.append(img, document.createElement('br'));
+        }
+        a.append(hit.title);
+        return a;
+      }));
+      if (!hits.length) searchResults.textContent = searchBox.dataset.empty;
+      searchResults.hidden = false;
+    }
+    function runSearch() {
+      const query = searchBox.value.trim();
+      const current = ++seq;
+      if (!query) {
+        searchResults.hidden = true;
+        searchResults.replaceChildren();
+        return;
+      }
+      index.search(query, SEARCH_RESULTS).then(hits => {
+        if (current === seq) showResults(hits);
+      });
+    }
+    searchBox.addEventListener('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(runSearch, 200);
+    });
+    searchBox.form.addEventListener('submit', e => {
+      e.preventDefault();
+      clearTimeout(timer);
+      runSearch();
+    });
+    // Fetch the meta file on focus so the first query only waits for shards.
+    searchBox.addEventListener('focus', () => index.loadMeta(), { once: true });
+  }
+
   // Table header sorting was removed. Use the dropdown instead.
 
   const mainCarousel = document.querySelector('.carousel.main');
@@ -105,7 +232,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     likeBtn.addEventListener('click', () => {
       let likes = loadList('likes').filter(i => i.id !== window.currentLot.id);
-      likes.push({id: window.currentLot.id, vec: window.currentLot.embed});
+      likes.push({id: window.currentLot.id, vec: decodeVector(window.currentLot.embed)});
       saveList('likes', likes);
       let dislikes = loadList('dislikes').filter(i => i.id !== window.currentLot.id);
       saveList('dislikes', dislikes);
@@ -113,7 +240,7 @@ document.addEventListener('DOMContentLoaded', () => {
     });
     dislikeBtn.addEventListener('click', () => {
       let dislikes = loadList('dislikes').filter(i => i.id !== window.currentLot.id);
-      dislikes.push({id: window.currentLot.id, vec: window.currentLot.embed});
+      dislikes.push({id: window.currentLot.id, vec: decodeVector(window.currentLot.embed)});
       saveList('dislikes', dislikes);
       let likes = loadList('likes').filter(i => i.id !== window.currentLot.id);
       saveList('likes', likes);
@@ -131,7 +258,26 @@ document.addEventListener('DOMContentLoaded', () => {
   const isDataRow = row => row.querySelector('td') !== null;
 
   const price   = row => parseFloat(row.dataset.price);
-  const vector  = row => parseJSON(row.dataset.embed || 'null');
+  // Row vectors live in a binary shard fetched only when a similarity sort
+  // needs them.
+  const dim = parseInt(indexTable.dataset.dim || '0', 10);
+  let vectors = null;
+  let vectorsLoading = null;
+  function loadVectors() {
+    if (!indexTable.dataset.vectors || !dim) return Promise.resolve(null);
+    if (!vectorsLoading) {
+      vectorsLoading = fetch(indexTable.dataset.vectors)
+        .then(r => r.ok ? r.arrayBuffer() : null)
+        .then(buf => { vectors = buf ? new Int8Array(buf) : null; return vectors; })
+        .catch(() => null);
+    }
+    return vectorsLoading;
+  }
+  const vector = row => {
+    if (!vectors || row.dataset.row === undefined) return null;
+    const r = parseInt(row.dataset.row, 10);
+    return vectors.subarray(r * dim, (r + 1) * dim);
+  };
   const rawTime = cell =>
       Date.parse(cell.dataset.raw || cell.textContent.trim() || '');
 
@@ -200,12 +346,93 @@ document.addEventListener('DOMContentLoaded', () => {
     oldBody.replaceWith(fresh);
   }
 
+  // Paginated categories list every page in a small JSON index.  Further
+  // pages are fetched and their rows merged into this table when the visitor
+  // asks for more or picks a sort order that needs the whole category.
+  const pagesUrl = indexTable.dataset.pages;
+  const pageRows = new Map();
+  const pager = document.querySelector('.pager');
+  if (pagesUrl)
+    pageRows.set(parseInt(indexTable.dataset.page, 10), grabRows(indexTable.tBodies[0]).filter(isDataRow));
+  let pageUrls = null;
+  function loadIndex() {
+    if (!pageUrls) {
+      const base = new URL(pagesUrl, location.href);
+      pageUrls = fetch(base)
+        .then(r => r.json())
+        .then(idx => idx.pages.map(p => new URL(p, base).href))
+        .catch(() => []);
+    }
+    return pageUrls;
+  }
+  function fetchPage(url) {
+    return fetch(url)
+      .then(r => r.text())
+      .then(html => {
+        const table = new DOMParser().parseFromString(html, 'text/html').getElementById('index-table');
+        if (!table) return [];
+        return grabRows(table.tBodies[0]).filter(isDataRow).map(row => {
+          row.querySelectorAll('a[href]').forEach(a => {
+            a.href = new URL(a.getAttribute('href'), url).href;
+          });
+          return document.importNode(row, true);
+        });
+      })
+      .catch(() => []);
+  }
+  function loadPages(numbers) {
+    return loadIndex().then(urls => {
+      const missing = numbers.filter(n => urls[n - 1] && !pageRows.has(n));
+      return Promise.all(missing.map(n => fetchPage(urls[n - 1]).then(rows => pageRows.set(n, rows))))
+        .then(() => {
+          const body = indexTable.tBodies[0];
+          const staticRows = grabRows(body).filter(r => !isDataRow(r));
+          const ordered = Array.from(pageRows.keys()).sort((a, b) => a - b);
+          const fresh = document.createElement('tbody');
+          fresh.append(...staticRows, ...ordered.flatMap(n => pageRows.get(n)));
+          body.replaceWith(fresh);
+          refreshPrices();
+          if (pager && pageRows.size >= urls.length) pager.style.display = 'none';
+        });
+    });
+  }
+  function loadAllPages() {
+    if (!pagesUrl) return Promise.resolve();
+    return loadIndex().then(urls => loadPages(urls.map((_, i) => i + 1)));
+  }
+
+  function sortBy(mode) {
+    const hasVotes = loadList('likes').length || loadList('dislikes').length;
+    const byVector = mode === 'relevance' || mode === 'unexplored';
+    // Pages are already newest first, so only other orders need every page.
+    const needsAll = mode !== 'time_desc' && (!byVector || hasVotes);
+    const needsVectors = byVector && hasVotes && !vectors;
+    if (!needsVectors && !(needsAll && pagesUrl)) {
+      resortTable(mode);
+      return;
+    }
+    Promise.all([
+      needsVectors ? loadVectors() : null,
+      needsAll ? loadAllPages() : null,
+    ]).then(() => {
+      if (sortSelect.value === mode) resortTable(mode);
+    });
+  }
+
+  const nextLink = pager && pager.querySelector('.next');
+  if (pagesUrl && nextLink) {
+    nextLink.addEventListener('click', e => {
+      e.preventDefault();
+      loadPages([Math.max(...pageRows.keys()) + 1]).then(() => resortTable(sortSelect.value));
+    });
+  }
+
   sortSelect.addEventListener('change', () => {
     const mode = sortSelect.value;
     localStorage.setItem('sort-mode', mode);
-    resortTable(mode);
+    sortBy(mode);
   });
 
   sortSelect.value = localStorage.getItem('sort-mode') || 'relevance';
-  resortTable(sortSelect.value);
+  sortBy(sortSelect.value);
 });
@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from ann_index import IVFIndex
+from knn_utils import normalise
+from neighbour_table import NeighbourTable
+import similar_utils
+
+
+def _data(n=400, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"{i}-0" for i in range(n)], normalise(rng.normal(size=(n, dim)))
+
+
+def test_full_probe_matches_exact():
+    ids, matrix = _data()
+    index = IVFIndex.train(ids, matrix, nlist=8)
+    rows = list(range(20))
+    dist, neigh = index.search(rows, matrix, 6, nprobe=8)
+    sims = matrix[rows] @ matrix.T
+    for qi, row in enumerate(rows):
+        sims[qi, row] = -np.inf
+        exact = np.argsort(-sims[qi])[:6]
+        assert set(neigh[qi].tolist()) == set(exact.tolist())
+        assert row not in neigh[qi]
+    assert np.all(np.diff(dist, axis=1) >= -1e-6)
+
+
+def test_save_load_and_update(tmp_path):
+    ids, matrix = _data()
+    index = IVFIndex.train(ids[:300], matrix[:300])
+    path = tmp_path / "idx.npz"
+    index.save(path)
+
+    loaded = IVFIndex.load(path)
+    assert loaded.ids == ids[:300]
+    # drop one id and add the rest
+    cur_ids = ids[1:]
+    added = loaded.update(cur_ids, matrix[1:])
+    assert added == 100
+    assert loaded.ids == cur_ids
+    assert loaded.assign.min() >= 0
+    assert not loaded.needs_retrain(len(cur_ids), matrix.shape[1])
+    assert loaded.needs_retrain(len(cur_ids), 3)
+
+
+def test_calc_similar_ann_persists_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(similar_utils, "SIMILAR_DIR", tmp_path / "similar")
+    ids, matrix = _data(n=50)
+    id_to_vec = dict(zip(ids, matrix))
+    sim_map = NeighbourTable()
+    similar_utils._calc_similar_ann(sim_map, ids[:10], ids, id_to_vec, nprobe=100)
+
+    assert (tmp_path / "similar" / similar_utils.ANN_INDEX_FILE).exists()
+    for lid in ids[:10]:
+        assert len(sim_map[lid]) == 6
+        assert all(s["id"] != lid for s in sim_map[lid])
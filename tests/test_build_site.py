@@ -10,10 +10,12 @@ os.environ.setdefault("LOG_LEVEL", "INFO")
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
 import build_site
+import build_cache
 import price_utils
 import similar_utils
 import similar
 import lot_io
+import moderation
 
 
 class DummyCfg:
@@ -36,8 +38,8 @@ def patch_similar(tmp_path, monkeypatch):
 @pytest.fixture
 def build(monkeypatch):
     def run():
-        similar.main()
-        build_site.main()
+        similar.main([])
+        build_site.main([])
 
     return run
 
@@ -84,7 +86,10 @@ def test_build_site_creates_pages(tmp_path, monkeypatch, build):
     cat_html = cat_page.read_text()
     assert "hello" in cat_html
     assert "1-0_en.html" in cat_html
-    assert 'data-embed' in cat_html
+    assert 'data-row="0"' in cat_html
+    assert 'data-vectors="../vectors/deal/sell_item.bin?v=' in cat_html
+    assert (tmp_path / "views" / "vectors" / "deal" / "sell_item.bin").read_bytes() == bytes([127, 0])
+    assert 'data-vectors="vectors/index.bin?v=' in idx_html
     assert (tmp_path / "views" / "static" / "site.js").exists()
     assert (tmp_path / "views" / "static" / "style.css").exists()
 
@@ -199,7 +204,7 @@ def test_build_site_skips_moderated(tmp_path, monkeypatch, build):
         }
     ]))
 
-    monkeypatch.setattr(build_site, "should_skip_message", lambda m, t: True)
+    monkeypatch.setattr(moderation, "message_skip_reason", lambda m, t: "banned-text")
 
     build()
 
@@ -620,6 +625,39 @@ def test_category_stats_with_centroid(tmp_path):
     assert stat["centroid"] == [1.0, 0.0]
 
 
+def test_category_stats_aggregate_groups():
+    from datetime import datetime, timedelta, timezone
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    lots = []
+    for i, (itype, price) in enumerate(
+        [("phone", 10), ("phone", 30), ("laptop", 20), ("phone", None)]
+    ):
+        lot = {
+            "_id": f"{i}-0",
+            "timestamp": (now - timedelta(days=i)).isoformat(),
+            "market:deal": "sell_item",
+            "item:type": itype,
+        }
+        if price is not None:
+            lot.update({"price": price, "price:currency": "USD"})
+        lots.append(lot)
+    embeds = {"0-0": [1.0, 0.0], "1-0": [0.0, 1.0], "2-0": [1.0, 1.0], "3-0": None}
+    price_utils.prepare_price_fields(lots, {"USD": 1.0}, "USD")
+    cats, stats, _ = build_site._categorise(lots, ["en"], 7, embeds, {})
+    phone = stats["sell_item.phone"]
+    assert [i.id for i in cats["sell_item.phone"]] == ["0-0", "1-0", "3-0"]
+    assert phone["price_typical"] == 20
+    assert (phone["price_min"], phone["price_max"]) == (10, 30)
+    assert phone["last_dt"] == now
+    assert phone["centroid"] == [0.5, 0.5]
+    deal = stats["sell_item"]
+    assert deal["price_typical"] == 20
+    assert deal["centroid"] == [2 / 3, 2 / 3]
+    assert deal["recent"] == 4
+    assert stats["sell_item.laptop"]["last_dt"] == now - timedelta(days=2)
+
+
 def test_recent_user_count():
     from datetime import datetime, timedelta, timezone
 
@@ -714,3 +752,354 @@ def test_phone_sellers_allowed(monkeypatch):
     cats, stats, _ = build_site._categorise(lots, ["en"], 7, {}, {})
     assert "sell_item" in cats
     assert stats["sell_item"]["users"] == {"+12345"}
+
+
+def test_incremental_build_skips_unchanged(tmp_path, monkeypatch, build):
+    monkeypatch.setattr(build_site, "LOTS_DIR", tmp_path / "lots")
+    monkeypatch.setattr(build_site, "VIEWS_DIR", tmp_path / "views")
+    monkeypatch.setattr(build_site, "TEMPLATES", Path("templates"))
+    monkeypatch.setattr(build_site, "EMBED_DIR", tmp_path / "vecs")
+    monkeypatch.setattr(build_site, "ONTOLOGY", tmp_path / "ont.json")
+    monkeypatch.setattr(build_site, "MEDIA_DIR", tmp_path / "media")
+    monkeypatch.setattr(build_site, "load_config", lambda: DummyCfg())
+    monkeypatch.setattr(build_site, "fetch_official_rates", lambda: {"USD": 1.0})
+
+    lots_dir = tmp_path / "lots"
+    lots_dir.mkdir()
+    (tmp_path / "media").mkdir()
+    (tmp_path / "vecs").mkdir()
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+    def write_lot(name, title, vec):
+        (lots_dir / f"{name}.json").write_text(json.dumps([
+            {
+                "timestamp": now,
+                "title_en": title,
+                "description_en": "d",
+                "title_ru": title,
+                "description_ru": "d",
+                "title_ka": title,
+                "description_ka": "d",
+                "files": [],
+                "market:deal": "sell_item",
+                "contact:telegram": f"@{name}",
+            }
+        ]))
+        (tmp_path / "vecs" / f"{name}.json").write_text(
+            json.dumps([{"id": f"{name}-0", "vec": vec}])
+        )
+
+    write_lot("1", "first", [1, 0])
+    write_lot("2", "second", [0, 1])
+    write_lot("3", "third", [1, 1])
+    build()
+    views = tmp_path / "views"
+    pages = {n: views / f"{n}-0_en.html" for n in "123"}
+    for page in pages.values():
+        os.utime(page, (0, 0))
+
+    build()
+    assert all(p.stat().st_mtime == 0 for p in pages.values())
+
+    write_lot("2", "renamed", [0, 1])
+    build()
+    assert "renamed" in pages["2"].read_text()
+    # ``1`` and ``3`` list ``2`` as a neighbour and show its title
+    assert pages["1"].stat().st_mtime != 0
+
+    (lots_dir / "3.json").unlink()
+    (tmp_path / "vecs" / "3.json").unlink()
+    build()
+    assert not pages["3"].exists()
+    manifest = json.loads((tmp_path / build_cache.MANIFEST_NAME).read_text())
+    assert "3-0_en.html" not in manifest and "1-0_en.html" in manifest
+
+    os.utime(pages["1"], (0, 0))
+    build_site.main(["--full"])
+    assert pages["1"].stat().st_mtime != 0
+
+
+def test_parallel_build_matches_serial(tmp_path, monkeypatch, build):
+    monkeypatch.setattr(build_site, "LOTS_DIR", tmp_path / "lots")
+    monkeypatch.setattr(build_site, "TEMPLATES", Path("templates"))
+    monkeypatch.setattr(build_site, "EMBED_DIR", tmp_path / "vecs")
+    monkeypatch.setattr(build_site, "ONTOLOGY", tmp_path / "ont.json")
+    monkeypatch.setattr(build_site, "MEDIA_DIR", tmp_path / "media")
+    monkeypatch.setattr(build_site, "load_config", lambda: DummyCfg())
+    monkeypatch.setattr(build_site, "fetch_official_rates", lambda: {"USD": 1.0})
+
+    lots_dir = tmp_path / "lots"
+    lots_dir.mkdir()
+    (tmp_path / "media").mkdir()
+    (tmp_path / "vecs").mkdir()
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    for i in range(8):
+        title = f"lot {i}"
+        (lots_dir / f"{i}.json").write_text(json.dumps([
+            {
+                "timestamp": now,
+                "title_en": title,
+                "description_en": "d",
+                "title_ru": title,
+                "description_ru": "d",
+                "title_ka": title,
+                "description_ka": "d",
+                "files": [],
+                "market:deal": "sell_item" if i % 2 else "rent_out",
+                "contact:telegram": f"@u{i % 3}",
+            }
+        ]))
+        (tmp_path / "vecs" / f"{i}.json").write_text(
+            json.dumps([{"id": f"{i}-0", "vec": [1, i / 8]}])
+        )
+    similar.main([])
+
+    trees = {}
+    for name, argv in (("serial", []), ("parallel", ["--jobs", "3"])):
+        views = tmp_path / name / "views"
+        monkeypatch.setattr(build_site, "VIEWS_DIR", views)
+        build_site.main(argv)
+        trees[name] = {
+            p.relative_to(views): p.read_bytes() for p in views.rglob("*.html")
+        }
+    assert len(trees["serial"]) > 8
+    assert trees["serial"] == trees["parallel"]
+
+
+def test_category_pagination(tmp_path, monkeypatch, build):
+    class Cfg(DummyCfg):
+        CATEGORY_PAGE_SIZE = 2
+
+    monkeypatch.setattr(build_site, "LOTS_DIR", tmp_path / "lots")
+    monkeypatch.setattr(build_site, "VIEWS_DIR", tmp_path / "views")
+    monkeypatch.setattr(build_site, "TEMPLATES", Path("templates"))
+    monkeypatch.setattr(build_site, "EMBED_DIR", tmp_path / "vecs")
+    monkeypatch.setattr(build_site, "ONTOLOGY", tmp_path / "ont.json")
+    monkeypatch.setattr(build_site, "MEDIA_DIR", tmp_path / "media")
+    monkeypatch.setattr(build_site, "load_config", lambda: Cfg())
+
+    lots_dir = tmp_path / "lots"
+    lots_dir.mkdir()
+    (tmp_path / "media").mkdir()
+    (tmp_path / "vecs").mkdir()
+    from datetime import datetime, timedelta, timezone
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    for i in range(5):
+        (lots_dir / f"{i}.json").write_text(json.dumps([
+            {
+                "timestamp": (now - timedelta(hours=i)).isoformat(),
+                "title_en": f"lot{i}",
+                "description_en": "d",
+                "title_ru": f"lot{i}",
+                "description_ru": "d",
+                "title_ka": f"lot{i}",
+                "description_ka": "d",
+                "files": [],
+                "market:deal": "sell_item",
+                "contact:telegram": f"@u{i}",
+            }
+        ]))
+        (tmp_path / "vecs" / f"{i}.json").write_text(
+            json.dumps([{"id": f"{i}-0", "vec": [1, i]}])
+        )
+    build()
+
+    deal_dir = tmp_path / "views" / "deal"
+    index = json.loads((deal_dir / "sell_item_en.json").read_text())
+    assert index == {
+        "count": 5,
+        "page_size": 2,
+        "pages": ["sell_item_en.html", "sell_item/2_en.html", "sell_item/3_en.html"],
+    }
+    first = (deal_dir / "sell_item_en.html").read_text()
+    assert "lot0" in first and "lot1" in first and "lot2" not in first
+    assert 'data-pages="sell_item_en.json" data-page="1"' in first
+    assert 'href="sell_item/2_en.html"' in first
+    last = (deal_dir / "sell_item" / "3_en.html").read_text()
+    assert "lot4" in last and "lot3" not in last
+    # rows keep their position in the category wide vector shard
+    assert 'data-row="4"' in last
+    assert 'href="../../4-0_en.html"' in last
+    assert 'href="2_en.html"' in last
+    assert 'data-pages="../sell_item_en.json" data-page="3"' in last
+
+
+def test_card_fragments_shared(tmp_path, monkeypatch):
+    from jinja2 import Environment, FileSystemLoader
+
+    monkeypatch.setattr(build_site, "VIEWS_DIR", tmp_path / "views")
+    monkeypatch.setattr(build_site, "_FRAGMENTS", build_site._FragmentCache())
+    env = Environment(loader=FileSystemLoader("templates"))
+    other = {"title_en": "phone", "files": ["a/1.jpg"]}
+    card = build_site._card_fragment("chat/2024/5-0", other, "en", ["en"], env)
+    # later pages reuse the first rendering
+    assert build_site._card_fragment("chat/2024/5-0", {}, "en", ["en"], env) is card
+
+    top = build_site._place(card, build_site._root_prefix(tmp_path / "views"))
+    assert top == (
+        '<a href="chat/2024/5-0_en.html"><img src="media/a/1.jpg" alt="" /><br>phone</a>'
+    )
+    nested = build_site._place(
+        card, build_site._root_prefix(tmp_path / "views" / "chat" / "2024")
+    )
+    assert 'href="../../chat/2024/5-0_en.html"' in nested
+    assert 'src="../../media/a/1.jpg"' in nested
+
+    # streaming builds keep only the newest fragments
+    build_site._FRAGMENTS.limit = 1
+    build_site._card_fragment("chat/2024/6-0", other, "en", ["en"], env)
+    assert list(build_site._FRAGMENTS) == [("card", "en", "chat/2024/6-0")]
+
+
+def test_template_bytecode_and_precompiled(tmp_path, monkeypatch):
+    from jinja2 import FileSystemLoader, ModuleLoader
+
+    monkeypatch.setattr(build_site, "VIEWS_DIR", tmp_path / "views")
+    monkeypatch.setattr(build_site, "TEMPLATES", tmp_path / "tpl")
+    (tmp_path / "tpl").mkdir()
+    page = tmp_path / "tpl" / "page.html"
+    page.write_text("{{ _('Hi') }} {{ x }}")
+
+    env = build_site._env_for_lang("en")
+    assert env.get_template("page.html").render(x=1) == "Hi 1"
+    assert list((tmp_path / "jinja_cache").iterdir())
+
+    build_site.compile_templates()
+    env = build_site._env_for_lang("en")
+    assert isinstance(env.loader, ModuleLoader)
+    assert env.get_template("page.html").render(x=2) == "Hi 2"
+
+    # edited sources win over stale compiled modules
+    page.write_text("changed {{ x }}")
+    env = build_site._env_for_lang("en")
+    assert isinstance(env.loader, FileSystemLoader)
+    assert env.get_template("page.html").render(x=3) == "changed 3"
+
+
+def test_profile_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_site, "LOTS_DIR", tmp_path / "lots")
+    monkeypatch.setattr(build_site, "VIEWS_DIR", tmp_path / "views")
+    monkeypatch.setattr(build_site, "TEMPLATES", Path("templates"))
+    monkeypatch.setattr(build_site, "EMBED_DIR", tmp_path / "vecs")
+    monkeypatch.setattr(build_site, "ONTOLOGY", tmp_path / "ont.json")
+    monkeypatch.setattr(build_site, "MEDIA_DIR", tmp_path / "media")
+    monkeypatch.setattr(build_site, "load_config", lambda: DummyCfg())
+
+    lots_dir = tmp_path / "lots"
+    lots_dir.mkdir()
+    (tmp_path / "media").mkdir()
+    (tmp_path / "vecs").mkdir()
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    (lots_dir / "1.json").write_text(json.dumps([
+        {
+            "timestamp": now,
+            "title_en": "hello",
+            "description_en": "d",
+            "title_ru": "hello",
+            "description_ru": "d",
+            "title_ka": "hello",
+            "description_ka": "d",
+            "files": [],
+            "market:deal": "sell_item",
+            "contact:telegram": "@user",
+        }
+    ]))
+    (tmp_path / "vecs" / "1.json").write_text(json.dumps([{"id": "1-0", "vec": [1, 0]}]))
+    similar.main([])
+    build_site.main(["--profile", "--profile-render"])
+
+    report = json.loads((tmp_path / "build_profile.json").read_text())
+    phases = {p["phase"]: p for p in report["phases"]}
+    assert {"load_embeddings", "copy_images", "apply_price_model", "categorise"} <= set(phases)
+    assert phases["load_lots"]["items"] == 1
+    assert phases["render_lot_pages"]["items"] == 1
+    assert all(p["wall_s"] >= 0 and p["peak_rss_mb"] > 0 for p in report["phases"])
+    assert report["templates"]["lot.html"]["pages"] == 1
+    assert report["templates"]["index.html"]["pages"] == 1
+    assert (tmp_path / "build_render.prof").stat().st_size > 0
+
+
+def test_stream_build_matches_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_site, "LOTS_DIR", tmp_path / "lots")
+    monkeypatch.setattr(build_site, "VIEWS_DIR", tmp_path / "views")
+    monkeypatch.setattr(build_site, "TEMPLATES", Path("templates"))
+    monkeypatch.setattr(build_site, "EMBED_DIR", tmp_path / "vecs")
+    monkeypatch.setattr(build_site, "ONTOLOGY", tmp_path / "ont.json")
+    monkeypatch.setattr(build_site, "MEDIA_DIR", tmp_path / "media")
+    monkeypatch.setattr(build_site, "load_config", lambda: DummyCfg())
+
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    (tmp_path / "media" / "chat").mkdir(parents=True)
+    for name in ("a", "b"):
+        (tmp_path / "lots" / "chat").mkdir(parents=True, exist_ok=True)
+        (tmp_path / "vecs" / "chat").mkdir(parents=True, exist_ok=True)
+        (tmp_path / "media" / "chat" / f"{name}.jpg").write_bytes(b"img")
+        lots = []
+        for i in range(2):
+            lots.append(
+                {
+                    "timestamp": now,
+                    "title_en": f"{name}{i}",
+                    "description_en": "d",
+                    "title_ru": f"{name}{i}",
+                    "description_ru": "d",
+                    "title_ka": f"{name}{i}",
+                    "description_ka": "d",
+                    "files": [f"chat/{name}.jpg"],
+                    "market:deal": "sell_item",
+                    "item:type": "phone",
+                    "contact:telegram": f"@{name}",
+                }
+            )
+        (tmp_path / "lots" / "chat" / f"{name}.json").write_text(json.dumps(lots))
+        (tmp_path / "vecs" / "chat" / f"{name}.json").write_text(
+            json.dumps([{"id": f"chat/{name}-{i}", "vec": [1, i]} for i in range(2)])
+        )
+    similar.main([])
+    from price_utils import save_price_model
+    from sklearn.linear_model import LinearRegression
+
+    model = LinearRegression()
+    model.coef_ = [1.0, 2.0]
+    model.intercept_ = 1.0
+    save_price_model(model, {"USD": 0}, {"USD": 1}, tmp_path / "model.json")
+    monkeypatch.setattr(build_site, "MODEL_FILE", tmp_path / "model.json")
+    priced = []
+    apply_price_model = build_site.apply_price_model
+    monkeypatch.setattr(
+        build_site,
+        "apply_price_model",
+        lambda lots, *a: priced.append(len(lots)) or apply_price_model(lots, *a),
+    )
+
+    def snapshot():
+        views = tmp_path / "views"
+        return {
+            p.relative_to(views).as_posix(): p.read_bytes()
+            for p in sorted(views.rglob("*"))
+            if p.is_file()
+        }
+
+    build_site.main([])
+    full = snapshot()
+    assert json.loads(full["search/en/meta.json"])["n"] == 4
+    build_site.main(["--stream", "--profile"])
+    report = json.loads((tmp_path / "build_profile.json").read_text())
+    phases = {p["phase"]: p for p in report["phases"]}
+    # pages rendered by the full build stay fresh for the streaming one
+    assert phases["scan_lots"]["items"] == 4
+    assert phases["stream_lot_pages"]["items"] == 0
+    assert snapshot() == full
+
+    priced.clear()
+    build_site.main(["--stream", "--full"])
+    assert snapshot() == full
+    # the price model runs on every lot once, in the first pass
+    assert sum(priced) == 4
+    assert "ai-price" in (tmp_path / "views" / "chat" / "a-1_en.html").read_text()
+    lot_html = (tmp_path / "views" / "chat" / "a-0_en.html").read_text()
+    assert 'href="../chat/b-0_en.html"' in lot_html or 'href="../chat/a-1_en.html"' in lot_html
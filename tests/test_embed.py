@@ -25,6 +25,7 @@ sys.modules["config"] = dummy_cfg
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
 import embed
+import embed_io
 
 
 def test_embed_file(tmp_path, monkeypatch):
@@ -45,3 +46,6 @@ def test_embed_file(tmp_path, monkeypatch):
     assert len(data) == 2
     assert data[0]["id"] == "chat/2024/05/1-0"
     assert data[0]["vec"] == [1, 2, 3]
+
+    index, matrix = embed_io.load_store(tmp_path / "vecs")
+    assert matrix[index["chat/2024/05/1-1"]].tolist() == [1, 2, 3]
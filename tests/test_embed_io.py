@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import embed_io
+import similar_utils
+
+
+def test_append_and_load(tmp_path):
+    embed_io.append_vectors(["a-0", "a-1"], [[1, 0], [0, 1]], tmp_path)
+    embed_io.append_vectors(["a-0"], [[0.5, 0.5]], tmp_path)
+
+    index, matrix = embed_io.load_store(tmp_path)
+    assert isinstance(matrix, np.memmap)
+    assert matrix.shape == (3, 2)
+    assert matrix[index["a-0"]].tolist() == [0.5, 0.5]
+    assert matrix[index["a-1"]].tolist() == [0.0, 1.0]
+
+
+def test_append_recovers_partial_write(tmp_path):
+    embed_io.append_vectors(["a-0"], [[1, 0]], tmp_path)
+    # Simulate a crash after the vector was written but before its id
+    with open(embed_io.matrix_path(tmp_path), "ab") as fh:
+        fh.write(np.asarray([9, 9], dtype=embed_io.DTYPE).tobytes())
+    embed_io.append_vectors(["b-0"], [[0, 1]], tmp_path)
+
+    index, matrix = embed_io.load_store(tmp_path)
+    assert matrix.shape == (2, 2)
+    assert matrix[index["b-0"]].tolist() == [0.0, 1.0]
+
+
+def test_migrate_from_json(tmp_path):
+    (tmp_path / "chat").mkdir()
+    (tmp_path / "chat" / "1.json").write_text(
+        json.dumps([{"id": "chat/1-0", "vec": [1, 0]}, {"id": "chat/1-1", "vec": [0, 1]}])
+    )
+    (tmp_path / "2.json").write_text(json.dumps({"id": "2-0", "vec": [0.5, 0.5]}))
+
+    assert embed_io.migrate(tmp_path) == 3
+    index, matrix = embed_io.load_store(tmp_path)
+    assert set(index) == {"chat/1-0", "chat/1-1", "2-0"}
+    assert matrix[index["2-0"]].tolist() == [0.5, 0.5]
+
+
+def test_load_embeddings_prefers_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(similar_utils, "EMBED_DIR", tmp_path)
+    (tmp_path / "1.json").write_text(json.dumps([{"id": "1-0", "vec": [1, 0]}]))
+    embed_io.migrate(tmp_path)
+    # JSON written after the store is picked up through the fallback
+    newer = tmp_path / "2.json"
+    newer.write_text(json.dumps([{"id": "2-0", "vec": [0, 1]}]))
+    stamp = embed_io.ids_path(tmp_path).stat().st_mtime + 5
+    os.utime(newer, (stamp, stamp))
+
+    data = similar_utils._load_embeddings()
+    assert data["1-0"].tolist() == [1.0, 0.0]
+    assert data["2-0"].tolist() == [0.0, 1.0]
+
+
+def test_imported_files_skipped_by_name(tmp_path, monkeypatch):
+    monkeypatch.setattr(similar_utils, "EMBED_DIR", tmp_path)
+    (tmp_path / "1.json").write_text(json.dumps([{"id": "1-0", "vec": [1, 0]}]))
+    embed_io.migrate(tmp_path)
+    assert embed_io.imported_files(tmp_path) == {"1.json"}
+    # an imported file is not read again even when touched later
+    (tmp_path / "1.json").write_text(json.dumps([{"id": "1-0", "vec": [9, 9]}]))
+    (tmp_path / "2.json").write_text(json.dumps([{"id": "2-0", "vec": [0, 1]}]))
+    embed_io.append_vectors(["3-0"], [[1, 1]], tmp_path, "3.json")
+    (tmp_path / "3.json").write_text(json.dumps([{"id": "3-0", "vec": [1, 1]}]))
+    assert embed_io.imported_files(tmp_path) == {"1.json", "3.json"}
+
+    data = similar_utils._load_embeddings()
+    assert data["1-0"].tolist() == [1.0, 0.0]
+    assert data["2-0"].tolist() == [0.0, 1.0]
+    assert data["3-0"].tolist() == [1.0, 1.0]
+
+
+def test_append_drops_rows_of_rechopped_file(tmp_path):
+    embed_io.append_vectors(["chat/1-0", "chat/1-1"], [[1, 0], [0, 1]], tmp_path, "chat/1.json")
+    embed_io.append_vectors(["chat/10-0"], [[1, 1]], tmp_path, "chat/10.json")
+    # the file is chopped into a single lot the second time
+    embed_io.append_vectors(["chat/1-0"], [[0.5, 0.5]], tmp_path, "chat/1.json")
+
+    index, matrix = embed_io.load_store(tmp_path)
+    assert matrix.shape == (4, 2)
+    assert set(index) == {"chat/1-0", "chat/10-0"}
+    assert matrix[index["chat/1-0"]].tolist() == [0.5, 0.5]
+    assert embed_io.imported_files(tmp_path) == {"chat/1.json", "chat/10.json"}
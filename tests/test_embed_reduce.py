@@ -0,0 +1,106 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import embed_io
+import embed_reduce
+import similar_utils
+from embed_reduce import Projection
+
+
+def _data(n=200, dim=16, rank=3, seed=0):
+    rng = np.random.default_rng(seed)
+    basis = rng.normal(size=(rank, dim))
+    return (rng.normal(size=(n, rank)) @ basis + 0.01 * rng.normal(size=(n, dim))).astype(
+        np.float32
+    )
+
+
+def test_fit_keeps_main_components(tmp_path):
+    matrix = _data()
+    proj = Projection.fit(matrix, 3)
+    assert proj.dim == 3 and proj.input_dim == 16
+    assert proj.explained > 0.99
+    reduced = proj.apply(matrix)
+    assert reduced.shape == (200, 3) and reduced.dtype == np.float32
+    # Distances survive when the data lives in a low-rank subspace.
+    full = np.linalg.norm(matrix[0] - matrix[1])
+    assert abs(np.linalg.norm(reduced[0] - reduced[1]) - full) < 0.1
+
+    path = tmp_path / "projection.npz"
+    proj.save(path)
+    loaded = Projection.load(path)
+    np.testing.assert_allclose(loaded.apply(matrix), reduced)
+
+
+def test_load_embeddings_applies_projection(tmp_path, monkeypatch):
+    monkeypatch.setattr(similar_utils, "EMBED_DIR", tmp_path)
+    monkeypatch.setattr(embed_reduce, "EMBED_DIR", tmp_path)
+    matrix = _data(n=50)
+    ids = [f"{i}-0" for i in range(50)]
+    embed_io.append_vectors(ids, matrix, tmp_path)
+
+    assert len(similar_utils._load_embeddings()["0-0"]) == 16
+    embed_reduce.main(["--dim", "4", "--sample", "20"])
+    assert (tmp_path / embed_reduce.PROJECTION_NAME).exists()
+    data = similar_utils._load_embeddings()
+    assert len(data) == 50 and len(data["0-0"]) == 4
+    assert len(similar_utils._load_embeddings(project=False)["0-0"]) == 16
+
+    embed_reduce.main(["--dim", "0"])
+    assert len(similar_utils._load_embeddings()["0-0"]) == 16
+
+
+def test_cluster_items_reads_projected_store(tmp_path, monkeypatch):
+    import json
+
+    import cluster_items
+
+    monkeypatch.setattr(similar_utils, "EMBED_DIR", tmp_path / "vecs")
+    monkeypatch.setattr(cluster_items, "LOTS_DIR", tmp_path / "lots")
+    (tmp_path / "lots").mkdir()
+    lot = {"market:deal": "sell_item", "item:type": "phone"}
+    (tmp_path / "lots" / "1.json").write_text(json.dumps([lot, lot]))
+    embed_io.append_vectors(["1-0", "1-1"], _data(n=2), tmp_path / "vecs", "1.json")
+    Projection(np.zeros(16), np.eye(4, 16)).save(embed_reduce.projection_path(tmp_path / "vecs"))
+
+    items = list(cluster_items._iter_items(similar_utils._load_embeddings()))
+    assert [(lid, itype, len(vec)) for lid, itype, vec in items] == [
+        ("1-0", "phone", 4),
+        ("1-1", "phone", 4),
+    ]
+
+
+def test_projection_change_invalidates_caches(tmp_path, monkeypatch):
+    from neighbour_table import NeighbourTable
+    from price_utils import load_price_model, save_price_model, train_price_regression
+
+    emb = tmp_path / "embeddings"
+    monkeypatch.setattr(similar_utils, "EMBED_DIR", emb)
+    monkeypatch.setattr(similar_utils, "SIMILAR_DIR", tmp_path / "similar")
+    table = NeighbourTable.from_dict({"1-0": [{"id": "2-0", "dist": 0.1}]})
+    similar_utils._save_similar(table)
+    assert "1-0" in similar_utils._load_similar()
+    assert not similar_utils._projection_changed()
+
+    lots = [
+        {"_id": "a", "price": 100, "price:currency": "USD"},
+        {"_id": "b", "price": 200, "price:currency": "USD"},
+    ]
+    model, cur_map, counts = train_price_regression(lots, {"a": [1.0], "b": [2.0]})
+    path = tmp_path / "price_model.json"
+    save_price_model(model, cur_map, counts, path, embed_reduce.projection_digest(emb))
+    assert load_price_model(path, embed_reduce.projection_digest(emb))[0] is not None
+
+    Projection(np.zeros(16), np.eye(4, 16)).save(embed_reduce.projection_path(emb))
+    digest = embed_reduce.projection_digest(emb)
+    assert digest is not None
+    assert similar_utils._projection_changed()
+    # loading has no side effects, the caller decides what to drop
+    (tmp_path / "similar" / "ann_index.npz").write_bytes(b"")
+    assert "1-0" in similar_utils._load_similar()
+    assert (tmp_path / "similar" / "ann_index.npz").exists()
+    assert load_price_model(path, digest)[0] is None
@@ -0,0 +1,107 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from knn_utils import (
+    chunk_rows,
+    grouped_topk_cosine,
+    normalise,
+    quantise_int8,
+    rerank_cosine,
+    topk_cosine,
+    topk_cosine_int8,
+)
+
+
+def test_topk_matches_brute_force_across_chunks():
+    rng = np.random.default_rng(0)
+    corpus = normalise(rng.normal(size=(200, 16)))
+    rows = list(range(0, 200, 7))
+    # a tiny budget forces one query per chunk
+    dist, neigh = topk_cosine(corpus[rows], corpus, 6, rows, memory_mb=0)
+    sims = corpus[rows] @ corpus.T
+    for qi, row in enumerate(rows):
+        sims[qi, row] = -np.inf
+        expected = np.argsort(-sims[qi], kind="stable")[:6]
+        assert neigh[qi].tolist() == expected.tolist()
+        assert np.allclose(dist[qi], 1 - sims[qi, expected], atol=1e-6)
+
+
+def test_topk_pads_small_corpus():
+    corpus = normalise([[1, 0], [0.9, 0.1]])
+    dist, neigh = topk_cosine(corpus, corpus, 3, [0, 1])
+    assert neigh.tolist() == [[1, -1, -1], [0, -1, -1]]
+    assert np.isinf(dist[:, 1:]).all()
+
+
+def test_zero_vectors_and_chunk_size():
+    assert normalise([[0, 0]]).tolist() == [[0.0, 0.0]]
+    assert chunk_rows(1024, memory_mb=1) == 256
+    assert chunk_rows(10**9, memory_mb=1) == 1
+
+
+def test_grouped_matches_per_group_search():
+    rng = np.random.default_rng(1)
+    corpus = normalise(rng.normal(size=(120, 8)))
+    # one large group using the fallback, several small ones and a singleton
+    labels = np.array([0] * 40 + [1] * 3 + [2] * 3 + [3] + [4] * 21 + [5] * 52)
+    rng.shuffle(labels)
+    dist, neigh = grouped_topk_cosine(corpus, labels, 20, memory_mb=0)
+    for label in np.unique(labels):
+        rows = np.flatnonzero(labels == label)
+        k = min(20, len(rows) - 1)
+        sub = corpus[rows]
+        d, nb = topk_cosine(sub, sub, 20, np.arange(len(rows)))
+        assert neigh[rows, :k].tolist() == rows[nb[:, :k]].tolist()
+        assert np.allclose(dist[rows, :k], d[:, :k], atol=1e-6)
+        assert (neigh[rows, k:] == -1).all()
+
+
+def test_int8_search_with_rerank_matches_exact():
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(300, 32)).astype(np.float32)
+    corpus = normalise(vectors)
+    rows = np.arange(0, 300, 7)
+    exact_d, exact_n = topk_cosine(corpus[rows], corpus, 6, rows)
+
+    codes, scales = quantise_int8(list(vectors), memory_mb=0.01)
+    assert codes.dtype == np.int8 and codes.shape == (300, 32)
+    approx = codes.astype(np.float32) * scales[:, None]
+    assert np.abs(approx - corpus).max() <= scales.max() / 2 + 1e-6
+
+    _, cand = topk_cosine_int8(corpus[rows], codes, scales, 24, rows, memory_mb=0.01)
+    assert not (cand == rows[:, None]).any()
+    dist, neigh = rerank_cosine(corpus[rows], cand, vectors, 6, memory_mb=0.01)
+    np.testing.assert_array_equal(neigh, exact_n)
+    np.testing.assert_allclose(dist, exact_d, atol=1e-5)
+
+
+def test_int8_search_pads_small_corpus():
+    vectors = np.eye(3, dtype=np.float32)
+    codes, scales = quantise_int8(vectors)
+    dist, neigh = topk_cosine_int8(vectors, codes, scales, 4, [0, 1, 2])
+    assert (neigh[:, 2:] == -1).all() and np.isinf(dist[:, 2:]).all()
+    dist, neigh = rerank_cosine(vectors, neigh, vectors, 3)
+    assert set(neigh[0, :2]) == {1, 2} and neigh[0, 2] == -1
+
+
+def test_int8_search_stays_within_memory_budget():
+    import tracemalloc
+
+    rng = np.random.default_rng(4)
+    vectors = rng.normal(size=(20000, 32)).astype(np.float32)
+    codes, scales = quantise_int8(vectors)
+    queries = normalise(vectors[:200])
+    tracemalloc.start()
+    try:
+        _, neigh = topk_cosine_int8(queries, codes, scales, 5, memory_mb=1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 1.5 * 1024 * 1024
+    approx = codes.astype(np.float32) * scales[:, None]
+    exact = np.argsort(-(queries @ approx.T), axis=1)[:, :5]
+    np.testing.assert_array_equal(np.sort(neigh, axis=1), np.sort(exact, axis=1))
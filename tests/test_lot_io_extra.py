@@ -1,4 +1,5 @@
 import sys
+import json
 import os
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -14,7 +15,11 @@ from lot_io import (
     iter_lot_files,
     get_lot,
     write_lots,
+    LotStore,
+    posts_snapshot_path,
+    snapshot_path,
 )
+import lot_io
 
 
 def test_get_seller_priority():
@@ -89,3 +94,82 @@ def test_get_lot(tmp_path):
     lot_id = make_lot_id(Path("a"), 0)
     loaded = get_lot(lot_id, lot_root)
     assert loaded == lot
+
+
+def test_lot_store_snapshot(tmp_path, monkeypatch):
+    lots_dir = tmp_path / "lots"
+    raw_dir = tmp_path / "raw"
+    (lots_dir / "sub").mkdir(parents=True)
+    raw_dir.mkdir()
+    (raw_dir / "1.md").write_text("id: 1\nsender_username: seller\n\nhello", encoding="utf-8")
+    (raw_dir / "2.md").write_text("id: 2\n\n", encoding="utf-8")
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    lot = {
+        "timestamp": now,
+        "contact:phone": "1",
+        "title_en": "t",
+        "description_en": "d",
+        "title_ru": "t",
+        "description_ru": "d",
+        "title_ka": "t",
+        "description_ka": "d",
+    }
+    write_lots(lots_dir / "sub" / "a.json", [dict(lot, **{"source:path": "1.md"})])
+    write_lots(lots_dir / "b.json", [dict(lot, **{"source:path": "2.md"}), lot])
+
+    records = LotStore(lots_dir, raw_dir).load()
+    assert [r.id for r in records] == ["b-0", "b-1", "sub/a-0"]
+    assert records[0].skip == "empty"
+    assert records[1].skip is None and records[1].meta is None
+    assert records[2].text == "hello" and records[2].seller == "1"
+    assert snapshot_path(lots_dir).exists()
+
+    # a warm store reuses the snapshot and only re-reads changed files
+    reads = []
+    read_lots = lot_io.read_lots
+    monkeypatch.setattr(lot_io, "read_lots", lambda p: reads.append(p) or read_lots(p))
+    assert [l["_id"] for l in LotStore(lots_dir, raw_dir).lots()] == ["b-1", "sub/a-0"]
+    assert reads == []
+    written = []
+    replace_json = lot_io._replace_json
+    monkeypatch.setattr(lot_io, "_replace_json", lambda p, d: written.append(p) or replace_json(p, d))
+    write_lots(lots_dir / "b.json", [lot])
+    os.utime(lots_dir / "b.json", ns=(1, 1))
+    assert [r.id for r in LotStore(lots_dir, raw_dir).load()] == ["b-0", "sub/a-0"]
+    assert reads == [lots_dir / "b.json"]
+    # only the shard holding the changed file is rewritten
+    assert written == [lot_io._shard_path(snapshot_path(lots_dir), lot_io._shard("b"))]
+
+
+def test_lot_store_without_posts(tmp_path, monkeypatch):
+    lots_dir = tmp_path / "lots"
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    (raw_dir / "1.md").write_text("id: 1\n\nhello", encoding="utf-8")
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    lot = {"timestamp": now, "contact:phone": "1", "source:path": "1.md"}
+    lot.update({f"{f}_{l}": "t" for f in ("title", "description") for l in ("en", "ru", "ka")})
+    write_lots(lots_dir / "a.json", [lot])
+
+    records = LotStore(lots_dir, raw_dir).load(posts=False)
+    assert records[0].meta is None and records[0].text == ""
+    assert not posts_snapshot_path(lots_dir).exists()
+
+    assert LotStore(lots_dir, raw_dir).load()[0].text == "hello"
+    lot_shard = lot_io._shard_path(snapshot_path(lots_dir), lot_io._shard("a"))
+    post_shard = lot_io._shard_path(posts_snapshot_path(lots_dir), lot_io._shard("1.md"))
+    assert "text" not in json.loads(lot_shard.read_text())["entries"]["a"]
+    assert "1.md" in json.loads(post_shard.read_text())["entries"]
+    assert not list(tmp_path.glob("lots_*/*.json.*"))
+
+    # stages needing only lots never open the post snapshot
+    post_shard.write_text("broken")
+    assert LotStore(lots_dir, raw_dir).lots(moderated=False)[0]["_id"] == "a-0"
+    assert post_shard.read_text() == "broken"
+
+    # posts no lot refers to any more are dropped with their shard
+    (raw_dir / "2.md").write_text("id: 2\n\nbye", encoding="utf-8")
+    write_lots(lots_dir / "a.json", [dict(lot, **{"source:path": "2.md"})])
+    os.utime(lots_dir / "a.json", ns=(1, 1))
+    assert LotStore(lots_dir, raw_dir).load()[0].text == "bye"
+    assert not post_shard.exists()
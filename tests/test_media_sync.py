@@ -0,0 +1,46 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import media_sync
+from media_sync import sync_media
+
+
+def test_sync_links_and_removes(tmp_path):
+    src = tmp_path / "media"
+    dst = tmp_path / "views" / "media"
+    (src / "a").mkdir(parents=True)
+    (src / "a" / "1.jpg").write_bytes(b"one")
+    (src / "a" / "2.jpg").write_bytes(b"two")
+    (dst / "old").mkdir(parents=True)
+    (dst / "old" / "gone.jpg").write_bytes(b"x")
+
+    stats = sync_media(src, dst, ["a/1.jpg", "a/2.jpg", "a/missing.jpg"])
+    assert stats["link"] == 2 and stats["removed"] == 1
+    assert os.path.samefile(src / "a" / "1.jpg", dst / "a" / "1.jpg")
+    assert not (dst / "old").exists()
+
+    stats = sync_media(src, dst, ["a/1.jpg"])
+    assert stats["kept"] == 1 and stats["removed"] == 1
+    assert sorted(p.name for p in dst.rglob("*.jpg")) == ["1.jpg"]
+
+
+def test_copy_fallback_and_refresh(tmp_path, monkeypatch):
+    src = tmp_path / "media"
+    dst = tmp_path / "views"
+    src.mkdir()
+    (src / "1.jpg").write_bytes(b"one")
+
+    def no_link(a, b):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr(media_sync.os, "link", no_link)
+    monkeypatch.setattr(media_sync, "_reflink", lambda a, b: False)
+    assert sync_media(src, dst, ["1.jpg"])["copy"] == 1
+    assert sync_media(src, dst, ["1.jpg"])["kept"] == 1
+
+    (src / "1.jpg").write_bytes(b"changed")
+    assert sync_media(src, dst, ["1.jpg"])["copy"] == 1
+    assert (dst / "1.jpg").read_bytes() == b"changed"
@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from neighbour_table import NeighbourTable
+
+
+def test_set_and_get_sorted():
+    table = NeighbourTable(k=3)
+    table.set("a", ["b", "c", "d", "e"], [0.4, 0.1, 0.3, 0.2])
+    assert [s["id"] for s in table["a"]] == ["c", "e", "d"]
+    assert "a" in table
+    # referenced ids get rows but are not computed yet
+    assert "b" not in table
+    assert table.get("b", []) == []
+    assert list(table) == ["a"]
+
+
+def test_offer_keeps_best_k():
+    table = NeighbourTable(k=3)
+    table.set("a", ["b"], [0.5])
+    table.offer("a", "c", 0.2)
+    table.offer("a", "d", 0.9)
+    table.offer("a", "e", 0.1)
+    assert [s["id"] for s in table["a"]] == ["e", "c", "b"]
+    # worse than the current worst is rejected
+    table.offer("a", "f", 0.6)
+    assert "f" not in [s["id"] for s in table["a"]]
+    # an existing entry is updated in place
+    table.offer("a", "b", 0.05)
+    assert [s["id"] for s in table["a"]] == ["b", "e", "c"]
+    assert table.dist.dtype == np.float32
+    assert table.neigh.dtype == np.int32
+
+
+def test_prune_and_roundtrip(tmp_path):
+    table = NeighbourTable(k=2)
+    table.set("a", ["b", "c"], [0.1, 0.2])
+    table.set("b", ["a", "c"], [0.1, 0.3])
+    table.set("c", ["a", "b"], [0.2, 0.3])
+    table.prune({"a", "c"})
+    assert set(table) == {"a", "c"}
+    assert table["a"] == [{"id": "c", "dist": np.float32(0.2).item()}]
+
+    path = tmp_path / "t.npz"
+    table.save(path)
+    loaded = NeighbourTable.load(path, k=2)
+    assert dict(loaded.items()) == dict(table.items())
+    loaded.set("d", ["a"], [0.5])
+    assert loaded["d"][0]["id"] == "a"
@@ -0,0 +1,85 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import search_index
+from build_cache import BuildManifest
+from search_index import SearchIndex, doc_key, term_hash, tokenize
+
+
+def _lot(lot_id, title, description="", **attrs):
+    return {
+        "_id": lot_id,
+        "title_en": title,
+        "description_en": description,
+        "files": [f"{lot_id}.jpg"],
+        **attrs,
+    }
+
+
+def _lookup(out, meta, term):
+    shard = json.loads((out / f"t{term_hash(term) % len(meta['terms'])}.json").read_text())
+    return shard.get(term, [])
+
+
+def test_tokenize_and_hash():
+    assert tokenize("iPhone 12, a 5 x_y Продаю!") == ["iphone", "12", "5", "продаю"]
+    # FNV-1a reference values
+    assert term_hash("") == 0x811C9DC5
+    assert term_hash("a") == 0xE40C292C
+
+
+def test_index_shards_and_incremental(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "TERM_SHARD_POSTINGS", 2)
+    views = tmp_path / "views"
+    lots = [
+        _lot("c/1-0", "Red bike", "city bike", brand="Trek"),
+        _lot("c/1-1", "Blue phone", "bike rack included"),
+        _lot("c/2-0", "Sofa", "", **{"item:type": ["furniture"]}),
+    ]
+
+    def build():
+        manifest = BuildManifest(views)
+        index = SearchIndex(["en"])
+        for lot in lots:
+            index.add(lot, lot["_id"])
+        stats = index.write(views, manifest)
+        manifest.save()
+        return stats
+
+    stats = build()
+    out = views / "search" / "en"
+    meta = json.loads((out / "meta.json").read_text())
+    assert meta["n"] == 3 and len(meta["terms"]) > 1
+    assert stats["written"] == stats["shards"] + 1
+
+    bike = dict((key, tf) for key, tf, _ in _lookup(out, meta, "bike"))
+    # title matches weigh more than description ones
+    assert bike == {doc_key("c/1-0"): 4, doc_key("c/1-1"): 1}
+    assert _lookup(out, meta, "trek")[0][0] == doc_key("c/1-0")
+    assert _lookup(out, meta, "furniture")[0][0] == doc_key("c/2-0")
+
+    key = doc_key("c/2-0")
+    docs = json.loads((out / f"d{term_hash(key) % len(meta['docs'])}.json").read_text())
+    assert docs[key] == ["c/2-0", "Sofa", "c/2-0.jpg"]
+
+    assert build()["written"] == 0
+    lots[2]["description_en"] = "leather"
+    stats = build()
+    assert 0 < stats["written"] < stats["shards"]
+    meta = json.loads((out / "meta.json").read_text())
+    assert _lookup(out, meta, "leather")[0][0] == key
+
+
+def test_common_terms_are_stopped(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "STOP_MIN_DOCS", 2)
+    index = SearchIndex(["en"])
+    index.add(_lot("1-0", "the bike"), "1-0")
+    index.add(_lot("1-1", "the sofa"), "1-1")
+    index.add(_lot("1-2", "lamp"), "1-2")
+    index.write(tmp_path)
+    meta = json.loads((tmp_path / "search" / "en" / "meta.json").read_text())
+    assert meta["stop"] == ["the"]
+    assert _lookup(tmp_path / "search" / "en", meta, "the") == []
@@ -1,8 +1,10 @@
+import base64
 import json
 import sys
 from pathlib import Path
 import os
 import re
+import numpy as np
 import pytest
 
 os.environ.setdefault("LOG_LEVEL", "INFO")
@@ -35,8 +37,8 @@ def patch_similar(tmp_path, monkeypatch):
 @pytest.fixture
 def build(monkeypatch):
     def run():
-        similar.main()
-        build_site.main()
+        similar.main([])
+        build_site.main([])
 
     return run
 
@@ -161,7 +163,7 @@ def test_vectors_nested_paths(tmp_path, monkeypatch, build):
     assert "2-0_en.html" in html
 
 
-def test_vector_formatting(tmp_path, monkeypatch, build):
+def test_vectors_written_to_shards(tmp_path, monkeypatch, build):
     monkeypatch.setattr(build_site, "LOTS_DIR", tmp_path / "lots")
     monkeypatch.setattr(build_site, "VIEWS_DIR", tmp_path / "views")
     monkeypatch.setattr(build_site, "TEMPLATES", Path("templates"))
@@ -199,13 +201,17 @@ def test_vector_formatting(tmp_path, monkeypatch, build):
     build()
 
     cat_html = (tmp_path / "views" / "deal" / "sell_item_en.html").read_text()
-    m = re.search(r"data-embed=\"([^\"]+)\"", cat_html)
+    assert "data-embed" not in cat_html
+    m = re.search(r'data-vectors="([^"?]+)\?v=[0-9a-f]+" data-dim="2"', cat_html)
     assert m
-    raw = m.group(1)
-    assert " " not in raw
-    parts = raw.strip("[]").split(",")
-    assert all(len(p) <= 7 for p in parts)
-    assert raw == similar_utils._format_vector(vec)
+    shard = (tmp_path / "views" / "deal" / m.group(1)).resolve()
+    codes = np.frombuffer(shard.read_bytes(), dtype=np.int8)
+    assert codes.tolist() == [16, -127]
+
+    lot_html = (tmp_path / "views" / "1-0_en.html").read_text()
+    m = re.search(r'embed: "([^"]+)"', lot_html)
+    assert m
+    assert base64.b64decode(m.group(1)) == codes.tobytes()
 
 
 def test_similar_cache_updates(tmp_path, monkeypatch, build):
@@ -275,9 +281,7 @@ def test_similar_cache_updates(tmp_path, monkeypatch, build):
 
     build()
 
-    sim_file = similar_utils.SIMILAR_DIR / "1.json"
-    data = json.loads(sim_file.read_text())
-    cache = {item["id"]: item["similar"] for item in data}
+    cache = similar_utils._load_similar()
     assert any(s["id"] == "3-0" for s in cache["1-0"])
     assert all("dist" in s for s in cache["1-0"])
 
@@ -337,9 +341,7 @@ def test_similar_cache_invalidates_removed(tmp_path, monkeypatch, build):
 
     build()
 
-    sim_file = similar_utils.SIMILAR_DIR / "1.json"
-    data = json.loads(sim_file.read_text())
-    cache = {item["id"]: item["similar"] for item in data}
+    cache = similar_utils._load_similar()
     assert all(s["id"] != "2-0" for s in cache["1-0"])
 
 
@@ -411,17 +413,6 @@ def test_similar_titles_use_language(tmp_path, monkeypatch, build):
 
 def test_similar_by_user_uses_phone(monkeypatch):
     """Lots sharing a phone are grouped even without telegram handles."""
-    class DummyNN:
-        def __init__(self, n_neighbors=None, metric=None):
-            pass
-        def fit(self, matrix):
-            self.matrix = matrix
-        def kneighbors(self, matrix, n_neighbors=None):
-            # two items so each references the other
-            return [[0.0, 0.0], [0.0, 0.0]], [[0, 1], [1, 0]]
-
-    monkeypatch.setattr(similar_utils, "NearestNeighbors", DummyNN)
-
     lots = [
         {
             "_id": "1",
@@ -450,3 +441,169 @@ def test_similar_by_user_uses_phone(monkeypatch):
     res = similar_utils._similar_by_user(lots, {"1": [1.0], "2": [0.9]})
     assert res["1"][0]["id"] == "2"
     assert res["2"][0]["id"] == "1"
+
+
+def test_save_skips_unchanged_files(tmp_path):
+    """Cache files and the table are rewritten only when neighbour lists change."""
+    table = similar_utils.NeighbourTable()
+    table.set("1-0", ["2-0"], [0.1])
+    table.set("2-0", ["1-0"], [0.1])
+    assert similar_utils._save_similar(table) == (2, 0)
+    path = tmp_path / "similar" / similar_utils.SIMILAR_TABLE_FILE
+    json_path = tmp_path / "similar" / "2.json"
+    os.utime(path, (0, 0))
+    os.utime(json_path, (0, 0))
+
+    assert similar_utils._save_similar(table) == (0, 2)
+    assert path.stat().st_mtime == 0 and json_path.stat().st_mtime == 0
+
+    table.set("2-0", ["1-0"], [0.2])
+    assert similar_utils._save_similar(table) == (1, 1)
+    assert path.stat().st_mtime > 0
+    assert json.loads(json_path.read_text())[0]["similar"][0]["dist"] == pytest.approx(0.2)
+    loaded = similar_utils._load_similar()
+    assert loaded.generation == table.generation
+    assert loaded["2-0"][0]["dist"] == pytest.approx(0.2)
+
+    json_path.unlink()
+    assert similar_utils._save_more_user({"1-0": [{"id": "2-0"}]}) == (1, 0)
+    assert similar_utils._save_similar(table) == (1, 1)
+
+    # a table older than the database is ignored
+    table.save(path, table.generation - 1)
+    assert similar_utils._load_similar().generation == -1
+
+
+def test_more_user_ranks_changed_sellers_only(monkeypatch):
+    lots = [
+        {"_id": "1-0", "contact:telegram": "@a"},
+        {"_id": "1-1", "contact:telegram": "@a"},
+        {"_id": "2-0", "contact:telegram": "@b"},
+        {"_id": "2-1", "contact:telegram": "@b"},
+    ]
+    vecs = {lot["_id"]: [1.0, float(i)] for i, lot in enumerate(lots)}
+    more, groups = similar_utils._update_more_user(lots, vecs)
+    assert more["1-0"] == [{"id": "1-1"}]
+    similar_utils._save_more_user(more, groups)
+
+    ranked = []
+    real = similar_utils._similar_by_user
+
+    def spy(todo, *args):
+        ranked.extend(lot["_id"] for lot in todo)
+        return real(todo, *args)
+
+    monkeypatch.setattr(similar_utils, "_similar_by_user", spy)
+    vecs["2-1"] = [0.0, 1.0]
+    lots.append({"_id": "3-0"})
+    again, _ = similar_utils._update_more_user(lots, vecs)
+    assert sorted(ranked) == ["2-0", "2-1", "3-0"]
+    assert again == {**more, "3-0": []}
+
+    # a change past the leading components still changes the group digest
+    wide = {"1-0": [0.0] * 8 + [0.5]}
+    digest = similar_utils._group_digest(["1-0"], wide)
+    wide["1-0"][-1] = 0.25
+    assert similar_utils._group_digest(["1-0"], wide) != digest
+
+
+def test_neighbour_caches_use_database(tmp_path):
+    """Saved caches are served lazily from the consolidated database."""
+    table = similar_utils.NeighbourTable()
+    table.set("1-0", ["2-0"], [0.1])
+    similar_utils._save_similar(table)
+    similar_utils._save_more_user({"1-0": [{"id": "2-0"}]})
+
+    sim_map, more_map = similar_utils._open_neighbour_caches()
+    assert isinstance(sim_map, similar_utils.NeighbourView)
+    assert sim_map["1-0"][0]["id"] == "2-0"
+    assert more_map.get("1-0") == [{"id": "2-0"}]
+    assert more_map.get("2-0", []) == []
+
+    (tmp_path / "similar" / similar_utils.SIMILAR_TABLE_FILE).unlink()
+    assert similar_utils._load_similar()["1-0"][0]["id"] == "2-0"
+
+
+def test_int8_mode_matches_exact():
+    """Quantised search with re-ranking returns the exact neighbour lists."""
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    ids = [f"{i}-0" for i in range(120)]
+    id_to_vec = {lid: rng.normal(size=16).astype(np.float32) for lid in ids}
+    exact = similar_utils.NeighbourTable()
+    quant = similar_utils.NeighbourTable()
+    similar_utils._calc_similar_nn(exact, ids, ids, id_to_vec)
+    similar_utils._calc_similar_quant(quant, ids, ids, id_to_vec, memory_mb=0.01)
+    for lid in ids:
+        assert [s["id"] for s in quant[lid]] == [s["id"] for s in exact[lid]]
+
+
+def test_partitioned_search_stays_in_deal(tmp_path, monkeypatch):
+    """Lots only get neighbours of their partition unless it is too small."""
+    import numpy as np
+
+    (tmp_path / "clusters.json").write_text(json.dumps({"phones": ["phone"]}))
+    monkeypatch.setattr(similar_utils, "CLUSTER_FILE", tmp_path / "clusters.json")
+    rng = np.random.default_rng(1)
+    lots = (
+        [{"_id": f"r{i}-0", "market:deal": "rent_out"} for i in range(10)]
+        + [{"_id": f"p{i}-0", "market:deal": "sell_item", "item:type": "phone"} for i in range(10)]
+        + [{"_id": "x-0", "market:deal": "job"}, {"_id": "y-0"}]
+    )
+    ids = [lot["_id"] for lot in lots]
+    id_to_vec = {lid: rng.normal(size=8).astype(np.float32) for lid in ids}
+    keys = similar_utils._partition_keys(lots)
+    assert keys["p0-0"] == "sell_item.phones"
+    assert "y-0" not in keys
+
+    table = similar_utils.NeighbourTable()
+    seen = []
+
+    def search(q_ids, c_ids, key, reciprocal):
+        seen.append(key)
+        similar_utils._calc_similar_nn(table, q_ids, c_ids, id_to_vec, reciprocal=reciprocal)
+
+    similar_utils._calc_similar_partitioned(ids, ids, keys, search, min_size=5)
+    assert seen == [None, "rent_out", "sell_item.phones"]
+    assert all(s["id"].startswith("r") for s in table["r0-0"])
+    assert all(s["id"].startswith("p") for s in table["p3-0"])
+    assert len(table["x-0"]) == 6
+
+    # a later fallback lot right next to partitioned lots stays out of their lists
+    id_to_vec["z-0"] = id_to_vec["r0-0"] + 1e-3
+    similar_utils._calc_similar_partitioned(["z-0"], ids + ["z-0"], keys, search, min_size=5)
+    assert table["z-0"][0]["id"] == "r0-0"
+    for lid in ids[:20]:
+        assert all(s["id"][0] == lid[0] for s in table[lid])
+
+
+def test_projection_change_rebuilds_ann_indexes(tmp_path, monkeypatch):
+    import embed_reduce
+
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    (tmp_path / "lots").mkdir()
+    (tmp_path / "vecs").mkdir()
+    for i in range(3):
+        lot = {"timestamp": now, "contact:telegram": f"@u{i}", "market:deal": "sell_item"}
+        for lang in ("en", "ru", "ka"):
+            lot[f"title_{lang}"] = lot[f"description_{lang}"] = str(i)
+        (tmp_path / "lots" / f"{i}.json").write_text(json.dumps([lot]))
+        (tmp_path / "vecs" / f"{i}.json").write_text(
+            json.dumps([{"id": f"{i}-0", "vec": [1.0, float(i)]}])
+        )
+    similar.main(["--ann"])
+    index = tmp_path / "similar" / similar_utils.ANN_INDEX_FILE
+    assert index.exists() and not similar_utils._projection_changed()
+
+    monkeypatch.setattr(embed_reduce, "projection_digest", lambda root: "new")
+    assert similar_utils._projection_changed()
+    stale = tmp_path / "similar" / "ann_index-old.npz"
+    stale.write_bytes(b"")
+    os.utime(index, (0, 0))
+    similar.main(["--ann"])
+    assert not stale.exists()
+    assert index.stat().st_mtime > 0
+    assert not similar_utils._projection_changed()
+    assert len(similar_utils._load_similar()["0-0"]) == 2
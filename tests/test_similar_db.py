@@ -0,0 +1,42 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from similar_db import MORE_USER, SIMILAR, NeighbourDB
+
+
+def test_update_in_place_and_lookup(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    with NeighbourDB(path) as db:
+        sims = [{"id": "2-0", "dist": 0.25}]
+        assert db.update(SIMILAR, [("1-0", sims), ("2-0", [])]) == 2
+        # identical rows are not rewritten
+        assert db.update(SIMILAR, [("1-0", sims)]) == 0
+        assert db.update(SIMILAR, [("1-0", [{"id": "3-0", "dist": 0.5}])]) == 1
+        assert db.update(MORE_USER, [("1-0", [{"id": "2-0"}])]) == 1
+        assert db.retain(SIMILAR, {"1-0"}) == 1
+        assert db.ids(SIMILAR) == {"1-0"}
+
+    with NeighbourDB(path, readonly=True) as db:
+        view = db.view(SIMILAR)
+        assert view["1-0"] == [{"id": "3-0", "dist": 0.5}]
+        assert view.get("2-0", []) == []
+        assert "2-0" not in view
+        assert db.view(MORE_USER)["1-0"] == [{"id": "2-0"}]
+        with pytest.raises(KeyError):
+            view["9-0"]
+
+
+def test_readonly_path_is_quoted(tmp_path):
+    path = tmp_path / "odd ?dir#" / "cache.sqlite"
+    with NeighbourDB(path) as db:
+        db.update(SIMILAR, [("1-0", [])])
+    view = NeighbourDB(path, readonly=True).view(SIMILAR)
+    assert view.get("1-0") == []
+    view.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        view.get("1-0")
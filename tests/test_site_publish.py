@@ -0,0 +1,77 @@
+import gzip
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import deploy
+import site_publish
+from site_publish import precompress, update_content_manifest
+
+
+def test_precompress_and_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(site_publish, "brotli", None)
+    views = tmp_path / "views"
+    (views / "static").mkdir(parents=True)
+    (views / "a_en.html").write_text("<p>hello</p>" * 50)
+    (views / "static" / "site.js").write_text("let x = 1;")
+    (views / "photo.jpg").write_bytes(b"jpg")
+    (views / "gone.html.gz").write_bytes(b"stale")
+
+    stats = precompress(views)
+    assert stats == {"written": 2, "kept": 0, "removed": 1}
+    assert gzip.decompress((views / "a_en.html.gz").read_bytes()) == (
+        views / "a_en.html"
+    ).read_bytes()
+    assert not (views / "photo.jpg.gz").exists()
+    assert precompress(views)["kept"] == 2
+
+    first = update_content_manifest(views)
+    assert sorted(first) == [
+        "a_en.html",
+        "a_en.html.gz",
+        "photo.jpg",
+        "static/site.js",
+        "static/site.js.gz",
+    ]
+    assert json.loads((tmp_path / "views_manifest.json").read_text()) == first
+
+    (views / "a_en.html").write_text("<p>changed</p>")
+    precompress(views)
+    second = update_content_manifest(views)
+    changed, removed = deploy.diff_manifests(second, first)
+    assert changed == ["a_en.html", "a_en.html.gz"]
+    assert removed == []
+
+    (views / "photo.jpg").unlink()
+    changed, removed = deploy.diff_manifests(update_content_manifest(views), second)
+    assert changed == [] and removed == ["photo.jpg"]
+
+
+def test_deploy_sends_delta(tmp_path, monkeypatch):
+    views = tmp_path / "views"
+    views.mkdir()
+    (views / "a.html").write_text("a")
+    (views / "b.html").write_text("b")
+    monkeypatch.setattr(deploy, "VIEWS_DIR", views)
+    calls = []
+
+    def run(cmd, input=None, check=False):
+        calls.append((cmd, input))
+
+    monkeypatch.setattr(deploy.subprocess, "run", run)
+    update_content_manifest(views)
+    deploy.main(["host:/srv/"])
+    assert "--delete-before" in calls[-1][0] and calls[-1][1] is None
+
+    (views / "a.html").write_text("changed")
+    (views / "b.html").unlink()
+    update_content_manifest(views)
+    deploy.main(["host:/srv/"])
+    cmd, files = calls[-1]
+    assert "--delete-missing-args" in cmd
+    assert files == b"a.html\0b.html"
+
+    deploy.main(["host:/srv/"])
+    assert len(calls) == 2
@@ -8,7 +8,8 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 from notes_utils import write_md, read_md
 from token_utils import estimate_tokens
 from post_io import write_post, read_post
-from caption_io import write_caption, read_caption
+import caption_io
+from caption_io import write_caption, read_caption, read_captions
 from lot_io import write_lots, read_lots
 
 
@@ -41,6 +42,33 @@ def test_caption_roundtrip(tmp_path: Path):
     assert read_caption(path) == "cap\n"
 
 
+def test_caption_cache_parses_once(tmp_path: Path, monkeypatch):
+    path = tmp_path / "cap.jpg"
+    (tmp_path / "cap.caption.json").write_text('{"caption_en": "a", "caption_ru": "b"}')
+    calls = []
+    load = caption_io.load_json
+    monkeypatch.setattr(caption_io, "load_json", lambda p: calls.append(p) or load(p))
+    assert read_captions(path, ["en", "ru", "ka"]) == {"en": "a\n", "ru": "b\n", "ka": ""}
+    assert read_caption(path, "ru") == "b\n"
+    assert len(calls) == 1
+    (tmp_path / "cap.caption.json").write_text('{"caption_en": "changed"}')
+    assert read_caption(path, "en") == "changed\n"
+    assert len(calls) == 2
+
+
+def test_caption_cache_is_bounded(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(caption_io, "CACHE_SIZE", 2)
+    monkeypatch.setattr(caption_io, "_LANGS", ["en"])
+    caption_io.clear_caption_cache()
+    images = [tmp_path / f"{i}.jpg" for i in range(3)]
+    for image in images:
+        write_caption(image, image.stem)
+        read_caption(image, "en")
+    read_caption(images[1], "en")
+    read_caption(images[2], "en")
+    assert list(caption_io._CACHE) == images[1:]
+
+
 def test_lot_roundtrip(tmp_path: Path):
     path = tmp_path / "lot.json"
     now = datetime.now(timezone.utc).replace(microsecond=0).isoformat()